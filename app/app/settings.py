@@ -54,6 +54,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # must stay first, see core/middleware.py
+    'core.middleware.HealthCheckMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,11 +92,71 @@ WSGI_APPLICATION = 'app.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # Django's PostgreSQL backend plus health checks and an optional
+        # connection pool (see core/db/backends/postgresql/base.py)
+        'ENGINE': 'core.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # keep connections open between requests instead of connecting
+        # for every one; 0 closes them after each request
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        # check a kept connection still works before a request uses it
+        'CONN_HEALTH_CHECKS': True,
+        # with MAX_SIZE > 0, each uwsgi worker keeps at most this many
+        # connections, shared by its threads between requests (so
+        # CONN_MAX_AGE doesn't apply); size it with
+        # `manage.py db_pool_sizing`
+        'POOL': {
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 0)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'MAX_IDLE': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+        },
+    }
+}
+
+# Read replicas (see core/db/routers.py), as comma separated hosts. Each
+# becomes a 'replica<n>' database with the same name and credentials.
+DATABASE_REPLICAS = []
+for _index, _host in enumerate(
+    filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')),
+):
+    DATABASE_REPLICAS.append(f'replica{_index + 1}')
+    DATABASES[DATABASE_REPLICAS[-1]] = {
+        **DATABASES['default'],
+        'HOST': _host.strip(),
+        # tests read the test database through the replica aliases
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['core.db.routers.ReplicaRouter']
+# how long a client's reads stay on the primary after it writes
+DATABASE_REPLICA_PIN_SECONDS = int(
+    os.environ.get('DB_REPLICA_PIN_SECONDS', 5)
+)
+# replicas further behind than this are skipped
+DATABASE_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 2))
+DATABASE_REPLICA_LAG_CHECK_SECONDS = 5
+
+# uwsgi worker processes and threads per worker, read by scripts/run.sh
+# too; used to size the connection pool
+UWSGI_WORKERS = int(os.environ.get('UWSGI_WORKERS', 4))
+UWSGI_THREADS = int(os.environ.get('UWSGI_THREADS', 1))
+
+
+# Caches
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# local memory by default. In production point this at a cache shared by
+# all the uwsgi workers (e.g. memcached), otherwise each worker keeps and
+# invalidates its own copy.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
@@ -117,6 +180,37 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# the first hasher hashes new passwords; the others only verify old
+# hashes, which are re-hashed with the first one on the user's next login.
+# 'pbkdf2' needs no extra library, 'argon2' needs argon2-cffi. Use
+# 'python manage.py benchmark_hashers' to pick the costs.
+PASSWORD_HASHER_POLICY = os.environ.get('PASSWORD_HASHER_POLICY', 'pbkdf2')
+POLICY_PASSWORD_HASHERS = {
+    'pbkdf2': 'core.hashers.TunedPBKDF2PasswordHasher',
+    'argon2': 'core.hashers.TunedArgon2PasswordHasher',
+}
+PASSWORD_HASHERS = [POLICY_PASSWORD_HASHERS[PASSWORD_HASHER_POLICY]] + [
+    hasher for policy, hasher in POLICY_PASSWORD_HASHERS.items()
+    if policy != PASSWORD_HASHER_POLICY
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+PASSWORD_PBKDF2_ITERATIONS = int(
+    os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 260000)
+)
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 3))
+# in KiB
+PASSWORD_ARGON2_MEMORY_COST = int(
+    os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 65536)
+)
+# each uwsgi worker hashes on its own core, so extra lanes would only
+# compete with the other workers
+PASSWORD_ARGON2_PARALLELISM = int(
+    os.environ.get('PASSWORD_ARGON2_PARALLELISM', 1)
+)
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -154,3 +248,116 @@ REST_FRAMEWORK = {
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
 }
+
+# where 'manage.py build_schema' writes the schema (see core/schema.py)
+SCHEMA_ROOT = os.environ.get('SCHEMA_ROOT', str(BASE_DIR / 'schema'))
+
+# Pagination for the recipe APIs (see recipe/pagination.py)
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 100))
+# clients can ask for bigger pages with ?page_size=, up to this cap
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 1000))
+# include a total count by default; clients can opt out with ?count=0
+API_PAGINATION_COUNT = bool(int(os.environ.get('API_PAGINATION_COUNT', 1)))
+# the most IDs or names a list query parameter (e.g. ?tags_any=) can hold
+API_MAX_FILTER_IDS = int(os.environ.get('API_MAX_FILTER_IDS', 500))
+
+
+# Rows validated and inserted per transaction by the bulk recipe import,
+# and recipes loaded per query by the export
+RECIPE_BULK_CHUNK_SIZE = int(os.environ.get('RECIPE_BULK_CHUNK_SIZE', 500))
+
+# Cache for recipe, tag and ingredient list responses (see recipe/cache.py)
+RECIPE_CACHE_ALIAS = 'default'
+RECIPE_CACHE_TIMEOUT = int(os.environ.get('RECIPE_CACHE_TIMEOUT', 300))
+# whether every worker sees the same cache. Cached lists and ETags are
+# only invalidated in the cache the write went through, so they're left
+# off with a per-process backend like LocMemCache, where each worker
+# would answer from its own copy; set it to 1 when a single process
+# serves the API
+RECIPE_CACHE_SHARED = bool(int(os.environ.get(
+    'RECIPE_CACHE_SHARED',
+    CACHES[RECIPE_CACHE_ALIAS]['BACKEND'] not in (
+        'django.core.cache.backends.locmem.LocMemCache',
+        'django.core.cache.backends.dummy.DummyCache',
+    ),
+)))
+
+# Full-text recipe search (see recipe/search.py)
+# text search configuration for stemming and stop words
+RECIPE_SEARCH_CONFIG = os.environ.get('RECIPE_SEARCH_CONFIG', 'english')
+# users whose inverted index is kept in memory when not on PostgreSQL
+RECIPE_SEARCH_INDEX_CACHE_SIZE = 128
+
+# build recipe list responses from .values() rows rather than model
+# instances (see recipe/rows.py)
+RECIPE_LIST_FROM_ROWS = bool(int(os.environ.get('RECIPE_LIST_FROM_ROWS', 1)))
+
+# the largest max_missing the cookable recipes endpoint accepts
+RECIPE_COOKABLE_MAX_MISSING = 5
+
+# Store how many recipes use each tag and ingredient instead of counting
+# them on every list (see recipe/usage.py). Run
+# `manage.py recount_recipe_usage` after turning this on.
+RECIPE_USAGE_COUNTS = bool(int(os.environ.get('RECIPE_USAGE_COUNTS', 0)))
+
+# Cache of verified API tokens (see core/authentication.py)
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 1024))
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 60))
+# cache alias shared by the workers; empty keeps tokens in-process only
+AUTH_TOKEN_CACHE_ALIAS = os.environ.get('AUTH_TOKEN_CACHE_ALIAS', 'default')
+
+# Signed, stateless access tokens (see core/tokens.py)
+# comma separated 'key id:secret' pairs. Tokens signed with any listed key
+# verify, so a key can be rotated by adding a new one, making it active,
+# and removing the old one once its tokens have expired.
+SIGNED_TOKEN_KEYS = dict(
+    item.split(':', 1)
+    for item in os.environ.get('SIGNED_TOKEN_KEYS', '').split(',')
+    if item
+) or {'default': SECRET_KEY}
+SIGNED_TOKEN_ACTIVE_KEY = os.environ.get(
+    'SIGNED_TOKEN_ACTIVE_KEY',
+    next(iter(SIGNED_TOKEN_KEYS)),
+)
+SIGNED_TOKEN_ACCESS_TTL = int(os.environ.get('SIGNED_TOKEN_ACCESS_TTL', 300))
+SIGNED_TOKEN_REFRESH_TTL = int(
+    os.environ.get('SIGNED_TOKEN_REFRESH_TTL', 7 * 24 * 3600)
+)
+# how often each process reloads the token revocation list, in seconds
+SIGNED_TOKEN_REVOCATION_SYNC = int(
+    os.environ.get('SIGNED_TOKEN_REVOCATION_SYNC', 5)
+)
+
+# Readiness check (see core/health.py)
+HEALTH_CHECK_DB_TIMEOUT = float(os.environ.get('HEALTH_CHECK_DB_TIMEOUT', 1))
+HEALTH_CHECK_CACHE_SECONDS = float(
+    os.environ.get('HEALTH_CHECK_CACHE_SECONDS', 5)
+)
+
+# Recipe image processing (see recipe/images.py)
+# 'thread' processes uploads on a pool of threads in each uwsgi worker,
+# 'memory' only queues them, for tests
+RECIPE_IMAGE_BACKEND = os.environ.get('RECIPE_IMAGE_BACKEND', 'thread')
+RECIPE_IMAGE_WORKERS = int(os.environ.get('RECIPE_IMAGE_WORKERS', 2))
+# uploads wait here until processed; keep it outside the served /vol/web
+RECIPE_IMAGE_STAGING_ROOT = os.environ.get(
+    'RECIPE_IMAGE_STAGING_ROOT', '/vol/staging',
+)
+# matches client_max_body_size in the proxy
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 50_000_000
+# {size name: longest side in pixels}; run 'manage.py
+# backfill_recipe_images' after adding a size
+RECIPE_IMAGE_SIZES = {'thumbnail': 200, 'medium': 600, 'large': 1600}
+# the size Recipe.image points at
+RECIPE_IMAGE_DEFAULT_SIZE = 'large'
+# images resized on demand by the recipe image endpoint are cached here
+RECIPE_IMAGE_CACHE_ROOT = os.environ.get(
+    'RECIPE_IMAGE_CACHE_ROOT', '/vol/cache/images',
+)
+RECIPE_IMAGE_CACHE_MAX_BYTES = int(
+    os.environ.get('RECIPE_IMAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+)
+# requested widths are rounded up to a multiple of this, which bounds
+# the number of distinct cache entries per image
+RECIPE_IMAGE_RESIZE_STEP = 32
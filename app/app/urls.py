@@ -13,10 +13,6 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularSwaggerView,
-)
 from django.contrib import admin
 # include function is a helper function that allows urls from different app
 from django.urls import path, include
@@ -27,11 +23,26 @@ from core import views as core_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/schema/',SpectacularAPIView.as_view(),name='api-schema'),
-    path('api/health-check/', SpectacularAPIView.as_view(), name='api-schema'),
+    # served from the files written by 'manage.py build_schema'
+    path('api/schema/', core_views.schema, name='api-schema'),
+    path(
+        'api/schema/<str:filename>',
+        core_views.schema_file,
+        name='api-schema-file',
+    ),
+    path(
+        'api/health-check/',
+        core_views.health_check,
+        name='health-check',
+    ),
+    path(
+        'api/health-check/ready/',
+        core_views.readiness_check,
+        name='readiness-check',
+    ),
     path(
         'api/docs/',
-        SpectacularSwaggerView.as_view(url_name='api-schema'),
+        core_views.SchemaSwaggerView.as_view(),
         name='api-docs',
     ),
     path('api/user/', include('user.urls')),
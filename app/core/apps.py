@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # connect the token cache invalidation receivers, and register
+        # the custom lookups and the signed token schema extension
+        from core import authentication, lookups  # noqa: F401
@@ -0,0 +1,234 @@
+"""
+Authentication classes for the APIs.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from drf_spectacular.extensions import OpenApiAuthenticationExtension
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    BaseAuthentication,
+    TokenAuthentication,
+    get_authorization_header,
+)
+from rest_framework.authtoken.models import Token
+
+from core import tokens
+
+
+class LRUCache:
+    """A bounded, thread safe LRU mapping whose entries expire."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value for key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        """Store value under key for ttl seconds."""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Remove key if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_where(self, predicate):
+        """Remove every entry whose value matches predicate."""
+        with self._lock:
+            for key in [
+                key for key, (value, _) in self._entries.items()
+                if predicate(value)
+            ]:
+                del self._entries[key]
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# tokens verified by this process, {key: (user, token)}
+_local_tokens = LRUCache(settings.AUTH_TOKEN_CACHE_SIZE)
+# the shared invalidation epoch the local entries were cached under
+_local_epoch = None
+
+EPOCH_KEY = 'authtoken:epoch'
+
+
+def _shared_cache():
+    """Return the shared token cache, or None if there isn't one."""
+    alias = settings.AUTH_TOKEN_CACHE_ALIAS
+    return caches[alias] if alias else None
+
+
+def _shared_key(key):
+    return f'authtoken:token:{key}'
+
+
+def invalidate_tokens(keys):
+    """Drop tokens from every tier of the token cache."""
+    keys = list(keys)
+    for key in keys:
+        _local_tokens.delete(key)
+    shared = _shared_cache()
+    if shared is not None:
+        shared.delete_many([_shared_key(key) for key in keys])
+        # other workers drop their local entries when the epoch moves
+        try:
+            shared.incr(EPOCH_KEY)
+        except ValueError:
+            # seed from the clock, so an epoch lost to eviction never
+            # comes back with a value a worker still holds
+            shared.add(EPOCH_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate_user(user_id):
+    """Drop every cached token belonging to a user."""
+    _local_tokens.delete_where(lambda entry: entry[0].pk == user_id)
+    invalidate_tokens(
+        Token.objects.filter(user_id=user_id).values_list('key', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Token)
+@receiver(post_save, sender=Token)
+def _token_changed(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=get_user_model())
+def _user_changed(sender, instance, created, **kwargs):
+    # deactivated or edited users must not keep authenticating as the
+    # cached copy
+    if not created:
+        invalidate_user(instance.pk)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that caches verified tokens.
+
+    Tokens are kept in a bounded in-process LRU and, when
+    AUTH_TOKEN_CACHE_ALIAS is set, in a cache shared by all workers, so
+    most requests skip the token/user lookup. Entries expire after
+    AUTH_TOKEN_CACHE_TTL seconds and are dropped as soon as the token is
+    deleted or its user is saved. Every invalidation moves a shared
+    epoch, which makes the other workers drop their local entries on
+    their next request.
+    """
+
+    def _check_epoch(self, shared):
+        """Clear the local tier if another worker invalidated tokens."""
+        global _local_epoch
+        if shared is None:
+            return
+        epoch = shared.get(EPOCH_KEY)
+        if epoch != _local_epoch:
+            _local_tokens.clear()
+            _local_epoch = epoch
+
+    def authenticate_credentials(self, key):
+        """Return the (user, token) pair for key."""
+        shared = _shared_cache()
+        self._check_epoch(shared)
+
+        entry = _local_tokens.get(key)
+        if entry is None and shared is not None:
+            entry = shared.get(_shared_key(key))
+            if entry is not None:
+                _local_tokens.set(key, entry, settings.AUTH_TOKEN_CACHE_TTL)
+        if entry is None:
+            # raises AuthenticationFailed for unknown tokens or inactive
+            # users, so only valid tokens are cached
+            entry = super().authenticate_credentials(key)
+            _local_tokens.set(key, entry, settings.AUTH_TOKEN_CACHE_TTL)
+            if shared is not None:
+                shared.set(
+                    _shared_key(key), entry, settings.AUTH_TOKEN_CACHE_TTL,
+                )
+
+        # hand out copies, so changes a view makes to request.user
+        # never leak into the cached entry
+        user, token = entry
+        return copy.copy(user), copy.copy(token)
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Authenticate 'Authorization: Bearer <token>' signed access tokens.
+
+    The token is verified without any I/O and request.user is built from
+    its claims, without loading the user row. That user is only good for
+    identifying the owner (filtering, setting foreign keys); views that
+    read or save other user fields should stay on token authentication.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        """Return (user, claims) for a valid bearer token."""
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+
+        try:
+            claims = tokens.decode_token(auth[1].decode(), tokens.ACCESS)
+        except (tokens.InvalidToken, UnicodeError) as exc:
+            raise exceptions.AuthenticationFailed(str(exc))
+
+        user = get_user_model()(
+            pk=claims['uid'],
+            email=claims['email'],
+            is_active=True,
+        )
+        # mark the user as an existing row, so it can be assigned to
+        # foreign keys
+        user._state.adding = False
+        user._state.db = 'default'
+
+        return user, claims
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+class SignedTokenScheme(OpenApiAuthenticationExtension):
+    """Describe SignedTokenAuthentication in the OpenAPI schema."""
+    target_class = SignedTokenAuthentication
+    name = 'signedTokenAuth'
+
+    def get_security_definition(self, auto_schema):
+        return {
+            'type': 'http',
+            'scheme': 'bearer',
+            'bearerFormat': 'Signed token',
+        }
@@ -0,0 +1,118 @@
+"""
+PostgreSQL backend with connection health checks and optional pooling.
+
+Settings, alongside the usual ones in DATABASES:
+
+    CONN_HEALTH_CHECKS  ping a persistent connection with SELECT 1 the
+                        first time a request uses it, and reconnect if
+                        the server dropped it (as Django 4.1 does)
+    POOL                {'MAX_SIZE': n, 'TIMEOUT': seconds,
+                        'MAX_IDLE': seconds}; with MAX_SIZE > 0 each
+                        process keeps up to n connections in a
+                        core.db.pool.ConnectionPool. A pooled
+                        connection goes back to the pool as each request
+                        finishes, so CONN_MAX_AGE is ignored and MAX_IDLE
+                        decides how long idle ones are kept
+"""
+import time
+
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.base import Database
+
+from core.db.pool import (
+    ConnectionPool,
+    PoolTimeout,
+    get_or_create_pool,
+    get_pool,
+)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Django's PostgreSQL backend, with health checks and pooling."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    def _pool(self):
+        """Return the pool for this alias, making it on first use."""
+        options = self.settings_dict.get('POOL') or {}
+        if not options.get('MAX_SIZE'):
+            return None
+        return get_or_create_pool(self.alias, lambda: ConnectionPool(
+            self._connect,
+            max_size=options['MAX_SIZE'],
+            timeout=options.get('TIMEOUT', 10),
+            max_idle=options.get('MAX_IDLE'),
+            validate=self._ping
+            if self.settings_dict.get('CONN_HEALTH_CHECKS') else None,
+        ))
+
+    def _connect(self):
+        return super().get_new_connection(self.get_connection_params())
+
+    def _ping(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return True
+
+    def get_new_connection(self, conn_params):
+        pool = self._pool()
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        try:
+            connection = pool.checkout()
+        except PoolTimeout as exc:
+            # raised as django.db.OperationalError by wrap_database_errors
+            raise Database.OperationalError(str(exc)) from exc
+        # what super() would have read from a new connection
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level,
+        )
+
+        return connection
+
+    def _close(self):
+        pool = get_pool(self.alias)
+        if self.connection is None or pool is None:
+            return super()._close()
+        connection = self.connection
+        # only a connection with no transaction open can be reused
+        status = connection.get_transaction_status()
+        if status != Database.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except Database.Error:
+                pass
+            status = connection.get_transaction_status()
+        if connection.closed or \
+                status != Database.extensions.TRANSACTION_STATUS_IDLE:
+            pool.discard(connection)
+        else:
+            pool.checkin(connection)
+
+    def connect(self):
+        super().connect()
+        # a new connection doesn't need checking
+        self.health_check_done = True
+        if self._pool() is not None:
+            # as with CONN_MAX_AGE = 0, close_if_unusable_or_obsolete()
+            # closes it when the request finishes, which checks it back
+            # in; kept for CONN_MAX_AGE instead, a thread would hold a
+            # pool slot long after its request, and the others wait
+            self.close_at = time.monotonic()
+
+    def close_if_unusable_or_obsolete(self):
+        # runs as every request starts and finishes
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        """Connect, first checking a persistent connection still works."""
+        if self.connection is not None and not self.health_check_done and \
+                self.settings_dict.get('CONN_HEALTH_CHECKS') and \
+                not self.in_atomic_block:
+            self.health_check_done = True
+            if not self.is_usable():
+                self.close()
+        super().ensure_connection()
@@ -0,0 +1,198 @@
+"""
+A small in-process pool of database connections.
+
+Django keeps one connection per thread. With CONN_MAX_AGE that
+connection outlives the request, but a worker still opens a new one
+for every thread that touches the database, and nothing bounds how
+many a busy worker holds. The pool hands out at most max_size
+connections, reuses idle ones, and makes callers queue for up to
+timeout seconds when all of them are in use. The backend gives each
+connection back as its request finishes, so a worker's threads share
+them.
+
+It records how long checkouts waited, so an undersized pool shows up
+in stats() (see the readiness check) before it shows up as timeouts.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+
+logger = logging.getLogger(__name__)
+
+# this process's pools, by database alias
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    """No connection became free within the pool's timeout."""
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of connections made by connect().
+
+    validate(conn), if given, is called on idle connections before
+    they are handed out; those it rejects (by returning False or
+    raising) are closed and replaced.
+    """
+
+    def __init__(self, connect, max_size, timeout=10, max_idle=None,
+                 validate=None):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        # idle connections older than this are closed, not reused
+        self.max_idle = max_idle
+        self.validate = validate
+        self.pid = os.getpid()
+        self._idle = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'waits': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    def checkout(self):
+        """Return a connection, waiting for one if the pool is full."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'No database connection free after '
+                        f'{self.timeout}s ({self.max_size} in use).'
+                    )
+                self._cond.wait(remaining)
+            self._record_wait(time.monotonic() - start)
+            if self._idle:
+                conn, returned_at = self._idle.pop()
+            else:
+                conn = None
+                # reserve the slot before connecting outside the lock
+                self._size += 1
+
+        if conn is not None:
+            if self._usable(conn, returned_at):
+                return conn
+            # replace it, keeping its slot
+            self._close(conn)
+        try:
+            return self.connect()
+        except BaseException:
+            self._release_slot()
+            raise
+
+    def checkin(self, conn):
+        """Give a connection back for reuse."""
+        now = time.monotonic()
+        stale = []
+        with self._cond:
+            self._idle.append((conn, now))
+            # connections are reused newest first, so the oldest idle
+            # ones are at the left; close those idle for too long
+            while self.max_idle is not None and \
+                    now - self._idle[0][1] > self.max_idle:
+                stale.append(self._idle.popleft()[0])
+            self._size -= len(stale)
+            self._cond.notify(1 + len(stale))
+        for conn in stale:
+            self._close(conn)
+
+    def discard(self, conn):
+        """Close a checked out connection that can't be reused."""
+        self._close(conn)
+        self._release_slot()
+
+    def close_all(self):
+        """Close the idle connections."""
+        with self._cond:
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        """Return the pool's size and checkout wait statistics."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(
+                max_size=self.max_size,
+                size=self._size,
+                idle=len(self._idle),
+            )
+        checkouts = stats['checkouts']
+        stats['wait_seconds_avg'] = (
+            stats['wait_seconds_total'] / checkouts if checkouts else 0.0
+        )
+
+        return stats
+
+    def _record_wait(self, waited):
+        """Count a checkout that waited waited seconds (under the lock)."""
+        self._stats['checkouts'] += 1
+        if waited >= 0.001:
+            self._stats['waits'] += 1
+            self._stats['wait_seconds_total'] += waited
+            self._stats['wait_seconds_max'] = max(
+                self._stats['wait_seconds_max'], waited,
+            )
+            if waited >= self.timeout / 2:
+                logger.warning(
+                    'Waited %.3fs for a database connection; the pool of '
+                    '%d may be too small.', waited, self.max_size,
+                )
+
+    def _usable(self, conn, returned_at):
+        """Return whether an idle connection can be handed out again."""
+        if self.max_idle is not None and \
+                time.monotonic() - returned_at > self.max_idle:
+            return False
+        if self.validate is None:
+            return True
+        try:
+            return bool(self.validate(conn))
+        except Exception:
+            return False
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            logger.exception('Failed to close a pooled connection.')
+
+
+def get_pool(alias):
+    """Return this process's pool for a database alias, if it has one."""
+    pool = _pools.get(alias)
+    # a forked worker must not share its parent's sockets
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+
+    return None
+
+
+def get_or_create_pool(alias, make_pool):
+    """Return the pool for alias, making it with make_pool() if needed."""
+    with _pools_lock:
+        pool = get_pool(alias)
+        if pool is None:
+            pool = _pools[alias] = make_pool()
+
+    return pool
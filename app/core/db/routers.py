@@ -0,0 +1,196 @@
+"""
+Send reads to replica databases, and everything else to the primary.
+
+Only requests with a safe method (GET, HEAD, OPTIONS) read from a
+replica, and only until they write anything. Replicas trail the
+primary, so after a request writes, the same client's reads stay on
+the primary for DATABASE_REPLICA_PIN_SECONDS, and they can see their
+own writes. Clients are recognised by a cookie, and by a marker kept in
+the cache under the user's id for token clients that ignore cookies.
+Authentication reads users, tokens and sessions before either is known,
+so those always come from the primary, where a token made at login is
+sure to be.
+
+Each process measures every replica's lag at most once every
+DATABASE_REPLICA_LAG_CHECK_SECONDS. A replica further behind than
+DATABASE_REPLICA_MAX_LAG seconds, or one that can't be reached, is
+skipped until it catches up. With no replica usable, reads go to the
+primary.
+"""
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import SimpleLazyObject, empty
+
+
+# the cookie pinning a client's reads to the primary after it writes
+PIN_COOKIE = 'db_pin'
+
+_request_state = contextvars.ContextVar('db_request_state', default=None)
+
+# read by authentication, which a replica may not have caught up with
+AUTH_MODELS = {'authtoken.token', 'core.revokedtoken', 'sessions.session'}
+
+
+def _pin_key(user_id):
+    return f'db-pin:{user_id}'
+
+
+def _request_user(request):
+    """Return the request's user if authentication has already run."""
+    user = request.__dict__.get('user')
+    # don't make AuthenticationMiddleware's lazy user query the
+    # database in the middle of routing another query
+    if isinstance(user, SimpleLazyObject):
+        user = None if user._wrapped is empty else user._wrapped
+    if user is not None and user.is_authenticated:
+        return user
+
+    return None
+
+
+class RequestState:
+    """Where one request's queries may go."""
+
+    def __init__(self, request):
+        self.request = request
+        self.read_only = request.method in ('GET', 'HEAD', 'OPTIONS') and \
+            PIN_COOKIE not in request.COOKIES
+        self.wrote = False
+        self._user_pinned = None
+
+    def use_replica(self):
+        """Return whether a read may go to a replica."""
+        if not self.read_only or self.wrote:
+            return False
+        if self._user_pinned is None:
+            # known once authentication has run, which itself reads
+            user = _request_user(self.request)
+            if user is None:
+                return True
+            self._user_pinned = bool(cache.get(_pin_key(user.pk)))
+
+        return not self._user_pinned
+
+    def pin(self, response):
+        """Keep the client's reads on the primary for a while."""
+        seconds = settings.DATABASE_REPLICA_PIN_SECONDS
+        response.set_cookie(
+            PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax',
+        )
+        user = _request_user(self.request)
+        if user is not None:
+            cache.set(_pin_key(user.pk), True, seconds)
+
+
+@contextmanager
+def route_request(request):
+    """Route the queries made while handling request."""
+    state = RequestState(request)
+    token = _request_state.set(state)
+    try:
+        yield state
+    finally:
+        _request_state.reset(token)
+
+
+def measure_lag(alias):
+    """Return how many seconds a replica is behind its primary."""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        # a replica that has replayed everything it received is caught
+        # up, however long ago the primary last committed
+        cursor.execute(
+            'SELECT CASE WHEN NOT pg_is_in_recovery() OR '
+            'pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() '
+            'THEN 0 ELSE COALESCE(EXTRACT(EPOCH FROM '
+            'now() - pg_last_xact_replay_timestamp()), 0) END'
+        )
+        return float(cursor.fetchone()[0])
+
+
+class ReplicaMonitor:
+    """Each replica's lag, measured at most once per check interval."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = {}
+
+    def lag(self, alias):
+        """Return the replica's lag in seconds, or None if unreachable."""
+        with self._lock:
+            checked = self._checked.get(alias)
+        now = time.monotonic()
+        if checked is not None and \
+                now - checked[1] < settings.DATABASE_REPLICA_LAG_CHECK_SECONDS:
+            return checked[0]
+
+        try:
+            lag = measure_lag(alias)
+        except Exception:
+            lag = None
+        with self._lock:
+            self._checked[alias] = (lag, now)
+
+        return lag
+
+    def usable(self, alias):
+        """Return whether a replica is close enough to read from."""
+        lag = self.lag(alias)
+        return lag is not None and lag <= settings.DATABASE_REPLICA_MAX_LAG
+
+    def reset(self):
+        """Forget the measurements."""
+        with self._lock:
+            self._checked.clear()
+
+
+replica_monitor = ReplicaMonitor()
+
+
+class ReplicaRouter:
+    """Database router for DATABASE_REPLICAS (see the module docstring)."""
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        # outside a request (commands, workers) everything uses the
+        # primary
+        if not settings.DATABASE_REPLICAS or state is None or \
+                not state.use_replica():
+            return None
+        label = model._meta.label_lower
+        if label in AUTH_MODELS or label == settings.AUTH_USER_MODEL.lower():
+            return None
+        replicas = [
+            alias for alias in settings.DATABASE_REPLICAS
+            if replica_monitor.usable(alias)
+        ]
+        if not replicas:
+            return None
+
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+
+        return None
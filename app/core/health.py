@@ -0,0 +1,73 @@
+"""
+Health checks for load balancers and orchestrators.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+
+def _ping_database():
+    """Run a trivial query on a fresh connection."""
+    try:
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT 1')
+    finally:
+        # the connection belongs to the checker thread, never reuse it
+        connections['default'].close()
+
+
+class DatabaseCheck:
+    """
+    Check the database is reachable, with a timeout and a cached result.
+
+    The query runs in a background thread, so a hung database makes the
+    check fail after HEALTH_CHECK_DB_TIMEOUT seconds instead of blocking
+    the worker. The result is reused for HEALTH_CHECK_CACHE_SECONDS, and
+    concurrent checks share a single query.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='health-check',
+        )
+        self._lock = threading.Lock()
+        self._pending = None
+        self._healthy = None
+        self._checked_at = None
+
+    def __call__(self):
+        """Return whether the database is reachable."""
+        with self._lock:
+            ttl = settings.HEALTH_CHECK_CACHE_SECONDS
+            if self._checked_at is not None and \
+                    time.monotonic() - self._checked_at < ttl:
+                return self._healthy
+            # a query that timed out may still be running; wait on it
+            # rather than piling up more
+            if self._pending is None or self._pending.done():
+                self._pending = self._executor.submit(_ping_database)
+            pending = self._pending
+
+        try:
+            pending.result(timeout=settings.HEALTH_CHECK_DB_TIMEOUT)
+            healthy = True
+        except Exception:
+            # the query failed, or is still running after the timeout
+            healthy = False
+
+        with self._lock:
+            self._healthy = healthy
+            self._checked_at = time.monotonic()
+
+        return healthy
+
+    def reset(self):
+        """Forget the cached result."""
+        with self._lock:
+            self._checked_at = None
+
+
+database_check = DatabaseCheck()
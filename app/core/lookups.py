@@ -0,0 +1,40 @@
+"""
+Custom field lookups.
+"""
+from django.db.models import Field
+from django.db.models.fields.related import ForeignObject
+from django.db.models.fields.related_lookups import RelatedIn
+from django.db.models.lookups import In
+
+
+class ArrayInMixin:
+    """
+    Send the values of an __in style lookup as one array on PostgreSQL.
+
+    'id = ANY(%s)' has the same SQL text however many values there are,
+    so its statement stays the same for pg_stat_statements and prepared
+    plans, where 'IN (%s, %s, ...)' changes with every list length.
+    Other databases get a plain IN.
+    """
+    lookup_name = 'any'
+
+    def as_sql(self, compiler, connection):
+        if connection.vendor != 'postgresql' or \
+                not self.rhs_is_direct_value():
+            return super().as_sql(compiler, connection)
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        # deduplicated, None dropped and prepared for the field; raises
+        # EmptyResultSet for an empty list, like __in
+        _, rhs_params = self.process_rhs(compiler, connection)
+
+        return f'{lhs} = ANY(%s)', [*lhs_params, list(rhs_params)]
+
+
+@Field.register_lookup
+class AnyLookup(ArrayInMixin, In):
+    """field__any=[...], like field__in=[...]."""
+
+
+@ForeignObject.register_lookup
+class RelatedAnyLookup(ArrayInMixin, RelatedIn):
+    """foreign_key__any=[...], like foreign_key__in=[...]."""
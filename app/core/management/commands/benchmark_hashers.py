@@ -0,0 +1,124 @@
+"""
+Django command to measure login throughput for each password hasher policy.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+
+# the setting holding each tunable cost, and the smallest sensible value
+COSTS = {
+    'pbkdf2': [('iterations', 'PASSWORD_PBKDF2_ITERATIONS', 10000)],
+    'argon2': [
+        ('time_cost', 'PASSWORD_ARGON2_TIME_COST', 1),
+        ('memory_cost', 'PASSWORD_ARGON2_MEMORY_COST', 8192),
+    ],
+}
+
+
+def time_verify(hasher, rounds):
+    """Return the mean time in seconds to verify a password with hasher."""
+    encoded = hasher.encode('benchmark-password', hasher.salt())
+    start = time.perf_counter()
+    for _ in range(rounds):
+        hasher.verify('benchmark-password', encoded)
+
+    return (time.perf_counter() - start) / rounds
+
+
+def tuned_hasher(hasher_class, **costs):
+    """Return a hasher_class instance with costs instead of the settings."""
+    return type(hasher_class.__name__, (hasher_class,), costs)()
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the password hashers."""
+    help = (
+        'Report logins/sec per worker for each password hasher policy, '
+        'optionally calibrating its cost to a latency budget.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--policy',
+            action='append',
+            choices=sorted(settings.POLICY_PASSWORD_HASHERS),
+            help='Policy to benchmark, may be repeated (default: all).',
+        )
+        parser.add_argument('--rounds', type=int, default=10)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.UWSGI_WORKERS,
+            help='Worker processes, as in scripts/run.sh '
+                 '(default: UWSGI_WORKERS).',
+        )
+        parser.add_argument(
+            '--target-ms',
+            type=float,
+            help='Calibrate each policy to verify in about this many ms.',
+        )
+
+    def report(self, label, seconds, workers):
+        per_worker = 1 / seconds
+        self.stdout.write(
+            f'{label}: {seconds * 1000:.1f} ms/login, '
+            f'{per_worker:.1f} logins/sec per worker, '
+            f'{per_worker * workers:.1f} logins/sec for {workers} workers'
+        )
+
+    def calibrate(self, policy, hasher_class, seconds, target, rounds):
+        """Scale the policy's costs towards the target time."""
+        costs = {
+            attr: getattr(hasher_class(), attr)
+            for attr, _, _ in COSTS[policy]
+        }
+        # cost and time aren't exactly proportional, so refine a few times
+        for _ in range(3):
+            scale = target / seconds
+            if 0.9 <= scale <= 1.1:
+                break
+            # scale the first cost, and carry on to the next ones once it
+            # hits its minimum
+            for attr, _, minimum in COSTS[policy]:
+                current = costs[attr]
+                costs[attr] = max(minimum, int(current * scale))
+                scale = scale * current / costs[attr]
+                if 0.9 <= scale <= 1.1:
+                    break
+            seconds = time_verify(tuned_hasher(hasher_class, **costs), rounds)
+
+        return costs, seconds
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        workers = options['workers']
+        rounds = options['rounds']
+        target_ms = options['target_ms']
+        if target_ms is not None and target_ms <= 0:
+            raise CommandError('--target-ms must be positive.')
+        for policy in options['policy'] or settings.POLICY_PASSWORD_HASHERS:
+            hasher_class = import_string(
+                settings.POLICY_PASSWORD_HASHERS[policy]
+            )
+            if hasher_class.library:
+                try:
+                    hasher_class()._load_library()
+                except ValueError as exc:
+                    self.stdout.write(self.style.WARNING(f'{policy}: {exc}'))
+                    continue
+            seconds = time_verify(hasher_class(), rounds)
+            self.report(policy, seconds, workers)
+
+            if target_ms is None:
+                continue
+            costs, seconds = self.calibrate(
+                policy, hasher_class, seconds, target_ms / 1000, rounds,
+            )
+            self.report(f'{policy} calibrated', seconds, workers)
+            for attr, setting, _ in COSTS[policy]:
+                self.stdout.write(
+                    self.style.SUCCESS(f'  {setting}={costs[attr]}')
+                )
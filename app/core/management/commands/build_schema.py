@@ -0,0 +1,19 @@
+"""
+Django command to render the OpenAPI schema ahead of time.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.schema import write_schema
+
+
+class Command(BaseCommand):
+    """Django command to build the schema files."""
+    help = 'Render the OpenAPI schema into SCHEMA_ROOT.'
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        for path in write_schema(settings.SCHEMA_ROOT):
+            self.stdout.write(f'Wrote {path}')
+
+        self.stdout.write(self.style.SUCCESS('Schema built!'))
@@ -0,0 +1,112 @@
+"""
+Django command to size the database connection pool for the uwsgi workers.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    """Django command to suggest DB_POOL_MAX_SIZE."""
+    help = (
+        'Work out how many connections each uwsgi worker needs and may '
+        'have, given the server\'s max_connections, and check the '
+        'configured pool against both.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.UWSGI_WORKERS,
+            help='uwsgi worker processes per instance, as in '
+                 'scripts/run.sh (default: UWSGI_WORKERS).',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=settings.UWSGI_THREADS,
+            help='Request threads per worker (default: UWSGI_THREADS).',
+        )
+        parser.add_argument(
+            '--instances',
+            type=int,
+            default=1,
+            help='App containers sharing the database (default: 1).',
+        )
+        parser.add_argument(
+            '--reserved',
+            type=int,
+            default=5,
+            help='Connections to leave for migrations, shells and admin '
+                 'tools (default: 5).',
+        )
+        parser.add_argument(
+            '--max-connections',
+            type=int,
+            help='The server\'s max_connections (default: ask it).',
+        )
+        parser.add_argument('--database', default='default')
+
+    def max_connections(self, options):
+        """Return the database server's connection limit."""
+        if options['max_connections']:
+            return options['max_connections']
+        connection = connections[options['database']]
+        if connection.vendor != 'postgresql':
+            raise CommandError(
+                'Pass --max-connections for a non-PostgreSQL database.'
+            )
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW max_connections')
+            return int(cursor.fetchone()[0])
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        workers = options['workers'] * options['instances']
+        available = self.max_connections(options) - options['reserved']
+        if workers <= 0 or available <= 0:
+            raise CommandError('No connections left for the workers.')
+
+        # every thread that can hold a connection at once: the request
+        # threads, the image processing threads and the readiness check
+        needed = options['threads'] + 1
+        if settings.RECIPE_IMAGE_BACKEND == 'thread':
+            needed += settings.RECIPE_IMAGE_WORKERS
+        ceiling = available // workers
+        if ceiling < 1:
+            raise CommandError(
+                f'{available} connections are too few for {workers} '
+                f'workers.'
+            )
+        suggested = min(needed, ceiling)
+
+        self.stdout.write(
+            f'{workers} workers sharing {available} connections: at most '
+            f'{ceiling} each. Each worker can use {needed} at once.'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Suggested DB_POOL_MAX_SIZE={suggested}'
+        ))
+        if needed > ceiling:
+            self.stdout.write(self.style.WARNING(
+                'Requests queue for connections when more of a worker\'s '
+                'threads use the database at once than its pool holds, '
+                'and fail after DB_POOL_TIMEOUT seconds; add connections, '
+                'or run fewer workers or threads.'
+            ))
+
+        configured = settings.DATABASES[options['database']].get(
+            'POOL', {},
+        ).get('MAX_SIZE', 0)
+        if not configured:
+            self.stdout.write(
+                'The pool is off (DB_POOL_MAX_SIZE=0): each thread keeps '
+                'its own connection for DB_CONN_MAX_AGE seconds.'
+            )
+        elif configured * workers > available:
+            self.stdout.write(self.style.ERROR(
+                f'DB_POOL_MAX_SIZE={configured} lets the workers open '
+                f'{configured * workers} connections, more than '
+                f'{available}.'
+            ))
@@ -0,0 +1,53 @@
+"""
+Middleware for the app.
+"""
+from django.urls import reverse
+
+from core import views
+from core.db.routers import route_request
+
+
+class HealthCheckMiddleware:
+    """
+    Answer health checks before the rest of the middleware runs.
+
+    Must be first in MIDDLEWARE, so probes skip the security, session,
+    CSRF and authentication middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._views = None
+
+    def __call__(self, request):
+        if self._views is None:
+            self._views = {
+                reverse('health-check'): views.health_check,
+                reverse('readiness-check'): views.readiness_check,
+            }
+        view = self._views.get(request.path_info)
+        if view is not None:
+            return view(request)
+
+        return self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let safe requests read from the replicas (see core/db/routers.py).
+
+    A request that writes pins the client's next reads to the primary.
+    Goes before the session and authentication middleware, so their
+    queries are routed too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with route_request(request) as state:
+            response = self.get_response(request)
+            if state.wrote:
+                state.pin(response)
+
+        return response
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.25 on 2026-10-18 21:20
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Index and fill the search vectors, on PostgreSQL only."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX core_recipe_search_vector_gin '
+        'ON core_recipe USING gin (search_vector)'
+    )
+    # the same vector recipe/search.py writes
+    schema_editor.execute(
+        """
+        UPDATE core_recipe r SET search_vector =
+            setweight(to_tsvector(%(config)s::regconfig, r.title), 'A')
+            || setweight(to_tsvector(%(config)s::regconfig, concat_ws(' ',
+                (SELECT string_agg(t.name, ' ') FROM core_tag t
+                 JOIN core_recipe_tags rt ON rt.tag_id = t.id
+                 WHERE rt.recipe_id = r.id),
+                (SELECT string_agg(i.name, ' ') FROM core_ingredient i
+                 JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+                 WHERE ri.recipe_id = r.id)
+            )), 'B')
+            || setweight(
+                to_tsvector(%(config)s::regconfig, r.description), 'C'
+            )
+        """,
+        {'config': settings.RECIPE_SEARCH_CONFIG},
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX core_recipe_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_imageblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # a GinIndex in Meta.indexes would break migrating SQLite
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-18 21:23
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_ingredients(apps, schema_editor):
+    """Fill in ingredient_count for existing recipes."""
+    Recipe = apps.get_model('core', 'Recipe')
+    links = Recipe.ingredients.through.objects.filter(
+        recipe_id=OuterRef('pk'),
+    ).order_by().values('recipe_id').annotate(
+        count=Count('*'),
+    ).values('count')
+    Recipe.objects.update(
+        ingredient_count=Coalesce(
+            Subquery(links, output_field=models.IntegerField()), 0,
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'ingredient_count'], name='core_recipe_user_id_d99a00_idx'),
+        ),
+        migrations.RunPython(count_ingredients, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 3.2.25 on 2026-10-18 21:34
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Lower
+
+
+def _link_count(links, column):
+    """Return a subquery counting the links to the outer row."""
+    return Coalesce(
+        Subquery(
+            links.filter(**{column: OuterRef('pk')}).order_by().values(
+                column,
+            ).annotate(count=Count('*')).values('count'),
+            output_field=models.IntegerField(),
+        ),
+        0,
+    )
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """
+    Merge each user's tags and ingredients whose names differ only in case.
+
+    The lowest id is kept and the recipes linked to the others are
+    linked to it instead, so the unique indexes below can be created.
+    """
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, field in (('Tag', 'tags'), ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = getattr(Recipe, field).through
+        column = f'{model_name.lower()}_id'
+        named = model.objects.annotate(lower_name=Lower('name'))
+        groups = named.values('user_id', 'lower_name').annotate(
+            count=Count('id'),
+            keep=Min('id'),
+        ).filter(count__gt=1)
+
+        kept, recipe_ids = [], set()
+        for group in groups:
+            duplicates = list(named.filter(
+                user_id=group['user_id'],
+                lower_name=group['lower_name'],
+            ).exclude(id=group['keep']).values_list('id', flat=True))
+            links = through.objects.filter(**{f'{column}__in': duplicates})
+            recipe_ids.update(links.values_list('recipe_id', flat=True))
+            # link the kept row to every recipe linked to a duplicate.
+            # A recipe can have several of the duplicates, so the pairs
+            # are made distinct, and ones it already has are skipped.
+            through.objects.bulk_create(
+                [
+                    through(recipe_id=recipe_id, **{column: group['keep']})
+                    for recipe_id in set(
+                        links.values_list('recipe_id', flat=True)
+                    )
+                ],
+                ignore_conflicts=True,
+            )
+            links.delete()
+            model.objects.filter(id__in=duplicates).delete()
+            kept.append(group['keep'])
+
+        model.objects.filter(id__in=kept).update(
+            usage_count=_link_count(through.objects.all(), column),
+        )
+        if field == 'ingredients':
+            Recipe.objects.filter(id__in=recipe_ids).update(
+                ingredient_count=_link_count(
+                    through.objects.all(), 'recipe_id',
+                ),
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_usage_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_names, migrations.RunPython.noop,
+        ),
+        # expression indexes, which both PostgreSQL and SQLite support
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX tag_user_lower_name_uniq '
+            'ON core_tag (user_id, lower(name))',
+            'DROP INDEX tag_user_lower_name_uniq',
+        ),
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX ingredient_user_lower_name_uniq '
+            'ON core_ingredient (user_id, lower(name))',
+            'DROP INDEX ingredient_user_lower_name_uniq',
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-name', 'id'], name='ingredient_user_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', '-id'], name='recipe_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-name', 'id'], name='tag_user_name_idx'),
+        ),
+    ]
@@ -6,6 +6,7 @@ import os
 
 # brings in cofigurations from settings.py
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.contrib.auth.models import (
     AbstractBaseUser,
@@ -22,6 +23,14 @@ def recipe_image_file_path(instance, filename):
     return os.path.join('uploads', 'recipe', filename)
 
 
+class ImageStatus(models.TextChoices):
+    """Processing state of a recipe image."""
+    NONE = 'none'
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+
+
 class UserManager(BaseUserManager):
     """Manager for users."""
 
@@ -88,6 +97,44 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingredient')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # uploads are processed in the background (see recipe/images.py).
+    # The status is the latest upload's; until one is READY the last
+    # processed image keeps being served
+    image_status = models.CharField(
+        max_length=20,
+        choices=ImageStatus.choices,
+        default=ImageStatus.NONE,
+    )
+    # the upload being processed, so an older one finishing late can't
+    # overwrite a newer one
+    image_upload_id = models.UUIDField(null=True, blank=True)
+    # when it was staged, so gc_recipe_images can tell a lost job from
+    # one still queued
+    image_uploaded_at = models.DateTimeField(null=True, blank=True)
+    # {size: {'width': ..., 'height': ..., format: storage name, ...}}
+    # of the processed image, copied from image_blob
+    image_variants = models.JSONField(default=dict, blank=True)
+    image_blob = models.ForeignKey(
+        'ImageBlob',
+        null=True,
+        blank=True,
+        on_delete=models.PROTECT,
+        related_name='recipes',
+    )
+    # title, tag and ingredient names and description for full-text
+    # search, kept up to date by recipe/search.py. Only used on
+    # PostgreSQL, where migration 0009 adds a GIN index on it.
+    search_vector = SearchVectorField(null=True, editable=False)
+    # number of ingredients, kept in step with the links by
+    # recipe/cookable.py so coverage can be ranked without counting them
+    ingredient_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # the list: WHERE user_id = ... ORDER BY id DESC
+            models.Index(fields=['user', '-id'], name='recipe_user_id_idx'),
+            models.Index(fields=['user', 'ingredient_count']),
+        ]
 
     # this allows the object to be listed as the title, not ID
     def __str__(self):
@@ -101,6 +148,20 @@ class Tag(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    # recipes using it, kept only with RECIPE_USAGE_COUNTS (see
+    # recipe/usage.py)
+    usage_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # the list: WHERE user_id = ... ORDER BY name DESC, id
+            models.Index(
+                fields=['user', '-name', 'id'], name='tag_user_name_idx',
+            ),
+            models.Index(fields=['user', 'usage_count']),
+        ]
+        # (user, lower(name)) is also unique, with an index added by
+        # migration 0012 as Django can't declare one on an expression
 
     def __str__(self):
         return self.name
@@ -112,6 +173,50 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    # recipes using it, kept only with RECIPE_USAGE_COUNTS (see
+    # recipe/usage.py)
+    usage_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # the list: WHERE user_id = ... ORDER BY name DESC, id
+            models.Index(
+                fields=['user', '-name', 'id'],
+                name='ingredient_user_name_idx',
+            ),
+            models.Index(fields=['user', 'usage_count']),
+        ]
+        # (user, lower(name)) is also unique, with an index added by
+        # migration 0012 as Django can't declare one on an expression
 
     def __str__(self):
         return self.name
+
+
+class RevokedToken(models.Model):
+    """Revoked signed token or session id (see core/tokens.py)."""
+    jti = models.BigIntegerField(unique=True)
+    # kept until every token the id could match has expired
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return str(self.jti)
+
+
+class ImageBlob(models.Model):
+    """
+    Processed image files, shared by every recipe with the same upload.
+
+    Keyed by the SHA-256 of the uploaded bytes, and the file names are
+    derived from it, so a file's content never changes. ref_count counts
+    the recipes using the blob; blobs left at zero are deleted with their
+    files by 'manage.py gc_recipe_images'.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    variants = models.JSONField(default=dict, blank=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    # when ref_count last dropped to zero
+    released_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return self.sha256
@@ -0,0 +1,153 @@
+"""
+Precomputed OpenAPI schema.
+
+Generating the schema introspects every view and serializer, so it is
+rendered once by 'manage.py build_schema' and served from disk. Each
+file is named after the hash of its content and written alongside gzip
+and, if the brotli package is installed, brotli compressed copies. If
+the files are missing, the schema is rendered once per process instead.
+"""
+import gzip
+import hashlib
+import json
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from drf_spectacular.generators import SchemaGenerator
+from drf_spectacular.renderers import (
+    OpenApiJsonRenderer,
+    OpenApiYamlRenderer,
+)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# format: (renderer, file extension)
+FORMATS = {
+    'yaml': (OpenApiYamlRenderer, 'yaml'),
+    'json': (OpenApiJsonRenderer, 'json'),
+}
+# content encoding: file suffix
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+MANIFEST = 'manifest.json'
+
+
+class SchemaArtifact:
+    """A rendered schema and its compressed variants."""
+
+    def __init__(self, filename, media_type, content, encoded=None):
+        self.filename = filename
+        self.media_type = media_type
+        self.content = content
+        # {content encoding: bytes}
+        self.encoded = encoded if encoded is not None else compress(content)
+        self.etag = f'"{filename}"'
+
+
+def compress(content):
+    """Return the compressed variants of content."""
+    encoded = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded['br'] = brotli.compress(content)
+
+    return encoded
+
+
+def render_schema():
+    """Render the schema in every format, returning {format: artifact}."""
+    schema = SchemaGenerator().get_schema(request=None, public=True)
+    artifacts = {}
+    for fmt, (renderer_class, extension) in FORMATS.items():
+        content = renderer_class().render(schema, renderer_context={})
+        digest = hashlib.sha256(content).hexdigest()[:16]
+        artifacts[fmt] = SchemaArtifact(
+            f'openapi.{digest}.{extension}',
+            renderer_class.media_type,
+            content,
+        )
+
+    return artifacts
+
+
+def write_schema(root):
+    """Render the schema into root and return the files written."""
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    artifacts = render_schema()
+    written = []
+    for artifact in artifacts.values():
+        path = root / artifact.filename
+        path.write_bytes(artifact.content)
+        written.append(path)
+        for encoding, data in artifact.encoded.items():
+            encoded_path = path.with_name(path.name + ENCODINGS[encoding])
+            encoded_path.write_bytes(data)
+            written.append(encoded_path)
+    # written last, so a reader never sees a manifest without its files
+    manifest = root / MANIFEST
+    tmp = manifest.with_suffix('.tmp')
+    tmp.write_text(json.dumps({
+        fmt: artifact.filename for fmt, artifact in artifacts.items()
+    }))
+    tmp.replace(manifest)
+    written.append(manifest)
+
+    # drop the files of earlier builds
+    for path in root.glob('openapi.*'):
+        if path not in written:
+            path.unlink()
+
+    return written
+
+
+def _read_schema(root):
+    """Return {format: artifact} from the files in root."""
+    root = Path(root)
+    artifacts = {}
+    for fmt, filename in json.loads((root / MANIFEST).read_text()).items():
+        path = root / filename
+        encoded = {}
+        for encoding, suffix in ENCODINGS.items():
+            encoded_path = path.with_name(path.name + suffix)
+            if encoded_path.exists():
+                encoded[encoding] = encoded_path.read_bytes()
+        artifacts[fmt] = SchemaArtifact(
+            filename,
+            FORMATS[fmt][0].media_type,
+            path.read_bytes(),
+            encoded,
+        )
+
+    return artifacts
+
+
+_artifacts = {}
+_lock = threading.Lock()
+
+
+def get_schema():
+    """Return the current {format: artifact}, loading it on first use."""
+    root = str(settings.SCHEMA_ROOT)
+    artifacts = _artifacts.get(root)
+    if artifacts is None:
+        with _lock:
+            artifacts = _artifacts.get(root)
+            if artifacts is None:
+                try:
+                    artifacts = _read_schema(root)
+                except (OSError, ValueError, KeyError):
+                    # not built, e.g. when the code is mounted into a dev
+                    # container, so render it in process instead
+                    artifacts = render_schema()
+                _artifacts[root] = artifacts
+
+    return artifacts
+
+
+def clear_cache():
+    """Forget the loaded schema, so the next request reloads it."""
+    _artifacts.clear()
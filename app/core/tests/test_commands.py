@@ -1,14 +1,15 @@
 """
 Test custom Djangogo management commands.
 """
+from io import StringIO
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as Psycopg2OpError
 
-from django.core.management import call_command
+from django.core.management import CommandError, call_command
 from django.db.utils import OperationalError
 
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, override_settings
 
 
 # the command that we'll be mocking
@@ -48,3 +49,76 @@ class CommandTests(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class BenchmarkHashersTests(SimpleTestCase):
+    """Test the benchmark_hashers command."""
+
+    @override_settings(
+        PASSWORD_PBKDF2_ITERATIONS=1000,
+        PASSWORD_ARGON2_MEMORY_COST=8192,
+    )
+    def test_reports_each_policy(self):
+        """Test a throughput line is printed for every policy."""
+        out = StringIO()
+
+        call_command('benchmark_hashers', rounds=1, workers=4, stdout=out)
+
+        self.assertIn('pbkdf2: ', out.getvalue())
+        self.assertIn('argon2: ', out.getvalue())
+        self.assertIn('logins/sec for 4 workers', out.getvalue())
+
+    @override_settings(PASSWORD_PBKDF2_ITERATIONS=20000)
+    def test_calibrate(self):
+        """Test calibrating prints the cost setting to use."""
+        out = StringIO()
+
+        call_command(
+            'benchmark_hashers',
+            policy=['pbkdf2'],
+            rounds=1,
+            target_ms=5,
+            stdout=out,
+        )
+
+        self.assertIn('PASSWORD_PBKDF2_ITERATIONS=', out.getvalue())
+
+
+@override_settings(RECIPE_IMAGE_BACKEND='memory')
+class DbPoolSizingTests(SimpleTestCase):
+    """Test the db_pool_sizing command."""
+
+    def sizing(self, **options):
+        out = StringIO()
+        call_command('db_pool_sizing', stdout=out, **options)
+
+        return out.getvalue()
+
+    def test_suggests_pool_size(self):
+        """Test the pool is sized to the threads that can use it."""
+        out = self.sizing(workers=4, threads=2, max_connections=100)
+
+        self.assertIn('at most 23 each', out)
+        self.assertIn('DB_POOL_MAX_SIZE=3', out)
+
+    def test_capped_by_max_connections(self):
+        """Test the pool is capped by the workers' share of connections."""
+        out = self.sizing(
+            workers=8, threads=8, instances=2, max_connections=50,
+        )
+
+        self.assertIn('DB_POOL_MAX_SIZE=2', out)
+        self.assertIn('queue for connections', out)
+
+    def test_configured_pool_too_big(self):
+        """Test a pool larger than the workers' share is reported."""
+        databases = {'default': {'POOL': {'MAX_SIZE': 30}}}
+        with self.settings(DATABASES=databases):
+            out = self.sizing(workers=4, max_connections=100)
+
+        self.assertIn('more than 95', out)
+
+    def test_too_few_connections(self):
+        """Test an error when workers can't get a connection each."""
+        with self.assertRaises(CommandError):
+            self.sizing(workers=10, max_connections=10)
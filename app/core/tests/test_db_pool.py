@@ -0,0 +1,231 @@
+"""
+Tests for the database connection pool.
+"""
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from psycopg2 import OperationalError, extensions
+
+from django.test import SimpleTestCase
+
+from core.db.backends.postgresql.base import DatabaseWrapper
+from core.db.pool import ConnectionPool, PoolTimeout, get_pool
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Test checking connections out of and into the pool."""
+
+    def make_pool(self, **kwargs):
+        kwargs.setdefault('max_size', 2)
+        kwargs.setdefault('timeout', 1)
+        return ConnectionPool(MagicMock, **kwargs)
+
+    def test_reuses_connections(self):
+        """Test a checked in connection is handed out again."""
+        pool = self.make_pool()
+        conn = pool.checkout()
+        pool.checkin(conn)
+
+        self.assertIs(pool.checkout(), conn)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_capped_at_max_size(self):
+        """Test a full pool times out instead of connecting again."""
+        pool = self.make_pool(timeout=0.05)
+        pool.checkout()
+        pool.checkout()
+
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        self.assertEqual(pool.stats()['size'], 2)
+
+    def test_waits_for_checkin(self):
+        """Test a checkout waits for a connection to come back."""
+        pool = self.make_pool(max_size=1)
+        conn = pool.checkout()
+        timer = threading.Timer(0.05, pool.checkin, [conn])
+        timer.start()
+
+        self.assertIs(pool.checkout(), conn)
+        timer.join()
+        stats = pool.stats()
+        self.assertEqual(stats['waits'], 1)
+        self.assertGreaterEqual(stats['wait_seconds_max'], 0.04)
+        self.assertEqual(stats['checkouts'], 2)
+
+    def test_invalid_connection_replaced(self):
+        """Test an idle connection failing validation is replaced."""
+        pool = self.make_pool(validate=lambda conn: False)
+        conn = pool.checkout()
+        pool.checkin(conn)
+
+        replacement = pool.checkout()
+
+        self.assertIsNot(replacement, conn)
+        conn.close.assert_called_once()
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_validation_error_replaces(self):
+        """Test a validation that raises also replaces the connection."""
+        def validate(conn):
+            raise OSError('connection reset')
+        pool = self.make_pool(validate=validate)
+        conn = pool.checkout()
+        pool.checkin(conn)
+
+        self.assertIsNot(pool.checkout(), conn)
+
+    def test_stale_connections_closed(self):
+        """Test connections idle longer than max_idle are closed."""
+        pool = self.make_pool(max_idle=0.01)
+        old, new = pool.checkout(), pool.checkout()
+        pool.checkin(old)
+        time.sleep(0.02)
+
+        pool.checkin(new)
+
+        old.close.assert_called_once()
+        self.assertEqual(pool.stats()['size'], 1)
+        self.assertIs(pool.checkout(), new)
+
+    def test_discard_frees_slot(self):
+        """Test discarding a broken connection lets another be made."""
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        conn = pool.checkout()
+
+        pool.discard(conn)
+
+        conn.close.assert_called_once()
+        self.assertIsNot(pool.checkout(), conn)
+
+    def test_failed_connect_frees_slot(self):
+        """Test a failed connect doesn't use up the pool."""
+        connect = MagicMock(side_effect=[OSError('refused'), 'conn'])
+        pool = ConnectionPool(connect, max_size=1, timeout=0.05)
+
+        with self.assertRaises(OSError):
+            pool.checkout()
+
+        self.assertEqual(pool.checkout(), 'conn')
+
+    def test_concurrent_checkouts(self):
+        """Test threads sharing a pool never exceed max_size."""
+        pool = self.make_pool(max_size=3, timeout=5)
+        in_use, peak = [], []
+        lock = threading.Lock()
+
+        def work():
+            for _ in range(20):
+                conn = pool.checkout()
+                with lock:
+                    in_use.append(conn)
+                    peak.append(len(in_use))
+                time.sleep(0.001)
+                with lock:
+                    in_use.remove(conn)
+                pool.checkin(conn)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(max(peak), 3)
+        self.assertEqual(pool.stats()['checkouts'], 160)
+
+
+class PooledBackendTests(SimpleTestCase):
+    """Test the PostgreSQL backend hands connections to and from its pool."""
+
+    def setUp(self):
+        settings_dict = {
+            'NAME': 'test', 'USER': '', 'PASSWORD': '', 'HOST': '',
+            'PORT': '', 'OPTIONS': {}, 'TIME_ZONE': None,
+            'CONN_MAX_AGE': 0, 'AUTOCOMMIT': True,
+            'ATOMIC_REQUESTS': False,
+            'POOL': {'MAX_SIZE': 1, 'TIMEOUT': 0.05},
+        }
+        # a new alias per test, so each gets its own pool
+        self.db = DatabaseWrapper(settings_dict, alias=self.id())
+        patcher = patch.object(
+            DatabaseWrapper, '_connect', side_effect=self.fake_connection,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_connection(self):
+        conn = MagicMock(closed=False, isolation_level=None)
+        conn.get_transaction_status.return_value = \
+            extensions.TRANSACTION_STATUS_IDLE
+        return conn
+
+    def test_close_returns_to_pool(self):
+        """Test closing gives the connection back instead of closing it."""
+        conn = self.db.connection = self.db.get_new_connection({})
+        self.db._close()
+
+        conn.close.assert_not_called()
+        self.assertIs(self.db.get_new_connection({}), conn)
+
+    def test_open_transaction_rolled_back(self):
+        """Test a connection is rolled back before it is reused."""
+        conn = self.db.connection = self.db.get_new_connection({})
+        conn.get_transaction_status.side_effect = [
+            extensions.TRANSACTION_STATUS_INTRANS,
+            extensions.TRANSACTION_STATUS_IDLE,
+        ]
+        self.db._close()
+
+        conn.rollback.assert_called_once()
+        self.assertIs(self.db.get_new_connection({}), conn)
+
+    def test_broken_connection_discarded(self):
+        """Test a connection that can't be rolled back is closed."""
+        conn = self.db.connection = self.db.get_new_connection({})
+        conn.get_transaction_status.return_value = \
+            extensions.TRANSACTION_STATUS_UNKNOWN
+        self.db._close()
+
+        conn.close.assert_called_once()
+        self.assertIsNot(self.db.get_new_connection({}), conn)
+
+    def test_pool_timeout_is_operational_error(self):
+        """Test an exhausted pool raises the database's OperationalError."""
+        self.db.get_new_connection({})
+
+        with self.assertRaises(OperationalError):
+            self.db.get_new_connection({})
+
+    def test_threads_share_pool_between_requests(self):
+        """Test more threads than slots take turns, despite CONN_MAX_AGE."""
+        settings_dict = dict(
+            self.db.settings_dict,
+            CONN_MAX_AGE=60,
+            POOL={'MAX_SIZE': 1, 'TIMEOUT': 2},
+        )
+        errors = []
+
+        def request():
+            # Django gives every thread its own DatabaseWrapper
+            db = DatabaseWrapper(settings_dict, alias=self.id())
+            try:
+                db.close_if_unusable_or_obsolete()
+                db.connect()
+                time.sleep(0.01)
+                db.close_if_unusable_or_obsolete()
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=request) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        stats = get_pool(self.id()).stats()
+        self.assertEqual((stats['size'], stats['idle']), (1, 1))
+        self.assertEqual(stats['checkouts'], 4)
@@ -0,0 +1,74 @@
+"""
+Tests for the tuned password hashers.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+
+TOKEN_URL = reverse('user:token')
+
+PBKDF2_FIRST = [
+    'core.hashers.TunedPBKDF2PasswordHasher',
+    'core.hashers.TunedArgon2PasswordHasher',
+]
+ARGON2_FIRST = list(reversed(PBKDF2_FIRST))
+
+
+@override_settings(
+    PASSWORD_PBKDF2_ITERATIONS=1000,
+    PASSWORD_ARGON2_TIME_COST=1,
+    PASSWORD_ARGON2_MEMORY_COST=8192,
+)
+class HasherPolicyTests(TestCase):
+    """Test changing the hasher policy and costs."""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def login(self):
+        self.client.post(TOKEN_URL, {
+            'email': 'user@example.com',
+            'password': 'testpass123',
+        })
+
+    @override_settings(PASSWORD_HASHERS=PBKDF2_FIRST)
+    def test_iterations_from_settings(self):
+        """Test new hashes use the configured iteration count."""
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1000$'))
+
+    def test_rehash_on_policy_change(self):
+        """Test logging in upgrades a hash made under the old policy."""
+        with self.settings(PASSWORD_HASHERS=PBKDF2_FIRST):
+            user = get_user_model().objects.create_user(
+                'user@example.com',
+                'testpass123',
+            )
+
+        with self.settings(PASSWORD_HASHERS=ARGON2_FIRST):
+            self.login()
+
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('argon2$argon2id$'))
+        self.assertTrue(user.check_password('testpass123'))
+
+    @override_settings(PASSWORD_HASHERS=PBKDF2_FIRST)
+    def test_rehash_on_cost_change(self):
+        """Test logging in re-hashes with a changed iteration count."""
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+
+        with self.settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            self.login()
+
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$2000$'))
@@ -1,15 +1,27 @@
 """
 Tests for the health check API.
 """
-from django.test import TestCase
+import time
+from unittest.mock import patch
+
+from django.db.utils import OperationalError
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from core.db.pool import ConnectionPool
+from core.health import database_check
+
+
 class HealthCheckTests(TestCase):
     """Test for health check API."""
 
+    def setUp(self):
+        database_check.reset()
+        self.client = APIClient()
+
     def test_health_check(self):
         """Test health check API."""
         client = APIClient()
@@ -17,3 +29,62 @@ class HealthCheckTests(TestCase):
         res = client.get(url)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_health_check_skips_database(self):
+        """Test the liveness check runs no queries or session handling."""
+        with self.assertNumQueries(0):
+            res = self.client.get(reverse('health-check'))
+
+        self.assertEqual(res.json(), {'healthy': True})
+        self.assertNotIn('Vary', res)
+
+    def test_readiness_check(self):
+        """Test the readiness check reports a reachable database."""
+        res = self.client.get(reverse('readiness-check'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), {'ready': True, 'database': 'ok'})
+
+    @patch('core.health._ping_database')
+    def test_readiness_check_pool_stats(self, patched_ping):
+        """Test the readiness check reports the connection pool's waits."""
+        pool = ConnectionPool(lambda: object(), max_size=4)
+        pool.checkin(pool.checkout())
+
+        with patch('core.views.get_pool', return_value=pool):
+            res = self.client.get(reverse('readiness-check'))
+
+        stats = res.json()['pool']
+        self.assertEqual(stats['max_size'], 4)
+        self.assertEqual(stats['checkouts'], 1)
+        self.assertIn('wait_seconds_avg', stats)
+
+    @patch('core.health._ping_database')
+    def test_readiness_check_database_down(self, patched_ping):
+        """Test the readiness check fails when the database errors."""
+        patched_ping.side_effect = OperationalError
+
+        res = self.client.get(reverse('readiness-check'))
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(res.json()['ready'])
+
+    @override_settings(HEALTH_CHECK_DB_TIMEOUT=0.05)
+    @patch('core.health._ping_database')
+    def test_readiness_check_timeout(self, patched_ping):
+        """Test a hung database fails the check after the timeout."""
+        patched_ping.side_effect = lambda: time.sleep(0.5)
+
+        res = self.client.get(reverse('readiness-check'))
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        # let the hung check finish, so it doesn't hold up other tests
+        database_check._pending.result()
+
+    @patch('core.health._ping_database')
+    def test_readiness_check_cached(self, patched_ping):
+        """Test repeated probes reuse the last result."""
+        self.client.get(reverse('readiness-check'))
+        self.client.get(reverse('readiness-check'))
+
+        patched_ping.assert_called_once()
@@ -0,0 +1,75 @@
+"""
+Tests for the indexes behind the hot list queries.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models.functions import Lower
+from django.test import TestCase
+
+from core.models import Ingredient, Recipe, Tag
+
+
+class IndexUsageTests(TestCase):
+    """Test the list queries are planned on the composite indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [
+            get_user_model().objects.create_user(f'user{index}@example.com')
+            for index in range(20)
+        ]
+        cls.user = users[0]
+        Recipe.objects.bulk_create([
+            Recipe(
+                user=user,
+                title=f'Recipe {index}',
+                time_minutes=10,
+                price=Decimal('5.00'),
+            )
+            for user in users for index in range(100)
+        ])
+        for model in (Tag, Ingredient):
+            model.objects.bulk_create([
+                model(user=user, name=f'Name {index}')
+                for user in users for index in range(100)
+            ])
+        # give the planner statistics for the seeded rows
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+
+    def test_recipe_list(self):
+        """Test a page of recipes reads recipe_user_id_idx."""
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
+
+        self.assertUsesIndex(recipes[:20], 'recipe_user_id_idx')
+        # later pages seek on the same index
+        self.assertUsesIndex(
+            recipes.filter(id__lt=50)[:20], 'recipe_user_id_idx',
+        )
+
+    def test_tag_and_ingredient_lists(self):
+        """Test tags and ingredients are listed from their name index."""
+        for model, index in (
+            (Tag, 'tag_user_name_idx'),
+            (Ingredient, 'ingredient_user_name_idx'),
+        ):
+            self.assertUsesIndex(
+                model.objects.filter(user=self.user).order_by(
+                    '-name', 'id',
+                )[:20],
+                index,
+            )
+
+    def test_name_lookup(self):
+        """Test matching names ignoring case reads the unique index."""
+        tags = Tag.objects.filter(user=self.user).annotate(
+            lower_name=Lower('name'),
+        ).filter(lower_name='name 5')
+
+        self.assertUsesIndex(tags, 'tag_user_lower_name_uniq')
@@ -0,0 +1,58 @@
+"""
+Tests for the custom field lookups.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.backends.postgresql.base import DatabaseWrapper
+from django.test import TestCase
+
+from core.models import Recipe, Tag
+
+
+class AnyLookupTests(TestCase):
+    """Test the __any lookup."""
+
+    def compile(self, queryset, vendor_connection):
+        compiler = queryset.query.get_compiler(connection=vendor_connection)
+
+        return compiler.as_sql()
+
+    def postgresql(self):
+        """Return a PostgreSQL connection, which is never opened."""
+        return DatabaseWrapper({
+            **connection.settings_dict,
+            'ENGINE': 'django.db.backends.postgresql',
+        })
+
+    def test_one_array_on_postgresql(self):
+        """Test the values are sent as a single array parameter."""
+        sql, params = self.compile(
+            Tag.objects.filter(pk__any=[3, 1, 3]),
+            self.postgresql(),
+        )
+
+        self.assertIn('"core_tag"."id" = ANY(%s)', sql)
+        self.assertEqual(params, ([3, 1],))
+
+    def test_foreign_key_on_postgresql(self):
+        """Test __any also works across a relation."""
+        sql, params = self.compile(
+            Recipe.objects.filter(tags__any=[1, 2]),
+            self.postgresql(),
+        )
+
+        self.assertIn('"core_recipe_tags"."tag_id" = ANY(%s)', sql)
+        self.assertEqual(params, ([1, 2],))
+
+    def test_in_elsewhere(self):
+        """Test other databases get an IN with the same results."""
+        user = get_user_model().objects.create_user('user@example.com')
+        tags = [
+            Tag.objects.create(user=user, name=name)
+            for name in ('Vegan', 'Quick', 'Spicy')
+        ]
+
+        found = Tag.objects.filter(pk__any=[tags[0].pk, tags[2].pk])
+
+        self.assertCountEqual(found, [tags[0], tags[2]])
+        self.assertFalse(Tag.objects.filter(pk__any=[]).exists())
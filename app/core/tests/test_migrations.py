@@ -0,0 +1,60 @@
+"""
+Tests for data migrations.
+"""
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MergeDuplicateNamesTests(TransactionTestCase):
+    """Test 0012 merges names differing only in case."""
+    migrate_from = [('core', '0011_usage_count')]
+    migrate_to = [('core', '0012_user_name_indexes')]
+
+    def migrate(self, targets):
+        """Migrate to targets and return the project state there."""
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_variants_sharing_a_recipe(self):
+        """Test a recipe linked to several case variants keeps one link."""
+        apps = self.migrate(self.migrate_from)
+        User = apps.get_model('core', 'User')
+        Recipe = apps.get_model('core', 'Recipe')
+        Tag = apps.get_model('core', 'Tag')
+        user = User.objects.create(email='user@example.com')
+        kept, lower, upper = [
+            Tag.objects.create(user=user, name=name)
+            for name in ('Vegan', 'vegan', 'VEGAN')
+        ]
+        shared = Recipe.objects.create(
+            user=user, title='Curry', time_minutes=10, price='5.00',
+        )
+        shared.tags.add(lower, upper)
+        both = Recipe.objects.create(
+            user=user, title='Salad', time_minutes=5, price='3.00',
+        )
+        both.tags.add(kept, upper)
+
+        apps = self.migrate(self.migrate_to)
+        Recipe = apps.get_model('core', 'Recipe')
+        Tag = apps.get_model('core', 'Tag')
+
+        self.assertEqual(
+            list(Tag.objects.values_list('id', 'name', 'usage_count')),
+            [(kept.id, 'Vegan', 2)],
+        )
+        for recipe in (shared, both):
+            self.assertEqual(
+                list(Recipe.objects.get(id=recipe.id).tags.values_list(
+                    'id', flat=True,
+                )),
+                [kept.id],
+            )
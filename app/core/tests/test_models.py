@@ -4,6 +4,7 @@ Tests for models.
 from unittest.mock import patch
 from decimal import Decimal
 
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
@@ -89,6 +90,22 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(ingredient), ingredient.name)
 
+    def test_names_unique_per_user_ignoring_case(self):
+        """Test a user can't have two tags named alike in any case."""
+        user = create_user()
+        models.Tag.objects.create(user=user, name='Vegan')
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            models.Tag.objects.create(user=user, name='vegan')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            models.Ingredient.objects.bulk_create([
+                models.Ingredient(user=user, name='Salt'),
+                models.Ingredient(user=user, name='SALT'),
+            ])
+        # other users can use the same names
+        other = create_user('other@example.com')
+        models.Tag.objects.create(user=other, name='vegan')
+
     # unit test to creating a path to the file on the system.
     # ensure unique names using uuid
 
@@ -0,0 +1,210 @@
+"""
+Tests for routing reads to replica databases.
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase, \
+    override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.db.routers import (
+    PIN_COOKIE,
+    ReplicaRouter,
+    replica_monitor,
+    route_request,
+)
+from core.models import RevokedToken, Tag
+
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+@patch('core.db.routers.measure_lag', return_value=0.0)
+class ReplicaRouterTests(SimpleTestCase):
+    """Test which database the router picks."""
+
+    def setUp(self):
+        replica_monitor.reset()
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def read_db(self, request):
+        with route_request(request):
+            return self.router.db_for_read(Tag)
+
+    def test_safe_request_reads_replica(self, patched_lag):
+        """Test a GET reads from the replica."""
+        self.assertEqual(self.read_db(self.factory.get('/')), 'replica')
+
+    def test_unsafe_request_reads_primary(self, patched_lag):
+        """Test a POST reads from the primary."""
+        self.assertIsNone(self.read_db(self.factory.post('/')))
+
+    def test_outside_request_reads_primary(self, patched_lag):
+        """Test commands and background threads use the primary."""
+        self.assertIsNone(self.router.db_for_read(Tag))
+
+    def test_reads_after_write_use_primary(self, patched_lag):
+        """Test a request that has written reads its own writes."""
+        with route_request(self.factory.get('/')):
+            self.assertEqual(self.router.db_for_write(Tag), 'default')
+            self.assertIsNone(self.router.db_for_read(Tag))
+
+    def test_pin_cookie(self, patched_lag):
+        """Test a client that just wrote reads from the primary."""
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+
+        self.assertIsNone(self.read_db(request))
+
+    def test_user_pinned(self, patched_lag):
+        """Test a user who just wrote reads from the primary anywhere."""
+        user = get_user_model()(pk=1, email='user@example.com')
+        request = self.factory.post('/')
+        request.user = user
+        with route_request(request) as state:
+            state.pin(_Response())
+
+        request = self.factory.get('/')
+        request.user = user
+        self.assertIsNone(self.read_db(request))
+        # other users are unaffected
+        request.user = get_user_model()(pk=2, email='other@example.com')
+        self.assertEqual(self.read_db(request), 'replica')
+
+    def test_authentication_reads_primary(self, patched_lag):
+        """Test tokens, sessions and users are read from the primary."""
+        with route_request(self.factory.get('/')):
+            for model in (Token, Session, RevokedToken, get_user_model()):
+                with self.subTest(model=model):
+                    self.assertIsNone(self.router.db_for_read(model))
+            self.assertEqual(self.router.db_for_read(Tag), 'replica')
+
+    def test_lagging_replica_skipped(self, patched_lag):
+        """Test a replica too far behind isn't read from."""
+        patched_lag.return_value = 30.0
+
+        self.assertIsNone(self.read_db(self.factory.get('/')))
+
+    def test_unreachable_replica_skipped(self, patched_lag):
+        """Test a replica that fails the lag check isn't read from."""
+        patched_lag.side_effect = OSError('connection refused')
+
+        self.assertIsNone(self.read_db(self.factory.get('/')))
+
+    @override_settings(DATABASE_REPLICAS=['replica', 'replica2'])
+    def test_only_usable_replicas_chosen(self, patched_lag):
+        """Test reads spread over the replicas that are caught up."""
+        patched_lag.side_effect = \
+            lambda alias: 0.0 if alias == 'replica2' else 9.0
+
+        choices = {self.read_db(self.factory.get('/')) for _ in range(5)}
+
+        self.assertEqual(choices, {'replica2'})
+
+    def test_lag_measured_once_per_interval(self, patched_lag):
+        """Test the lag isn't queried for every read."""
+        for _ in range(3):
+            self.read_db(self.factory.get('/'))
+
+        patched_lag.assert_called_once()
+
+    def test_no_migrations_on_replicas(self, patched_lag):
+        """Test migrate never writes to a replica."""
+        self.assertFalse(self.router.allow_migrate('replica', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+
+class _Response(dict):
+    """Just enough of a response to take a cookie."""
+
+    def set_cookie(self, key, value, **kwargs):
+        self[key] = value
+
+
+# the 'default' alias stands in for the replica, so queries still run;
+# a read sent to it comes back from the router as 'default', and one
+# kept on the primary as None
+@override_settings(DATABASE_REPLICAS=['default'])
+@patch('core.db.routers.measure_lag', return_value=0.0)
+class ReplicaRoutingMiddlewareTests(TestCase):
+    """Test requests are routed and pinned through the middleware."""
+
+    def setUp(self):
+        replica_monitor.reset()
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def reads(self, client, method, url, data=None):
+        """Make a request, returning it and where its reads went."""
+        choices = []
+        original = ReplicaRouter.db_for_read
+
+        def record(self, model, **hints):
+            choices.append(original(self, model, **hints))
+            return choices[-1]
+
+        with patch.object(ReplicaRouter, 'db_for_read', record):
+            res = getattr(client, method)(url, data, format='json')
+
+        return res, choices
+
+    def test_get_reads_replica(self, patched_lag):
+        """Test a list is read from the replica."""
+        res, choices = self.reads(self.client_for(self.user), 'get', TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('default', choices)
+        self.assertNotIn(PIN_COOKIE, res.cookies)
+
+    def test_write_pins_user(self, patched_lag):
+        """Test reads just after a write stay on the primary."""
+        client = self.client_for(self.user)
+        url = reverse('recipe:tag-detail', args=[self.tag.id])
+
+        res, _ = self.reads(client, 'patch', url, {'name': 'Vegetarian'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(PIN_COOKIE, res.cookies)
+        # pinned by cookie, and by user for clients without it; the page
+        # sizes differ so the second list isn't answered from the cache
+        for page_size, follow_up in (
+            (10, client),
+            (20, self.client_for(self.user)),
+        ):
+            res, choices = self.reads(
+                follow_up, 'get', TAGS_URL, {'page_size': page_size},
+            )
+            self.assertEqual(res.data['results'][0]['name'], 'Vegetarian')
+            self.assertEqual(set(choices), {None})
+
+    def test_other_users_not_pinned(self, patched_lag):
+        """Test one user's write doesn't pin everyone to the primary."""
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        url = reverse('recipe:tag-detail', args=[self.tag.id])
+        self.reads(self.client_for(self.user), 'patch', url, {'name': 'Raw'})
+
+        _, choices = self.reads(self.client_for(other), 'get', TAGS_URL)
+
+        self.assertIn('default', choices)
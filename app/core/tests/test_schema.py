@@ -0,0 +1,151 @@
+"""
+Tests for the precomputed OpenAPI schema.
+"""
+import gzip
+import json
+import shutil
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+
+from core import schema
+
+
+SCHEMA_URL = reverse('api-schema')
+DOCS_URL = reverse('api-docs')
+
+
+class SchemaTests(SimpleTestCase):
+    """Test building and serving the schema."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        override = override_settings(SCHEMA_ROOT=self.root)
+        override.enable()
+        self.addCleanup(override.disable)
+        schema.clear_cache()
+        self.addCleanup(schema.clear_cache)
+
+    def build(self):
+        call_command('build_schema', stdout=open('/dev/null', 'w'))
+
+    def test_build_schema(self):
+        """Test the command writes hash-named files and a manifest."""
+        self.build()
+
+        manifest = json.loads((Path(self.root) / 'manifest.json').read_text())
+        path = Path(self.root) / manifest['json']
+        self.assertRegex(path.name, r'^openapi\.[0-9a-f]{16}\.json$')
+        self.assertIn('/api/recipe/recipes/', json.loads(path.read_bytes())[
+            'paths'
+        ])
+        gzipped = Path(self.root) / f'{path.name}.gz'
+        self.assertEqual(
+            gzip.decompress(gzipped.read_bytes()), path.read_bytes(),
+        )
+
+    def test_bearer_scheme(self):
+        """Test signed tokens are documented as a bearer scheme."""
+        generated = schema.SchemaGenerator().get_schema(
+            request=None, public=True,
+        )
+
+        self.assertEqual(
+            generated['components']['securitySchemes']['signedTokenAuth'],
+            {
+                'type': 'http',
+                'scheme': 'bearer',
+                'bearerFormat': 'Signed token',
+            },
+        )
+        operation = generated['paths']['/api/recipe/recipes/']['get']
+        self.assertIn({'signedTokenAuth': []}, operation['security'])
+
+    def test_serves_built_schema(self):
+        """Test the schema is served from the files without rendering."""
+        self.build()
+
+        with patch('core.schema.SchemaGenerator') as patched_generator:
+            res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        patched_generator.assert_not_called()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res['Content-Type'], 'application/vnd.oai.openapi+json',
+        )
+        self.assertIn('paths', json.loads(res.content))
+
+    def test_yaml_by_default(self):
+        """Test YAML is served unless JSON is asked for."""
+        res = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res['Content-Type'], 'application/vnd.oai.openapi')
+        self.assertTrue(res.content.startswith(b'openapi:'))
+
+    def test_fallback_when_not_built(self):
+        """Test the schema is rendered once in process if not built."""
+        res = self.client.get(SCHEMA_URL, HTTP_ACCEPT='application/json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        with patch('core.schema.SchemaGenerator') as patched_generator:
+            self.client.get(SCHEMA_URL, HTTP_ACCEPT='application/json')
+        patched_generator.assert_not_called()
+
+    def test_not_modified(self):
+        """Test a matching If-None-Match returns 304."""
+        etag = self.client.get(SCHEMA_URL)['ETag']
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+
+    def test_gzip(self):
+        """Test the gzip variant is served when accepted."""
+        plain = self.client.get(SCHEMA_URL)
+
+        res = self.client.get(SCHEMA_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.content), plain.content)
+        self.assertIn('Accept-Encoding', res['Vary'])
+
+    @patch('core.schema.brotli', None)
+    def test_brotli_not_installed(self):
+        """Test gzip is used when brotli isn't available."""
+        res = self.client.get(SCHEMA_URL, HTTP_ACCEPT_ENCODING='br, gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+
+    def test_hashed_file_immutable(self):
+        """Test a hash-named schema file can be cached forever."""
+        filename = schema.get_schema()['json'].filename
+
+        res = self.client.get(reverse('api-schema-file', args=[filename]))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('immutable', res['Cache-Control'])
+
+    def test_unknown_file(self):
+        """Test an old or unknown schema file returns 404."""
+        res = self.client.get(
+            reverse('api-schema-file', args=['openapi.0.json']),
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_docs_use_hashed_file(self):
+        """Test the Swagger UI loads the hash-named JSON schema."""
+        filename = schema.get_schema()['json'].filename
+
+        res = self.client.get(DOCS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertContains(res, filename)
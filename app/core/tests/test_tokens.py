@@ -0,0 +1,219 @@
+"""
+Tests for signed access and refresh tokens.
+"""
+from array import array
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import tokens
+
+
+TOKEN_URL = reverse('user:token')
+REFRESH_URL = reverse('user:token-refresh')
+REVOKE_URL = reverse('user:token-revoke')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class TokenTests(TestCase):
+    """Test encoding and decoding signed tokens."""
+
+    def setUp(self):
+        tokens.revocations.sync(force=True)
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+
+    def test_round_trip(self):
+        """Test an issued access token decodes to the user's claims."""
+        pair = tokens.issue_tokens(self.user)
+
+        claims = tokens.decode_token(pair['access'], tokens.ACCESS)
+
+        self.assertEqual(claims['uid'], self.user.id)
+        self.assertEqual(claims['email'], self.user.email)
+
+    def test_tampered_token_rejected(self):
+        """Test changing the payload invalidates the signature."""
+        kid, payload, signature = tokens.issue_tokens(
+            self.user
+        )['access'].split('.')
+        other = tokens.encode_token({'uid': 0}).split('.')[1]
+
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.decode_token(f'{kid}.{other}.{signature}', tokens.ACCESS)
+
+    def test_wrong_type_rejected(self):
+        """Test a refresh token can't be used as an access token."""
+        pair = tokens.issue_tokens(self.user)
+
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.decode_token(pair['refresh'], tokens.ACCESS)
+
+    @patch('core.tokens.time.time')
+    def test_expired_token_rejected(self, patched_time):
+        """Test tokens stop working after they expire."""
+        patched_time.return_value = 1000
+        pair = tokens.issue_tokens(self.user)
+
+        patched_time.return_value = 1000 + 3600
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.decode_token(pair['access'], tokens.ACCESS)
+
+    def test_key_rotation(self):
+        """Test tokens signed with an old key verify until it's removed."""
+        keys = {'old': 'old-secret', 'new': 'new-secret'}
+        with self.settings(SIGNED_TOKEN_KEYS=keys,
+                           SIGNED_TOKEN_ACTIVE_KEY='old'):
+            token = tokens.issue_tokens(self.user)['access']
+
+        with self.settings(SIGNED_TOKEN_KEYS=keys,
+                           SIGNED_TOKEN_ACTIVE_KEY='new'):
+            tokens.decode_token(token, tokens.ACCESS)
+            self.assertTrue(
+                tokens.issue_tokens(self.user)['access'].startswith('new.')
+            )
+
+        with self.settings(SIGNED_TOKEN_KEYS={'new': 'new-secret'},
+                           SIGNED_TOKEN_ACTIVE_KEY='new'):
+            with self.assertRaises(tokens.InvalidToken):
+                tokens.decode_token(token, tokens.ACCESS)
+
+    def test_revocation_list(self):
+        """Test revoked ids are found and others aren't."""
+        revocations = tokens.RevocationList()
+        revocations.revoke(42, expires_at=4102444800)
+        revocations.revoke(7, expires_at=4102444800)
+
+        self.assertTrue(revocations.is_revoked(1, 42))
+        self.assertFalse(revocations.is_revoked(8))
+        self.assertFalse(revocations.revoke(42, expires_at=4102444800))
+        self.assertEqual(revocations._ids.itemsize, 8)
+
+    @override_settings(SIGNED_TOKEN_REVOCATION_SYNC=0)
+    def test_revocation_seen_by_other_process(self):
+        """Test a revocation from another process is picked up on sync."""
+        pair = tokens.issue_tokens(self.user)
+        claims = tokens.decode_token(pair['access'], tokens.ACCESS)
+
+        tokens.RevocationList().revoke(claims['sid'], claims['exp'])
+
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.decode_token(pair['access'], tokens.ACCESS)
+
+
+class SignedTokenApiTests(TestCase):
+    """Test logging in and authenticating with signed tokens."""
+
+    def setUp(self):
+        tokens.revocations.sync(force=True)
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client = APIClient()
+
+    def login(self):
+        res = self.client.post(TOKEN_URL, {
+            'email': 'user@example.com',
+            'password': 'testpass123',
+            'token_type': 'signed',
+        })
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return res.data
+
+    def test_login_returns_token_pair(self):
+        """Test asking for a signed token returns an access/refresh pair."""
+        pair = self.login()
+
+        self.assertIn('access', pair)
+        self.assertIn('refresh', pair)
+        self.assertEqual(pair['token_type'], 'Bearer')
+
+    def test_default_login_returns_db_token(self):
+        """Test the default login still returns a database token."""
+        res = self.client.post(TOKEN_URL, {
+            'email': 'user@example.com',
+            'password': 'testpass123',
+        })
+
+        self.assertIn('token', res.data)
+
+    def test_recipes_authenticated_without_user_lookup(self):
+        """Test a bearer token authenticates without loading the user."""
+        pair = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {pair['access']}")
+
+        # only the recipes are queried, never the token or user
+        with self.assertNumQueries(1):
+            self.client.get(RECIPES_URL, {'page_size': 1, 'count': 0})
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Sample recipe',
+            'time_minutes': 5,
+            'price': '1.00',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            self.user.recipe_set.get().title, 'Sample recipe',
+        )
+
+    def test_invalid_bearer_token_rejected(self):
+        """Test a forged bearer token is rejected."""
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer a.b.c')
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh(self):
+        """Test a refresh token gets a new pair, and only works once."""
+        pair = self.login()
+
+        res = self.client.post(REFRESH_URL, {'refresh': pair['refresh']})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data['access'], pair['access'])
+
+        res = self.client.post(REFRESH_URL, {'refresh': pair['refresh']})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_refresh_replayed_to_another_process(self):
+        """Test a refresh token can't be reused before processes sync."""
+        pair = self.login()
+        res = self.client.post(REFRESH_URL, {'refresh': pair['refresh']})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        # a worker that hasn't synced the revocation yet
+        tokens.revocations._ids = array('Q')
+        res = self.client.post(REFRESH_URL, {'refresh': pair['refresh']})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertNotIn('access', res.data)
+
+    def test_refresh_inactive_user(self):
+        """Test a deactivated user can't refresh."""
+        pair = self.login()
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.post(REFRESH_URL, {'refresh': pair['refresh']})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_session(self):
+        """Test revoking a refresh token revokes its access tokens too."""
+        pair = self.login()
+
+        res = self.client.post(REVOKE_URL, {'refresh': pair['refresh']})
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {pair['access']}")
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,198 @@
+"""
+Signed, stateless access and refresh tokens.
+
+A token is '<key id>.<payload>.<signature>', where the payload is
+base64 encoded JSON and the signature is an HMAC-SHA256 over the key id
+and payload. Verifying one needs no database or cache lookup, only the
+signing keys and the in-memory revocation list.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import RevokedToken
+
+
+ACCESS = 'access'
+REFRESH = 'refresh'
+
+
+class InvalidToken(Exception):
+    """Raised when a token is malformed, forged, expired or revoked."""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _signing_key(kid):
+    """Return the HMAC key for a key id."""
+    try:
+        secret = settings.SIGNED_TOKEN_KEYS[kid]
+    except KeyError:
+        raise InvalidToken('Unknown signing key.')
+    # derive a dedicated key, so the configured secret is never used
+    # directly as an HMAC key for anything else
+    return hashlib.sha256(f'signed-token:{secret}'.encode()).digest()
+
+
+def _sign(kid, payload):
+    return hmac.new(
+        _signing_key(kid),
+        f'{kid}.{payload}'.encode(),
+        hashlib.sha256,
+    ).digest()
+
+
+def encode_token(claims):
+    """Return a signed token for claims, using the active key."""
+    kid = settings.SIGNED_TOKEN_ACTIVE_KEY
+    payload = _b64encode(
+        json.dumps(claims, separators=(',', ':')).encode()
+    )
+
+    return f'{kid}.{payload}.{_b64encode(_sign(kid, payload))}'
+
+
+def decode_token(token, token_type):
+    """Return the claims in a token, raising InvalidToken if it is bad."""
+    try:
+        kid, payload, signature = token.split('.')
+        signature = _b64decode(signature)
+    except (ValueError, binascii.Error):
+        raise InvalidToken('Malformed token.')
+    # any configured key verifies, so tokens signed before a rotation
+    # keep working until the old key is removed
+    if not hmac.compare_digest(_sign(kid, payload), signature):
+        raise InvalidToken('Invalid signature.')
+    try:
+        claims = json.loads(_b64decode(payload))
+        if claims['typ'] != token_type:
+            raise InvalidToken('Wrong token type.')
+        expired = claims['exp'] <= time.time()
+        revoked = revocations.is_revoked(claims['jti'], claims['sid'])
+    except (ValueError, binascii.Error, KeyError, TypeError):
+        raise InvalidToken('Malformed token.')
+    if expired:
+        raise InvalidToken('Token has expired.')
+    if revoked:
+        raise InvalidToken('Token has been revoked.')
+
+    return claims
+
+
+def _new_id():
+    # 63 bits, so ids fit a signed 64-bit database column
+    return secrets.randbits(63)
+
+
+def issue_tokens(user, session_id=None):
+    """Return a new access and refresh token pair for user."""
+    now = int(time.time())
+    session_id = session_id or _new_id()
+    access = {
+        'typ': ACCESS,
+        'uid': user.pk,
+        'email': user.email,
+        'sid': session_id,
+        'jti': _new_id(),
+        'exp': now + settings.SIGNED_TOKEN_ACCESS_TTL,
+    }
+    refresh = dict(
+        access,
+        typ=REFRESH,
+        jti=_new_id(),
+        exp=now + settings.SIGNED_TOKEN_REFRESH_TTL,
+    )
+
+    return {
+        'access': encode_token(access),
+        'refresh': encode_token(refresh),
+        'token_type': 'Bearer',
+        'expires_in': settings.SIGNED_TOKEN_ACCESS_TTL,
+    }
+
+
+class RevocationList:
+    """
+    In-memory set of revoked token and session ids.
+
+    Ids are kept in a sorted array of unsigned 64-bit integers (8 bytes
+    each) and looked up by bisection. An id is only kept until every
+    token it could match has expired anyway.
+
+    Revocations are stored in the RevokedToken table. Each process reloads
+    them at most every SIGNED_TOKEN_REVOCATION_SYNC seconds, so checking a
+    token costs no I/O in between.
+    """
+
+    def __init__(self):
+        self._ids = array('Q')
+        self._synced_at = None
+        self._lock = threading.Lock()
+
+    def _contains(self, value):
+        ids = self._ids
+        index = bisect_left(ids, value)
+        return index < len(ids) and ids[index] == value
+
+    def sync(self, force=False):
+        """Reload the revocations from the database if they are stale."""
+        now = time.monotonic()
+        interval = settings.SIGNED_TOKEN_REVOCATION_SYNC
+        if not force and self._synced_at is not None and \
+                now - self._synced_at < interval:
+            return
+        with self._lock:
+            self._ids = array('Q', RevokedToken.objects.filter(
+                expires_at__gt=timezone.now(),
+            ).order_by('jti').values_list('jti', flat=True))
+            self._synced_at = now
+
+    def is_revoked(self, *ids):
+        """Return whether any of ids has been revoked."""
+        self.sync()
+        return any(self._contains(value) for value in ids)
+
+    def revoke(self, value, expires_at):
+        """
+        Revoke an id until expires_at, a unix timestamp.
+
+        Returns False if it was already revoked, by any process, so a
+        caller can use the first revocation as a claim on the id.
+        """
+        _, created = RevokedToken.objects.get_or_create(
+            jti=value,
+            defaults={
+                'expires_at': datetime.fromtimestamp(expires_at, timezone.utc),
+            },
+        )
+        # expired revocations can't match a valid token any more
+        RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+        # other processes pick this up on their next sync
+        with self._lock:
+            if not self._contains(value):
+                self._ids.insert(bisect_left(self._ids, value), value)
+
+        return created
+
+    def __len__(self):
+        return len(self._ids)
+
+
+revocations = RevocationList()
@@ -1,10 +1,123 @@
 """
 Core view for app.
 """
-from rest_framework.decorators import api_view
-from rest_framework.response import Response
+import re
 
-@api_view(['GET'])
+from django.http import Http404, HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_safe
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SpectacularSwaggerView
+
+from core.db.pool import get_pool
+from core.health import database_check
+from core.schema import get_schema
+
+
+# plain Django views rather than DRF ones, so a probe never runs the
+# authentication, content negotiation or schema machinery.
+# core.middleware.HealthCheckMiddleware answers them before the session
+# and auth middleware run as well.
+@require_safe
 def health_check(request):
     """Returns successful response."""
-    return Response({'healthy': True})
\ No newline at end of file
+    return JsonResponse({'healthy': True})
+
+
+@require_safe
+def readiness_check(request):
+    """Returns whether the app can serve requests."""
+    if database_check():
+        data = {'ready': True, 'database': 'ok'}
+        # checkout wait times show whether the pool is big enough
+        pool = get_pool('default')
+        if pool is not None:
+            data['pool'] = pool.stats()
+        return JsonResponse(data)
+
+    return JsonResponse(
+        {'ready': False, 'database': 'unavailable'},
+        status=503,
+    )
+
+
+def _accepted_encodings(request):
+    """Return the content codings the client accepts."""
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if not re.match(r'\s*q=0(\.0*)?\s*$', params):
+            accepted.add(coding.strip().lower())
+
+    return accepted
+
+
+def _schema_response(request, artifact):
+    """Return artifact, compressed if the client accepts it."""
+    client_etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if artifact.etag in client_etags:
+        response = HttpResponse(status=304)
+    else:
+        accepted = _accepted_encodings(request)
+        # smallest first
+        for encoding in ('br', 'gzip'):
+            if encoding in accepted and encoding in artifact.encoded:
+                response = HttpResponse(
+                    artifact.encoded[encoding],
+                    content_type=artifact.media_type,
+                )
+                response['Content-Encoding'] = encoding
+                break
+        else:
+            response = HttpResponse(
+                artifact.content, content_type=artifact.media_type,
+            )
+    response['ETag'] = artifact.etag
+    patch_vary_headers(response, ['Accept', 'Accept-Encoding'])
+
+    return response
+
+
+@require_safe
+def schema(request):
+    """Returns the current OpenAPI schema, YAML unless JSON is asked for."""
+    fmt = request.GET.get('format')
+    if fmt is None:
+        accept = request.META.get('HTTP_ACCEPT', '')
+        fmt = 'json' if 'json' in accept else 'yaml'
+    artifacts = get_schema()
+    if fmt not in artifacts:
+        raise Http404('Unknown schema format.')
+
+    response = _schema_response(request, artifacts[fmt])
+    # the current schema changes on deploy, so always revalidate
+    patch_cache_control(response, no_cache=True)
+
+    return response
+
+
+@require_safe
+def schema_file(request, filename):
+    """Returns one build of the schema, named after its content hash."""
+    for artifact in get_schema().values():
+        if artifact.filename == filename:
+            response = _schema_response(request, artifact)
+            patch_cache_control(
+                response, public=True, max_age=31536000, immutable=True,
+            )
+            return response
+
+    raise Http404('Unknown schema file.')
+
+
+class SchemaSwaggerView(SpectacularSwaggerView):
+    """Swagger UI loading the hash-named, immutable JSON schema."""
+
+    @extend_schema(exclude=True)
+    def get(self, request, *args, **kwargs):
+        self.url = reverse(
+            'api-schema-file', args=[get_schema()['json'].filename],
+        )
+        return super().get(request, *args, **kwargs)
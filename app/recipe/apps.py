@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class RecipeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipe'
+
+    def ready(self):
+        # connect the signal receivers
+        from recipe import (  # noqa: F401
+            cache,
+            cookable,
+            search,
+            signals,
+            usage,
+        )
@@ -0,0 +1,137 @@
+"""
+Bulk import and export of recipes.
+"""
+from itertools import islice
+
+from django.db import connection, transaction
+from rest_framework.renderers import JSONRenderer
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe.querysets import nested_prefetches
+from recipe.relations import (
+    add_links,
+    get_or_create_named,
+    unique_names,
+)
+from recipe.search import update_search_vectors
+from recipe.signals import user_data_changed
+
+
+def chunked(iterable, size):
+    """Yield lists of up to size items from iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _bulk_create_recipes(recipes):
+    """Insert recipes, making sure each gets its primary key."""
+    if connection.features.can_return_rows_from_bulk_insert:
+        Recipe.objects.bulk_create(recipes)
+    else:
+        # backends that can't return the new ids (SQLite before
+        # Django 4.0) fall back to one insert per recipe
+        for recipe in recipes:
+            recipe.save(force_insert=True)
+
+
+def _import_chunk(rows, serializer_class, context):
+    """Validate and insert one chunk of rows, returning their results."""
+    user = context['request'].user
+    results = []
+    valid = []
+    for line, data, error in rows:
+        if error:
+            results.append({
+                'line': line,
+                'status': 'error',
+                'errors': {'non_field_errors': [error]},
+            })
+            continue
+        serializer = serializer_class(data=data, context=context)
+        if serializer.is_valid():
+            valid.append((line, serializer.validated_data))
+        else:
+            results.append({
+                'line': line,
+                'status': 'error',
+                'errors': serializer.errors,
+            })
+
+    if not valid:
+        return results
+
+    with transaction.atomic():
+        recipes = []
+        for line, validated_data in valid:
+            fields = {
+                key: value for key, value in validated_data.items()
+                if key not in ('tags', 'ingredients')
+            }
+            recipes.append(Recipe(user=user, **fields))
+        _bulk_create_recipes(recipes)
+
+        # resolve the names used by the whole chunk at once, then link
+        # them in a single insert per relation
+        for field, model in (('tags', Tag), ('ingredients', Ingredient)):
+            items = [
+                item for _, validated_data in valid
+                for item in validated_data.get(field, [])
+            ]
+            objs = get_or_create_named(model, user, unique_names(items))
+            add_links(field, [
+                (recipe.id, objs[name].id)
+                for recipe, (_, validated_data) in zip(recipes, valid)
+                for name in unique_names(validated_data.get(field, []))
+            ])
+        # bulk inserts send no model signals
+        user_data_changed.send(sender=Recipe, user_id=user.pk)
+        update_search_vectors(recipe.id for recipe in recipes)
+
+    for recipe, (line, _) in zip(recipes, valid):
+        results.append({'line': line, 'status': 'created', 'id': recipe.id})
+
+    return sorted(results, key=lambda result: result['line'])
+
+
+def import_recipes(rows, serializer_class, context, chunk_size):
+    """
+    Create recipes from (line, data, error) rows.
+
+    Rows are validated and inserted chunk by chunk, each chunk in its
+    own transaction. Returns a result for every row in line order.
+    """
+    results = []
+    for rows_chunk in chunked(rows, chunk_size):
+        results.extend(_import_chunk(rows_chunk, serializer_class, context))
+
+    return results
+
+
+def export_recipes(queryset, serializer_class, chunk_size):
+    """
+    Yield recipes in queryset as NDJSON lines.
+
+    The ids are streamed with .iterator() and each chunk of recipes is
+    loaded with its relations prefetched, so memory use depends on the
+    chunk size rather than the number of recipes.
+    """
+    renderer = JSONRenderer()
+    fields = serializer_class.Meta.fields
+    ordering = queryset.query.order_by
+    ids = queryset.values_list('id', flat=True).iterator(
+        chunk_size=chunk_size,
+    )
+    for id_chunk in chunked(ids, chunk_size):
+        recipes = Recipe.objects.filter(
+            id__in=id_chunk,
+        ).order_by(*ordering).prefetch_related(*nested_prefetches(fields))
+        for data in serializer_class(recipes, many=True).data:
+            yield renderer.render(data) + b'\n'
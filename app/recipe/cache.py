@@ -0,0 +1,192 @@
+"""
+Per-user caching of recipe API responses.
+
+Every user has a generation counter in the cache. Cache keys and ETags
+include the current generation, so bumping it on any write invalidates
+all of the user's cached responses at once, in every worker sharing the
+cache, and every ETag a client holds for them. That only holds when
+the workers share the cache, so lists aren't cached and ETags are left
+off otherwise.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipe.filters import FILTER_FIELDS, MODES
+from recipe.signals import user_data_changed
+
+
+# query parameters holding comma separated IDs, whose order doesn't
+# change the result
+ID_LIST_PARAMS = {'tags', 'ingredients'} | {
+    f'{field}_{mode}' for field in FILTER_FIELDS for mode in MODES
+}
+# neither does the order fields are asked for in
+UNORDERED_LIST_PARAMS = ID_LIST_PARAMS | {'fields', 'omit'}
+
+
+def get_cache():
+    """Return the cache used for recipe responses."""
+    return caches[settings.RECIPE_CACHE_ALIAS]
+
+
+def _generation_key(user_id):
+    return f'recipe:generation:{user_id}'
+
+
+def get_generation(user_id):
+    """Return the current cache generation for a user."""
+    cache = get_cache()
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # seed from the clock, so a counter lost to eviction or a
+        # restart never comes back with a value that was used before
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+
+    return generation
+
+
+def bump_generation(user_id):
+    """Move a user on to a new cache generation."""
+    cache = get_cache()
+    try:
+        cache.incr(_generation_key(user_id))
+    except ValueError:
+        # no counter yet, so nothing is cached under this user
+        get_generation(user_id)
+
+
+def invalidate_user(user_id):
+    """Invalidate all of a user's cached responses."""
+    bump_generation(user_id)
+    # a read between now and the commit could still cache the old rows
+    # under the new generation, so bump again once the writes are visible
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: bump_generation(user_id))
+
+
+@receiver(user_data_changed)
+def _user_data_changed(sender, user_id, **kwargs):
+    invalidate_user(user_id)
+
+
+def normalize_query_params(query_params):
+    """Return query params in a canonical, hashable form."""
+    normalized = []
+    for key in sorted(query_params):
+        values = query_params.getlist(key)
+        if key in UNORDERED_LIST_PARAMS:
+            values = [
+                ','.join(sorted({
+                    value.strip()
+                    for param in values
+                    for value in param.split(',')
+                    if value.strip()
+                }))
+            ]
+        normalized.append((key, sorted(values)))
+
+    return normalized
+
+
+class CachedListMixin:
+    """Serve list responses from a per-user cache."""
+
+    def get_list_cache_key(self):
+        """Return the cache key for the current list request."""
+        request = self.request
+        user_id = request.user.pk
+        raw = repr((
+            request.get_host(),
+            request.path,
+            normalize_query_params(request.query_params),
+        ))
+        digest = hashlib.md5(raw.encode()).hexdigest()
+
+        return f'recipe:list:{user_id}:{get_generation(user_id)}:{digest}'
+
+    def list(self, request, *args, **kwargs):
+        """Return the cached list response, building it on a miss."""
+        if not settings.RECIPE_CACHE_SHARED:
+            # other workers' writes wouldn't invalidate this copy
+            return super().list(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = self.get_list_cache_key()
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        cache.set(key, response.data, settings.RECIPE_CACHE_TIMEOUT)
+
+        return response
+
+
+class ConditionalGetMixin:
+    """
+    Answer If-None-Match with 304 Not Modified.
+
+    The ETag comes from the user's cache generation rather than from a
+    hash of the body, so a matching request is answered before the
+    queryset is evaluated or serialized. Without RECIPE_CACHE_SHARED
+    there's no ETag, as another worker's generation would differ.
+
+    Views with a detail GET wrap retrieve() in conditional_response()
+    themselves, so views without one keep answering it with 405.
+    """
+
+    def get_etag(self):
+        """Return the ETag for the current request, or None."""
+        if not settings.RECIPE_CACHE_SHARED:
+            return None
+        request = self.request
+        raw = repr((
+            get_generation(request.user.pk),
+            request.path,
+            normalize_query_params(request.query_params),
+            request.accepted_renderer.format,
+        ))
+
+        return f'"{hashlib.md5(raw.encode()).hexdigest()}"'
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        """Return 304 if the client's copy is current, else run handler."""
+        etag = self.get_etag()
+        client_etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if '*' in client_etags and self.detail:
+            # '*' only matches a representation that exists, so look the
+            # object up, raising 404 for a missing or another user's one
+            self.get_object()
+        if '*' in client_etags or etag in client_etags:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+
+        if response.status_code in (
+            status.HTTP_200_OK,
+            status.HTTP_304_NOT_MODIFIED,
+        ):
+            if etag:
+                response['ETag'] = etag
+            # responses are per user, so shared caches mustn't keep them
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Authorization'])
+
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """Return the list, or 304 if it hasn't changed."""
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
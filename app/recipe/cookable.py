@@ -0,0 +1,76 @@
+"""
+Find the recipes a user can cook with the ingredients they have.
+
+Every recipe stores how many ingredients it has (Recipe.ingredient_count),
+so coverage is a single query: count the recipe's links to the given
+ingredients through the indexed link table and subtract that from the
+stored total. Only recipes sharing at least one ingredient, or small
+enough to miss no more than max_missing anyway, are looked at.
+"""
+from django.db.models import (
+    Count,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+)
+from django.db.models.functions import Coalesce
+
+from core.models import Recipe
+
+
+IngredientLink = Recipe.ingredients.through
+
+
+def _link_count(links):
+    """Return a subquery counting the outer recipe's links in links."""
+    return Coalesce(
+        Subquery(
+            links.filter(
+                recipe_id=OuterRef('pk'),
+            ).order_by().values('recipe_id').annotate(
+                count=Count('*'),
+            ).values('count'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def update_ingredient_counts(recipe_ids):
+    """Recount the ingredients of recipes."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    # counted by the UPDATE itself, so a concurrent link change can't
+    # leave a count from before it
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        ingredient_count=_link_count(IngredientLink.objects.all()),
+    )
+
+
+def cookable_recipes(queryset, ingredient_ids, max_missing):
+    """
+    Filter queryset to recipes missing at most max_missing ingredients.
+
+    Recipes are annotated with matched_count and missing_count, and
+    should be ordered by fewest missing first.
+    """
+    ingredient_ids = list(ingredient_ids)
+    if not ingredient_ids:
+        # only recipes small enough to miss everything qualify
+        return queryset.filter(ingredient_count__lte=max_missing).annotate(
+            matched_count=Value(0, output_field=IntegerField()),
+            missing_count=F('ingredient_count'),
+        )
+    links = IngredientLink.objects.filter(ingredient_id__any=ingredient_ids)
+
+    return queryset.filter(
+        Q(ingredient_count__lte=max_missing) |
+        Q(pk__in=links.values('recipe_id'))
+    ).annotate(
+        matched_count=_link_count(links),
+        missing_count=F('ingredient_count') - F('matched_count'),
+    ).filter(missing_count__lte=max_missing)
@@ -0,0 +1,54 @@
+"""
+Tag and ingredient filters for the recipe list.
+
+Each relation takes three filters: <field>_all (has every one),
+<field>_any (has at least one) and <field>_none (has none of them).
+They compile to subqueries on the link table, never to a join with the
+recipe rows, so no DISTINCT is needed however many IDs are given:
+
+    any   EXISTS (SELECT 1 FROM links WHERE recipe_id = r.id
+                  AND tag_id = ANY(...))
+    none  NOT EXISTS (...the same...)
+    all   r.id IN (SELECT recipe_id FROM links WHERE tag_id = ANY(...)
+                   GROUP BY recipe_id HAVING COUNT(*) = <number of IDs>)
+
+The link tables are unique on (recipe_id, tag_id), so the count can only
+reach the number of IDs if every one of them is linked.
+"""
+from django.db.models import Count, Exists, OuterRef
+
+from recipe.relations import through_fields
+
+
+# relations that can be filtered on
+FILTER_FIELDS = ('tags', 'ingredients')
+MODES = ('all', 'any', 'none')
+
+
+def filter_related(queryset, field, mode, ids):
+    """Filter recipes on their links to ids through a relation."""
+    ids = set(ids)
+    if not ids:
+        return queryset
+    through, source, target = through_fields(field)
+    links = through.objects.filter(**{f'{target}__any': ids})
+
+    if mode == 'all':
+        return queryset.filter(pk__in=links.values(source).annotate(
+            linked=Count('*'),
+        ).filter(linked=len(ids)).values(source))
+
+    linked = Exists(links.filter(**{source: OuterRef('pk')}))
+    if mode == 'any':
+        return queryset.filter(linked)
+    if mode == 'none':
+        return queryset.filter(~linked)
+    raise ValueError(f'Unknown filter mode {mode!r}.')
+
+
+def apply_filters(queryset, filters):
+    """Apply {(field, mode): ids} filters to a recipe queryset."""
+    for (field, mode), ids in filters.items():
+        queryset = filter_related(queryset, field, mode, ids)
+
+    return queryset
@@ -0,0 +1,95 @@
+"""
+Disk cache for images resized on demand.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+
+
+class DiskLRUCache:
+    """
+    Files on disk, evicted least recently used first by total size.
+
+    Reads bump the file's mtime, so the mtimes give the LRU order across
+    every process sharing the directory. Each process counts the bytes it
+    writes and, once the count passes max_bytes, scans the directory and
+    deletes the oldest files until the total is back under low_water of
+    max_bytes.
+    """
+
+    def __init__(self, root, max_bytes, low_water=0.9):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._bytes = None
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.root, digest[:2], digest)
+
+    def get(self, key):
+        """Return the bytes stored under key, or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as cached:
+                data = cached.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted, possibly by another process between open and utime
+            return None
+
+        return data
+
+    def set(self, key, data):
+        """Store data under key, evicting old entries if over the limit."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first, so readers never see a
+        # partial file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as cached:
+            cached.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = self.total_bytes()
+            else:
+                self._bytes += len(data)
+            if self._bytes > self.max_bytes:
+                self._bytes = self.evict(int(self.max_bytes * self.low_water))
+
+    def _entries(self):
+        """Return (mtime, size, path) for every cached file."""
+        entries = []
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        return entries
+
+    def total_bytes(self):
+        """Return the size of every cached file."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, target_bytes):
+        """Delete the least recently used files down to target_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= target_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+        return total
@@ -0,0 +1,628 @@
+"""
+Background processing of recipe image uploads.
+
+The upload view only moves the file into a staging directory and queues
+a job. A worker then verifies the image, drops its metadata, writes
+resized JPEG and WebP variants to the media storage and swaps them onto
+the recipe in one transaction.
+
+Processed files belong to an ImageBlob keyed by the hash of the upload,
+so an image uploaded to many recipes is processed and stored once.
+"""
+import hashlib
+import io
+import logging
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import connections, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
+
+from core.models import ImageBlob, ImageStatus, Recipe
+from recipe.image_cache import DiskLRUCache
+from recipe.signals import user_data_changed
+
+
+logger = logging.getLogger(__name__)
+
+# format: (Pillow format, file extension, save options)
+FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'quality': 85, 'optimize': True,
+                             'progressive': True}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+}
+
+
+class InvalidImage(Exception):
+    """Raised when an upload isn't an image we can process."""
+
+
+class ThreadPoolBackend:
+    """Run jobs on a pool of threads in the current process."""
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _run(self, func, *args):
+        try:
+            func(*args)
+        except Exception:
+            logger.exception('Image job %s%r failed.', func.__name__, args)
+        finally:
+            # the thread's connections would otherwise stay open
+            connections.close_all()
+
+    def submit(self, func, *args):
+        # created on first use, so uwsgi workers each get their own
+        # threads after forking
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.RECIPE_IMAGE_WORKERS,
+                    thread_name_prefix='recipe-images',
+                )
+        self._executor.submit(self._run, func, *args)
+
+
+class MemoryBackend:
+    """Keep jobs in memory until run_pending() is called, for tests."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, func, *args):
+        self.jobs.append((func, args))
+
+    def run_pending(self):
+        """Run the queued jobs in order."""
+        while self.jobs:
+            func, args = self.jobs.pop(0)
+            func(*args)
+
+
+BACKENDS = {
+    'thread': ThreadPoolBackend,
+    'memory': MemoryBackend,
+}
+_backends = {}
+
+
+def get_backend():
+    """Return the configured job backend."""
+    name = settings.RECIPE_IMAGE_BACKEND
+    if name not in _backends:
+        _backends[name] = BACKENDS[name]()
+
+    return _backends[name]
+
+
+def enqueue(func, *args):
+    """Queue a job once the current transaction commits."""
+    transaction.on_commit(lambda: get_backend().submit(func, *args))
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Hash uploaded files as the request body is read.
+
+    Passes the data on unchanged, so the next handler still stores the
+    file. The SHA-256 of each file is left in hashes, by field name.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.hashes = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self._hash = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._hash.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.hashes[self.field_name] = self._hash.hexdigest()
+
+
+def stage_upload(uploaded_file, digest=None):
+    """
+    Move an upload into the staging directory.
+
+    Returns its (id, SHA-256), hashing it on the way if digest isn't
+    given.
+    """
+    os.makedirs(settings.RECIPE_IMAGE_STAGING_ROOT, exist_ok=True)
+    upload_id = uuid.uuid4()
+    path = staged_path(upload_id)
+    sha256 = hashlib.sha256() if digest is None else None
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        # large uploads are already on disk, so just move them
+        shutil.move(uploaded_file.temporary_file_path(), path)
+        if sha256 is not None:
+            with open(path, 'rb') as staged:
+                for chunk in iter(lambda: staged.read(64 * 1024), b''):
+                    sha256.update(chunk)
+    else:
+        with open(path, 'wb') as staged:
+            for chunk in uploaded_file.chunks():
+                if sha256 is not None:
+                    sha256.update(chunk)
+                staged.write(chunk)
+    if sha256 is not None:
+        digest = sha256.hexdigest()
+
+    return upload_id, digest
+
+
+def staged_path(upload_id):
+    return os.path.join(settings.RECIPE_IMAGE_STAGING_ROOT, str(upload_id))
+
+
+def open_image(fp):
+    """Return the fully decoded, upright RGB image in a path or file."""
+    try:
+        with Image.open(fp) as image:
+            width, height = image.size
+            if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+                raise InvalidImage('Image is too large.')
+            image.verify()
+        # verify() leaves the image unusable, so open it again to decode
+        if hasattr(fp, 'seek'):
+            fp.seek(0)
+        with Image.open(fp) as image:
+            image.load()
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # flatten transparency onto white, JPEG has no alpha
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            return image.convert('RGB')
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise InvalidImage('Upload is not a valid image.')
+
+
+def render_variants(image, digest, sizes=None):
+    """
+    Save resized variants of the image whose upload hashed to digest.
+
+    Returns {size: {'width': ..., 'height': ..., format: name, ...}}.
+    """
+    variants = {}
+    for size, max_dimension in (sizes or settings.RECIPE_IMAGE_SIZES).items():
+        resized = image.copy()
+        resized.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        variants[size] = {'width': resized.width, 'height': resized.height}
+        for fmt, (pillow_format, extension, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            # no exif/icc arguments, so no metadata is carried over
+            resized.save(buffer, pillow_format, **options)
+            name = blob_name(digest, size, extension)
+            if not default_storage.exists(name):
+                name = default_storage.save(
+                    name, ContentFile(buffer.getvalue()),
+                )
+            variants[size][fmt] = name
+
+    return variants
+
+
+def variant_names(variants):
+    """Return the storage names in a variants mapping."""
+    return {
+        variant[fmt]
+        for variant in variants.values()
+        for fmt in FORMATS
+        if fmt in variant
+    }
+
+
+def srcset(variants, url):
+    """
+    Return {format: srcset} for a variants mapping.
+
+    url turns a storage name into the URL to use, e.g. an absolute one.
+    """
+    ordered = sorted(variants.values(), key=lambda variant: variant['width'])
+    return {
+        fmt: ', '.join(
+            f"{url(variant[fmt])} {variant['width']}w"
+            for variant in ordered
+            if fmt in variant
+        )
+        for fmt in FORMATS
+    }
+
+
+def image_names(recipe):
+    """Return the storage names of all of a recipe's image files."""
+    names = variant_names(recipe.image_variants)
+    if recipe.image:
+        names.add(recipe.image.name)
+
+    return names
+
+
+def delete_files(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def blob_name(digest, size, extension):
+    """Return the storage name of a blob's variant file."""
+    return os.path.join('uploads', 'recipe', f'{digest}-{size}.{extension}')
+
+
+def missing_sizes(variants):
+    """Return the configured sizes that variants doesn't have."""
+    return {
+        size: max_dimension
+        for size, max_dimension in settings.RECIPE_IMAGE_SIZES.items()
+        if size not in variants
+    }
+
+
+def attach_blob(recipe, digest, variants, source):
+    """
+    Point a locked recipe at the blob for digest.
+
+    Creates the blob, or adds the variants it is missing, takes a
+    reference on it and releases the recipe's previous image. The caller
+    saves the recipe.
+    """
+    blob, created = ImageBlob.objects.select_for_update().get_or_create(
+        sha256=digest,
+        defaults={'variants': variants},
+    )
+    blob.variants = {**variants, **blob.variants}
+    sizes = missing_sizes(blob.variants)
+    if sizes:
+        # gc_recipe_images deleted the blob after we looked it up
+        blob.variants.update(
+            render_variants(open_image(source), digest, sizes)
+        )
+
+    if recipe.image_blob_id is not None and recipe.image_blob_id != blob.id:
+        release_blob(recipe.image_blob_id)
+    elif recipe.image_blob_id is None and recipe.image:
+        # files from before blobs belong to this recipe alone
+        old_names = set(image_names(recipe)) - set(
+            variant_names(blob.variants)
+        )
+        transaction.on_commit(lambda: delete_files(old_names))
+    if recipe.image_blob_id != blob.id:
+        blob.ref_count += 1
+        blob.released_at = None
+    blob.save()
+
+    recipe.image_blob = blob
+    recipe.image_variants = blob.variants
+    recipe.image.name = blob.variants[
+        settings.RECIPE_IMAGE_DEFAULT_SIZE
+    ]['jpeg']
+
+
+def release_blob(blob_id):
+    """Drop a reference to a blob."""
+    with transaction.atomic():
+        blob = ImageBlob.objects.select_for_update().filter(
+            pk=blob_id,
+        ).first()
+        if blob is None:
+            return
+        blob.ref_count = max(0, blob.ref_count - 1)
+        if blob.ref_count == 0:
+            # deleted by the next gc_recipe_images after a grace period,
+            # so a worker that just looked the blob up can still use it
+            blob.released_at = timezone.now()
+        blob.save(update_fields=['ref_count', 'released_at'])
+
+
+def render_blob_variants(fp, digest):
+    """Render the sizes the blob for digest is missing from an image."""
+    blob = ImageBlob.objects.filter(sha256=digest).first()
+    sizes = missing_sizes(blob.variants if blob else {})
+    if not sizes:
+        # the same image was uploaded before, nothing to render
+        return {}
+
+    return render_variants(open_image(fp), digest, sizes)
+
+
+def process_upload(recipe_id, upload_id, digest):
+    """Turn a staged upload into the recipe's image."""
+    path = staged_path(upload_id)
+    try:
+        try:
+            variants = render_blob_variants(path, digest)
+            status = ImageStatus.READY
+        except InvalidImage as exc:
+            logger.info('Recipe %s image rejected: %s', recipe_id, exc)
+            status = ImageStatus.FAILED
+
+        with transaction.atomic():
+            recipe = Recipe.objects.select_for_update().filter(
+                pk=recipe_id,
+            ).first()
+            if recipe is None or recipe.image_upload_id != upload_id:
+                # the recipe is gone or a newer upload replaced this one.
+                # Any files rendered are left to gc_recipe_images, as
+                # another recipe may be using the same image.
+                return
+            recipe.image_status = status
+            recipe.image_upload_id = None
+            if status == ImageStatus.READY:
+                attach_blob(recipe, digest, variants, path)
+            recipe.save(update_fields=[
+                'image', 'image_status', 'image_upload_id', 'image_variants',
+                'image_blob',
+            ])
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def complete_blob(blob_id):
+    """
+    Render the configured sizes a blob doesn't have yet.
+
+    Returns the names of the sizes added.
+    """
+    blob = ImageBlob.objects.get(pk=blob_id)
+    if not missing_sizes(blob.variants):
+        return []
+    # the largest variant is the closest thing to the original left
+    largest = max(blob.variants.values(), key=lambda v: v['width'])
+    with default_storage.open(largest['jpeg']) as source:
+        variants = render_blob_variants(source, blob.sha256)
+
+    with transaction.atomic():
+        blob = ImageBlob.objects.select_for_update().get(pk=blob_id)
+        blob.variants = {**variants, **blob.variants}
+        blob.save(update_fields=['variants'])
+        recipes = Recipe.objects.filter(image_blob=blob)
+        user_ids = set(recipes.values_list('user_id', flat=True))
+        recipes.update(image_variants=blob.variants)
+        # update() sends no post_save, so invalidate caches here
+        for user_id in user_ids:
+            user_data_changed.send(sender=Recipe, user_id=user_id)
+
+    return list(variants)
+
+
+def adopt_image(recipe_id):
+    """
+    Move a recipe's image from before blobs into a blob.
+
+    Returns the names of the sizes added.
+    """
+    recipe = Recipe.objects.get(pk=recipe_id)
+    if not recipe.image or recipe.image_blob_id is not None:
+        return []
+
+    source_name = recipe.image.name
+    digest = hashlib.sha256()
+    with default_storage.open(source_name) as source:
+        for chunk in source.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        source.seek(0)
+        variants = render_blob_variants(source, digest)
+
+        with transaction.atomic():
+            recipe = Recipe.objects.select_for_update().get(pk=recipe_id)
+            if recipe.image.name != source_name or \
+                    recipe.image_upload_id or recipe.image_blob_id:
+                # replaced or being replaced since we read it
+                return []
+            source.seek(0)
+            attach_blob(recipe, digest, variants, source)
+            recipe.image_status = ImageStatus.READY
+            recipe.save(update_fields=[
+                'image', 'image_status', 'image_variants', 'image_blob',
+            ])
+
+    return list(variants)
+
+
+def collect_garbage(cutoff):
+    """
+    Delete image files nothing uses any more.
+
+    Removes blobs released before cutoff along with their files, then
+    files under the upload directory that no blob or recipe refers to and
+    that were written before cutoff. Returns (blobs, files) deleted.
+    """
+    # fix counts left wrong by a crash between a save and a release
+    for blob in ImageBlob.objects.annotate(
+        refs=Count('recipes'),
+    ).exclude(ref_count=F('refs')).iterator():
+        ImageBlob.objects.filter(pk=blob.pk).update(
+            ref_count=blob.refs,
+            released_at=None if blob.refs else Coalesce(
+                'released_at', Now(),
+            ),
+        )
+
+    blobs = 0
+    released = ImageBlob.objects.filter(
+        ref_count=0, released_at__lt=cutoff,
+    ).values_list('id', flat=True)
+    for blob_id in released:
+        with transaction.atomic():
+            # a worker attaching this blob waits on the lock, then finds
+            # it gone and renders the files again
+            blob = ImageBlob.objects.select_for_update().filter(
+                pk=blob_id, ref_count=0,
+            ).first()
+            if blob is None:
+                continue
+            delete_files(variant_names(blob.variants))
+            blob.delete()
+            blobs += 1
+
+    in_use = set()
+    for variants in ImageBlob.objects.values_list('variants', flat=True):
+        in_use.update(variant_names(variants))
+    for name, variants in Recipe.objects.values_list(
+        'image', 'image_variants',
+    ).iterator():
+        in_use.add(name)
+        in_use.update(variant_names(variants))
+
+    files = 0
+    directory = os.path.join('uploads', 'recipe')
+    if default_storage.exists(directory):
+        for filename in default_storage.listdir(directory)[1]:
+            name = os.path.join(directory, filename)
+            if name in in_use or \
+                    default_storage.get_modified_time(name) >= cutoff:
+                continue
+            default_storage.delete(name)
+            files += 1
+
+    return blobs, files
+
+
+def file_digest(path):
+    """Return the SHA-256 of a file."""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(64 * 1024), b''):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+def recover_uploads(cutoff):
+    """
+    Requeue or fail uploads whose job was lost, and clear out staging.
+
+    Jobs only live in the memory of the worker that queued them, so a
+    restart before one runs leaves its recipe pending for good. Uploads
+    staged before cutoff and still pending are queued again, or marked
+    failed if their staged file is gone. Staged files written before
+    cutoff that no recipe is waiting for are deleted. Returns (queued,
+    failed, deleted).
+    """
+    queued = failed = 0
+    lost = Recipe.objects.filter(
+        Q(image_uploaded_at__lt=cutoff) | Q(image_uploaded_at__isnull=True),
+        image_status=ImageStatus.PENDING,
+        image_upload_id__isnull=False,
+    ).values_list('id', 'user_id', 'image_upload_id')
+    for recipe_id, user_id, upload_id in lost.iterator():
+        path = staged_path(upload_id)
+        if os.path.exists(path):
+            enqueue(process_upload, recipe_id, upload_id, file_digest(path))
+            queued += 1
+            continue
+        # a job finishing meanwhile clears the upload id before it
+        # deletes the file, so this only matches a lost upload
+        if Recipe.objects.filter(
+            pk=recipe_id, image_upload_id=upload_id,
+        ).update(image_status=ImageStatus.FAILED, image_upload_id=None):
+            # update() sends no post_save, so invalidate caches here
+            user_data_changed.send(sender=Recipe, user_id=user_id)
+            failed += 1
+
+    deleted = 0
+    root = settings.RECIPE_IMAGE_STAGING_ROOT
+    if os.path.isdir(root):
+        # staged before the recipe is saved, so only old files are
+        # known to be unreferenced
+        waiting = {
+            str(upload_id) for upload_id in Recipe.objects.filter(
+                image_upload_id__isnull=False,
+            ).values_list('image_upload_id', flat=True)
+        }
+        for filename in os.listdir(root):
+            path = os.path.join(root, filename)
+            if filename in waiting or \
+                    os.path.getmtime(path) >= cutoff.timestamp():
+                continue
+            os.remove(path)
+            deleted += 1
+
+    return queued, failed, deleted
+
+
+_resize_cache = None
+
+
+def resize_cache():
+    """Return the disk cache for images resized on demand."""
+    global _resize_cache
+    root = settings.RECIPE_IMAGE_CACHE_ROOT
+    if _resize_cache is None or _resize_cache.root != root:
+        _resize_cache = DiskLRUCache(
+            root, settings.RECIPE_IMAGE_CACHE_MAX_BYTES,
+        )
+
+    return _resize_cache
+
+
+def resize_width(value):
+    """
+    Return the width to resize to for a requested width.
+
+    Widths are rounded up to a multiple of RECIPE_IMAGE_RESIZE_STEP and
+    capped at the largest image size. Raises ValueError if invalid.
+    """
+    try:
+        width = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('Width must be a whole number of pixels.')
+    if width < 1:
+        raise ValueError('Width must be positive.')
+    step = settings.RECIPE_IMAGE_RESIZE_STEP
+    width = -(-width // step) * step
+
+    return min(width, max(settings.RECIPE_IMAGE_SIZES.values()))
+
+
+def resized_image(recipe, width, fmt):
+    """Return recipe's image width pixels wide, encoded as fmt."""
+    key = f'{recipe.image.name}:{width}:{fmt}'
+    cache = resize_cache()
+    data = cache.get(key)
+    if data is not None:
+        return data
+
+    # start from the smallest variant that is at least as wide
+    variants = sorted(
+        recipe.image_variants.values(), key=lambda variant: variant['width'],
+    )
+    source_name = next(
+        (
+            variant['jpeg'] for variant in variants
+            if variant['width'] >= width
+        ),
+        recipe.image.name,
+    )
+    with default_storage.open(source_name) as source:
+        image = open_image(source)
+    if image.width > width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.LANCZOS)
+    pillow_format, _, options = FORMATS[fmt]
+    buffer = io.BytesIO()
+    image.save(buffer, pillow_format, **options)
+    data = buffer.getvalue()
+    cache.set(key, data)
+
+    return data
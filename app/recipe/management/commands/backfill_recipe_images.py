@@ -0,0 +1,44 @@
+"""
+Django command to render missing image sizes for existing recipes.
+"""
+from django.core.management.base import BaseCommand
+
+from core.models import ImageBlob, Recipe
+from recipe import images
+
+
+class Command(BaseCommand):
+    """Django command to backfill recipe image variants."""
+    help = (
+        'Render the RECIPE_IMAGE_SIZES that stored images are missing, and '
+        'move recipe images from before content addressing into blobs.'
+    )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        updated = failed = 0
+        jobs = [
+            ('Blob', images.complete_blob,
+             ImageBlob.objects.order_by('id').values_list('id', flat=True)),
+            ('Recipe', images.adopt_image,
+             Recipe.objects.exclude(image='').exclude(image=None).filter(
+                 image_blob=None,
+             ).order_by('id').values_list('id', flat=True)),
+        ]
+        for label, backfill, ids in jobs:
+            for pk in ids.iterator():
+                try:
+                    added = backfill(pk)
+                except (images.InvalidImage, OSError) as exc:
+                    failed += 1
+                    self.stderr.write(f'{label} {pk}: {exc}')
+                    continue
+                if added:
+                    updated += 1
+                    self.stdout.write(
+                        f"{label} {pk}: added {', '.join(added)}"
+                    )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled {updated} images, {failed} failed.'
+        ))
@@ -0,0 +1,41 @@
+"""
+Django command to delete recipe image files nothing uses any more.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipe import images
+
+
+class Command(BaseCommand):
+    """Django command to garbage collect recipe images."""
+    help = (
+        'Delete images no recipe has used for --grace-seconds, and stray '
+        'files left by replaced uploads. Requeue uploads still pending '
+        'after --grace-seconds, failing those whose staged file is lost.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-seconds',
+            type=int,
+            default=3600,
+            help='Only delete what has been unused for this long, so '
+                 'uploads still being processed are left alone.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        cutoff = timezone.now() - timedelta(seconds=options['grace_seconds'])
+        queued, failed, staged = images.recover_uploads(cutoff)
+        blobs, files = images.collect_garbage(cutoff)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Requeued {queued} and failed {failed} lost uploads, and '
+            f'deleted {staged} staged files.'
+        ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {blobs} images and {files} stray files.'
+        ))
@@ -0,0 +1,22 @@
+"""
+Django command to recount how many recipes use each tag and ingredient.
+"""
+from django.core.management.base import BaseCommand
+
+from recipe import usage
+
+
+class Command(BaseCommand):
+    """Django command to fill the stored tag and ingredient usage counts."""
+    help = (
+        'Recount the recipes using every tag and ingredient. Run after '
+        'turning on RECIPE_USAGE_COUNTS.'
+    )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        for field in usage.RELATIONS.values():
+            count = usage.recount_all(field)
+            self.stdout.write(self.style.SUCCESS(
+                f'Recounted {count} {field}.'
+            ))
@@ -0,0 +1,249 @@
+"""
+Pagination for the recipe APIs.
+"""
+import base64
+import binascii
+import json
+import math
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _flip(field):
+    """Return an ordering field with its direction reversed."""
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the ordering columns.
+
+    Unlike offset pagination the database never reads the rows of the
+    earlier pages, so every page costs the same however deep it is.
+    The ordering must be unique, so it should end with the primary key.
+    """
+    ordering = ('-id',)
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    # ?count=0 skips the COUNT(*) when the client doesn't need a total
+    count_query_param = 'count'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def get_ordering(self, view):
+        """
+        Return the ordering to seek on.
+
+        Views can order a request differently by defining
+        get_pagination_ordering(), returning None for the default.
+        """
+        get_view_ordering = getattr(view, 'get_pagination_ordering', None)
+        if get_view_ordering is not None:
+            ordering = get_view_ordering()
+            if ordering:
+                return ordering
+
+        return type(self).ordering
+
+    def get_page_size(self, request):
+        """Return the page size, capped at the configured maximum."""
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return settings.API_PAGE_SIZE
+        if page_size <= 0:
+            return settings.API_PAGE_SIZE
+
+        return min(page_size, settings.API_MAX_PAGE_SIZE)
+
+    def include_count(self, request):
+        """Return whether the response should include a total count."""
+        value = request.query_params.get(self.count_query_param)
+        if value is None:
+            return settings.API_PAGINATION_COUNT
+
+        return value.lower() not in ('0', 'false')
+
+    def encode_cursor(self, position, reverse):
+        """Return an opaque cursor for a position in the ordering."""
+        raw = json.dumps({'p': position, 'r': reverse}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, request, queryset):
+        """Return the (position, reverse) pair in the request cursor."""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            position, reverse = data['p'], bool(data['r'])
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or \
+                len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # cursors come from clients, so a tampered value must not reach
+        # the database as something its column can't be compared with
+        try:
+            position = [
+                self.clean_value(queryset.model, field.lstrip('-'), value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (ValidationError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, reverse
+
+    def clean_value(self, model, name, value):
+        """Return a cursor value converted for its ordering column."""
+        if value is None:
+            raise ValueError('Ordering values are never null.')
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # an annotation, like a search rank or a count
+            if isinstance(value, bool) or \
+                    not isinstance(value, (int, float)) or \
+                    not math.isfinite(value):
+                raise ValueError(f'{name} must be a number.')
+            return value
+
+        return field.to_python(value)
+
+    def get_position(self, obj):
+        """Return the values of the ordering columns for an object."""
+        if isinstance(obj, dict):
+            # a .values() row
+            return [obj[field.lstrip('-')] for field in self.ordering]
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def seek_filter(self, ordering, position):
+        """Return a filter for the rows after position in ordering."""
+        seek = Q()
+        for index, field in enumerate(ordering):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            name = field.lstrip('-')
+            condition = Q(**{f'{name}__{lookup}': position[index]})
+            for previous, value in zip(ordering[:index], position):
+                condition &= Q(**{previous.lstrip('-'): value})
+            seek |= condition
+
+        return seek
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return a single page of results."""
+        self.request = request
+        self.ordering = tuple(self.get_ordering(view))
+        self.page_size = self.get_page_size(request)
+        position, self.reverse = self.decode_cursor(request, queryset)
+
+        self.count = None
+        if self.include_count(request):
+            self.count = queryset.count()
+
+        # walking backwards is the same seek over the flipped ordering
+        ordering = self.ordering
+        if self.reverse:
+            ordering = tuple(_flip(field) for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.seek_filter(ordering, position))
+
+        # fetch one extra row to find out whether there is another page
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        return self.page
+
+    def get_next_link(self):
+        """Return the URL of the next page."""
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        cursor = self.encode_cursor(self.get_position(self.page[-1]), False)
+
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        """Return the URL of the previous page."""
+        if not self.has_previous or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        cursor = self.encode_cursor(self.get_position(self.page[0]), True)
+
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        """Return the page with its navigation links."""
+        fields = [
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]
+        if self.count is not None:
+            fields.insert(0, ('count', self.count))
+
+        return Response(OrderedDict(fields))
+
+    def get_paginated_response_schema(self, schema):
+        """Return the schema of a paginated response."""
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        """Return the query parameters used for pagination."""
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Set to 0 to leave out the total count.',
+                'schema': {'type': 'integer', 'enum': [0, 1]},
+            },
+        ]
+
+
+class RecipePagination(KeysetPagination):
+    """Pagination for recipes, newest first."""
+    ordering = ('-id',)
+
+
+class RecipeAttrPagination(KeysetPagination):
+    """Pagination for tags and ingredients, by name."""
+    ordering = ('-name', 'id')
@@ -0,0 +1,135 @@
+"""
+Query parameters accepted by the recipe APIs.
+
+Each view declares its parameters as a serializer, and reads them with
+get_query_params(). Bad values become a 400 listing what was wrong,
+instead of a 500 from a failed int(). ID lists are deduplicated and
+capped at API_MAX_FILTER_IDS, so a request can't make the database
+match against an unbounded list.
+"""
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.fields import empty
+
+
+class DelimitedListField(serializers.Field):
+    """
+    A list given as comma separated values, a repeated parameter, or both.
+
+    Blank items are skipped and duplicates dropped, keeping the first.
+    """
+    default_error_messages = {
+        'max_length': 'Ensure this list has no more than {max_length} '
+                      'items.',
+    }
+
+    def __init__(self, child, **kwargs):
+        self.child = child
+        self.max_length = kwargs.pop(
+            'max_length', settings.API_MAX_FILTER_IDS,
+        )
+        kwargs.setdefault('required', False)
+        super().__init__(**kwargs)
+        self.child.bind(field_name='', parent=self)
+
+    def get_value(self, dictionary):
+        if self.field_name not in dictionary:
+            return empty
+        if hasattr(dictionary, 'getlist'):
+            return dictionary.getlist(self.field_name)
+
+        return [dictionary[self.field_name]]
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = [data]
+        items = [
+            item.strip() for value in data for item in str(value).split(',')
+        ]
+        items = list(dict.fromkeys(
+            self.child.run_validation(item) for item in items if item
+        ))
+        if len(items) > self.max_length:
+            self.fail('max_length', max_length=self.max_length)
+
+        return items
+
+    def to_representation(self, value):
+        return ','.join(str(self.child.to_representation(item))
+                        for item in value)
+
+
+class IdListField(DelimitedListField):
+    """A list of object IDs."""
+
+    def __init__(self, **kwargs):
+        super().__init__(
+            serializers.IntegerField(min_value=1, max_value=2 ** 63 - 1),
+            **kwargs,
+        )
+
+
+class NameListField(DelimitedListField):
+    """A list of tag or ingredient names."""
+
+    def __init__(self, **kwargs):
+        super().__init__(serializers.CharField(max_length=255), **kwargs)
+
+
+class FieldListField(DelimitedListField):
+    """A list of response field names."""
+
+    def __init__(self, **kwargs):
+        super().__init__(serializers.CharField(max_length=50), **kwargs)
+
+
+class RecipeListParams(serializers.Serializer):
+    """Query parameters of the recipe endpoints."""
+    # ?tags= and ?ingredients= are the older names for *_any
+    tags = IdListField()
+    ingredients = IdListField()
+    tags_all = IdListField()
+    tags_any = IdListField()
+    tags_none = IdListField()
+    ingredients_all = IdListField()
+    ingredients_any = IdListField()
+    ingredients_none = IdListField()
+    search = serializers.CharField(
+        required=False, allow_blank=True, max_length=200,
+    )
+    # cookable only
+    ingredient_names = NameListField()
+    max_missing = serializers.IntegerField(
+        required=False,
+        default=2,
+        min_value=0,
+        max_value=settings.RECIPE_COOKABLE_MAX_MISSING,
+    )
+    # sparse fieldsets, for list, cookable and detail reads
+    fields = FieldListField()
+    omit = FieldListField()
+
+
+class RecipeAttrListParams(serializers.Serializer):
+    """Query parameters of the tag and ingredient lists."""
+    assigned_only = serializers.BooleanField(required=False, default=False)
+    with_counts = serializers.BooleanField(required=False, default=False)
+    ordering = serializers.ChoiceField(
+        ['name', 'popular'], required=False, default='name',
+    )
+
+
+class QueryParamsMixin:
+    """Validate a view's query parameters with query_params_class."""
+    query_params_class = None
+
+    def get_query_params(self):
+        """Return the validated query parameters, raising a 400 if bad."""
+        if not hasattr(self, '_query_params'):
+            params = self.query_params_class(
+                data=self.request.query_params,
+            )
+            params.is_valid(raise_exception=True)
+            self._query_params = params.validated_data
+
+        return self._query_params
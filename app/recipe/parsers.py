@@ -0,0 +1,38 @@
+"""
+Parsers for the recipe APIs.
+"""
+import json
+
+from rest_framework.parsers import BaseParser
+
+
+def iter_ndjson(stream, encoding='utf-8'):
+    """
+    Yield (line number, data, error) for each line of an NDJSON stream.
+
+    Lines are read lazily, so the body is never held in memory at once.
+    Blank lines are skipped and lines that aren't valid JSON are yielded
+    with an error message instead of stopping the stream.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line.decode(encoding)), None
+        except (UnicodeDecodeError, ValueError) as exc:
+            yield line_number, None, f'Invalid JSON: {exc}'
+
+
+class NDJSONParser(BaseParser):
+    """Parse newline delimited JSON into a lazy stream of rows."""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """Return an iterator over the rows in the request body."""
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8')
+        if stream is None:
+            return iter(())
+
+        return iter_ndjson(stream, encoding)
@@ -0,0 +1,62 @@
+"""
+Queryset builders for the recipe APIs.
+"""
+from django.db.models import Prefetch
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+
+
+# nested relations rendered by the recipe serializers, and the model
+# behind each one. The nested serializers only read 'id' and 'name'.
+NESTED_RELATIONS = {
+    'tags': Tag,
+    'ingredients': Ingredient,
+}
+
+# model columns each SerializerMethodField reads
+METHOD_FIELD_COLUMNS = {
+    'images': ('image_status', 'image_variants'),
+}
+
+# actions that serialize recipes straight from the queryset.
+# write actions re-read the relations after saving, so prefetching
+# for them would only add queries.
+PREFETCH_ACTIONS = {'list', 'retrieve', 'cookable'}
+
+
+def nested_prefetches(fields):
+    """Return Prefetch objects for the nested relations in fields."""
+    return [
+        Prefetch(
+            name,
+            queryset=model.objects.only('id', 'name').order_by('id'),
+        )
+        for name, model in NESTED_RELATIONS.items()
+        if name in fields
+    ]
+
+
+def recipe_columns(fields):
+    """Return the Recipe columns read to render the given fields."""
+    # nested relations and annotations (like cookable's counts) aren't
+    # columns of their own
+    concrete = {field.name for field in Recipe._meta.concrete_fields}
+    columns = ['id']
+    for name in fields:
+        columns.extend(METHOD_FIELD_COLUMNS.get(name, (name,)))
+
+    return [column for column in dict.fromkeys(columns) if column in concrete]
+
+
+def build_recipe_queryset(queryset, action, fields):
+    """Load only what an action needs to render the given fields."""
+    if action in PREFETCH_ACTIONS:
+        queryset = queryset.only(*recipe_columns(fields)).prefetch_related(
+            *nested_prefetches(fields)
+        )
+
+    return queryset
@@ -0,0 +1,115 @@
+"""
+Bulk helpers for the recipe tags and ingredients relations.
+"""
+from django.db.models import Value
+from django.db.models.functions import Lower
+
+from core.models import Recipe
+from recipe.cookable import update_ingredient_counts
+from recipe.usage import update_usage_counts
+
+
+def unique_names(items):
+    """Return the names of items in order, without duplicates."""
+    return list(dict.fromkeys(item['name'] for item in items))
+
+
+def _find_named(model, user, names):
+    """Return a {lowercased name: object} map of the user's matches."""
+    matches = model.objects.filter(user=user).annotate(
+        lower_name=Lower('name'),
+    ).filter(
+        # lowered by the database, the same way as the unique index
+        lower_name__in=[Lower(Value(name)) for name in names],
+    ).order_by('-id')
+
+    # the lowest id wins if a user has names predating the index
+    return {obj.name.lower(): obj for obj in matches}
+
+
+def get_or_create_named(model, user, names):
+    """
+    Return a {name: object} map for names, creating missing ones.
+
+    Names match case insensitively, like the (user, lower(name)) unique
+    index, so 'Vegan' and 'vegan' are the same tag.
+    """
+    if not names:
+        return {}
+
+    objs = _find_named(model, user, names)
+    missing = {}
+    for name in names:
+        if name.lower() not in objs:
+            missing.setdefault(name.lower(), name)
+    missing = list(missing.values())
+    if missing:
+        # INSERT ... ON CONFLICT DO NOTHING: a name a concurrent request
+        # inserted first hits the unique index and is skipped. Either
+        # way the rows are read back, as ignore_conflicts leaves the
+        # primary keys unset.
+        model.objects.bulk_create(
+            [model(user=user, name=name) for name in missing],
+            ignore_conflicts=True,
+        )
+        objs.update(_find_named(model, user, missing))
+
+    return {name: objs[name.lower()] for name in names}
+
+
+def through_fields(field):
+    """Return the through model and its two FK column names."""
+    m2m = getattr(Recipe, field).field
+    return (
+        m2m.remote_field.through,
+        f'{m2m.m2m_field_name()}_id',
+        f'{m2m.m2m_reverse_field_name()}_id',
+    )
+
+
+def add_links(field, pairs):
+    """Link (recipe_id, related_id) pairs through a recipe relation."""
+    if not pairs:
+        return
+    through, source, target = through_fields(field)
+    through.objects.bulk_create(
+        [
+            through(**{source: recipe_id, target: related_id})
+            for recipe_id, related_id in pairs
+        ],
+        ignore_conflicts=True,
+    )
+    if field == 'ingredients':
+        update_ingredient_counts({recipe_id for recipe_id, _ in pairs})
+    update_usage_counts(field, {related_id for _, related_id in pairs})
+
+
+def sync_links(field, recipe, objs):
+    """
+    Make a recipe relation hold exactly objs.
+
+    Only the links that changed are deleted or inserted, so an update
+    that keeps the same tags doesn't touch the through table.
+    Returns the number of links added and removed.
+    """
+    through, source, target = through_fields(field)
+    current = set(
+        through.objects.filter(
+            **{source: recipe.id}
+        ).values_list(target, flat=True)
+    )
+    wanted = {obj.id for obj in objs}
+
+    removed = current - wanted
+    if removed:
+        through.objects.filter(
+            **{source: recipe.id, f'{target}__in': removed}
+        ).delete()
+        if field == 'ingredients' and not wanted - current:
+            # add_links won't recount
+            update_ingredient_counts([recipe.id])
+        update_usage_counts(field, removed)
+    added = wanted - current
+    add_links(field, [(recipe.id, related_id) for related_id in added])
+
+    return len(added), len(removed)
@@ -0,0 +1,23 @@
+"""
+Renderers for the recipe APIs.
+"""
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class ImageRenderer(BaseRenderer):
+    """
+    Accept requests for images.
+
+    Views return the image bytes in a plain HttpResponse, so this only
+    renders error details, as JSON.
+    """
+    media_type = 'image/*'
+    format = 'image'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data).encode()
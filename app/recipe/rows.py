@@ -0,0 +1,120 @@
+"""
+Render recipe lists from .values() rows instead of model instances.
+
+RecipeSerializer(many=True) builds a Recipe, and Tag and Ingredient
+instances for its nested relations, for every row before turning them
+back into primitives. For a list nothing is written, so RowRenderer
+reads only the columns the serializer shows as dicts, and each nested
+relation with one query on its link table. The serializer's own bound
+fields still format every value, so the output is the same as the
+serializer's (see test_rows.py).
+"""
+from collections import OrderedDict, defaultdict
+from types import SimpleNamespace
+
+from django.conf import settings
+from rest_framework import serializers
+
+from recipe.querysets import METHOD_FIELD_COLUMNS, NESTED_RELATIONS
+from recipe.relations import through_fields
+
+
+class RowRenderer:
+    """Render .values() rows the way serializer_class(many=True) would."""
+
+    def __init__(self, serializer_class, context):
+        self.fields = serializer_class(context=context).fields
+
+    def columns(self):
+        """Return the columns to select for the serializer's fields."""
+        columns = ['id']
+        for name, field in self.fields.items():
+            if name in NESTED_RELATIONS:
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                columns.extend(METHOD_FIELD_COLUMNS[name])
+            else:
+                columns.append(field.source)
+
+        return list(dict.fromkeys(columns))
+
+    def values(self, queryset, extra=()):
+        """Return queryset as rows of the columns needed, and extra."""
+        # nested relations are read by nested(), not prefetched
+        return queryset.prefetch_related(None).values(
+            *dict.fromkeys([*self.columns(), *extra])
+        )
+
+    def nested(self, name, recipe_ids):
+        """Return {recipe_id: [item, ...]} for a nested relation."""
+        child = self.fields[name].child.fields
+        through, source, target = through_fields(name)
+        relation = target[:-len('_id')]
+        links = through.objects.filter(
+            **{f'{source}__any': recipe_ids}
+        ).order_by(target).values_list(
+            source,
+            *[f'{relation}__{field.source}' for field in child.values()],
+        )
+
+        items = defaultdict(list)
+        for recipe_id, *values in links:
+            items[recipe_id].append(OrderedDict(
+                (field_name, self._format(field, value))
+                for (field_name, field), value in zip(child.items(), values)
+            ))
+
+        return items
+
+    def render(self, rows):
+        """Return the serialized data for rows."""
+        recipe_ids = [row['id'] for row in rows]
+        nested = {
+            name: self.nested(name, recipe_ids) if recipe_ids else {}
+            for name in self.fields if name in NESTED_RELATIONS
+        }
+
+        data = []
+        for row in rows:
+            item = OrderedDict()
+            for name, field in self.fields.items():
+                if name in nested:
+                    item[name] = nested[name].get(row['id'], [])
+                elif isinstance(field, serializers.SerializerMethodField):
+                    item[name] = field.to_representation(
+                        SimpleNamespace(**row)
+                    )
+                else:
+                    item[name] = self._format(field, row[field.source])
+            data.append(item)
+
+        return data
+
+    def _format(self, field, value):
+        # like Serializer.to_representation, None skips the field
+        return None if value is None else field.to_representation(value)
+
+
+class RowListMixin:
+    """
+    Serve list from .values() rows, with RECIPE_LIST_FROM_ROWS on.
+
+    Must come after the caching mixins, so they wrap this list().
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.RECIPE_LIST_FROM_ROWS:
+            return super().list(request, *args, **kwargs)
+
+        renderer = RowRenderer(
+            self.get_serializer_class(), self.get_serializer_context(),
+        )
+        # the paginator seeks on the ordering columns, so select them too
+        ordering = self.paginator.get_ordering(self)
+        rows = renderer.values(
+            self.filter_queryset(self.get_queryset()),
+            [field.lstrip('-') for field in ordering],
+        )
+        page = self.paginate_queryset(rows)
+
+        return self.get_paginated_response(renderer.render(page))
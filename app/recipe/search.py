@@ -0,0 +1,249 @@
+"""
+Full-text search over recipes.
+
+On PostgreSQL every recipe keeps a weighted tsvector of its title, tag and
+ingredient names and description in Recipe.search_vector, which has a GIN
+index and is rewritten whenever any of those change. Searches use
+websearch syntax ("chicken curry", "-nuts", "thai or indian") and are
+ranked with ts_rank.
+
+Other databases (SQLite in the tests) have no full-text search, so they
+fall back to an inverted index built in-process per user. It is rebuilt
+when the user's cache generation moves (see recipe/cache.py), which
+happens on every write to their recipes, tags or ingredients.
+"""
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connection
+from django.db.models import (
+    Case,
+    F,
+    FloatField,
+    OuterRef,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from core.authentication import LRUCache
+from core.models import Ingredient, Recipe, Tag
+from recipe.cache import get_generation
+
+
+# ts_rank weights, highest first
+TITLE_WEIGHT = 'A'
+NAMES_WEIGHT = 'B'
+DESCRIPTION_WEIGHT = 'C'
+
+
+def uses_postgres():
+    """Return whether recipes are searched with PostgreSQL full-text."""
+    return connection.vendor == 'postgresql'
+
+
+def _names(model):
+    """Return the space separated names of a recipe's tags/ingredients."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                recipe=OuterRef('pk'),
+            ).order_by().values('recipe').annotate(
+                names=StringAgg('name', ' '),
+            ).values('names')
+        ),
+        Value(''),
+    )
+
+
+def search_vector():
+    """Return the expression a recipe's search_vector is set to."""
+    config = settings.RECIPE_SEARCH_CONFIG
+    return (
+        SearchVector('title', weight=TITLE_WEIGHT, config=config)
+        + SearchVector(
+            _names(Tag), _names(Ingredient),
+            weight=NAMES_WEIGHT, config=config,
+        )
+        + SearchVector(
+            'description', weight=DESCRIPTION_WEIGHT, config=config,
+        )
+    )
+
+
+def update_search_vectors(recipe_ids):
+    """Rewrite the search vectors of recipes from their current data."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids or not uses_postgres():
+        return
+    # a single UPDATE that reads the names itself, so it never writes
+    # names another transaction has just changed
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        search_vector=search_vector(),
+    )
+
+
+def search_recipes(queryset, query, user_id):
+    """
+    Filter queryset to the recipes matching query.
+
+    Each recipe gets a 'rank' annotation, higher for better matches.
+    """
+    if uses_postgres():
+        search_query = SearchQuery(
+            query,
+            search_type='websearch',
+            config=settings.RECIPE_SEARCH_CONFIG,
+        )
+        # ts_rank returns a real; as double precision the value survives
+        # the round trip through a pagination cursor exactly
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=Cast(
+                SearchRank(F('search_vector'), search_query),
+                FloatField(),
+            ),
+        )
+
+    scores = user_index(user_id).search(query)
+    return queryset.filter(pk__in=scores).annotate(
+        rank=Case(
+            *[
+                When(pk=recipe_id, then=Value(score))
+                for recipe_id, score in scores.items()
+            ],
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+    )
+
+
+def tokenize(text):
+    """Split text into lower case terms, with a plural 's' dropped."""
+    return [
+        term[:-1] if len(term) > 3 and term.endswith('s') else term
+        for term in re.findall(r'\w+', text.lower())
+    ]
+
+
+class InvertedIndex:
+    """Map each term to the documents containing it, with a score."""
+
+    # scores for terms in each part of a recipe, like ts_rank's weights
+    WEIGHTS = {
+        TITLE_WEIGHT: 1.0,
+        NAMES_WEIGHT: 0.4,
+        DESCRIPTION_WEIGHT: 0.2,
+    }
+
+    def __init__(self):
+        self._postings = defaultdict(dict)
+
+    def add(self, doc_id, weighted_texts):
+        """Index (weight, text) pairs under doc_id."""
+        for weight, text in weighted_texts:
+            for term in tokenize(text):
+                postings = self._postings[term]
+                postings[doc_id] = postings.get(doc_id, 0) + \
+                    self.WEIGHTS[weight]
+
+    def search(self, query):
+        """
+        Return {doc_id: score} for the documents matching query.
+
+        Every term must match, except ones prefixed with '-', which must
+        not.
+        """
+        required = []
+        excluded = set()
+        for word in query.split():
+            if word.startswith('-'):
+                for term in tokenize(word):
+                    excluded.update(self._postings.get(term, {}))
+            else:
+                required.extend(tokenize(word))
+        if not required:
+            return {}
+
+        scores = dict(self._postings.get(required[0], {}))
+        for term in required[1:]:
+            postings = self._postings.get(term, {})
+            scores = {
+                doc_id: score + postings[doc_id]
+                for doc_id, score in scores.items()
+                if doc_id in postings
+            }
+
+        return {
+            doc_id: score for doc_id, score in scores.items()
+            if doc_id not in excluded
+        }
+
+
+# {(user_id, cache generation): InvertedIndex}
+_indexes = LRUCache(settings.RECIPE_SEARCH_INDEX_CACHE_SIZE)
+
+
+def build_index(user_id):
+    """Return an inverted index of a user's recipes."""
+    names = defaultdict(list)
+    for field in ('tags', 'ingredients'):
+        through = getattr(Recipe, field).through
+        rows = through.objects.filter(recipe__user_id=user_id).values_list(
+            'recipe_id', f'{field[:-1]}__name',
+        )
+        for recipe_id, name in rows:
+            names[recipe_id].append(name)
+
+    index = InvertedIndex()
+    recipes = Recipe.objects.filter(user_id=user_id).values_list(
+        'id', 'title', 'description',
+    )
+    for recipe_id, title, description in recipes.iterator():
+        index.add(recipe_id, [
+            (TITLE_WEIGHT, title),
+            (NAMES_WEIGHT, ' '.join(names[recipe_id])),
+            (DESCRIPTION_WEIGHT, description),
+        ])
+
+    return index
+
+
+def user_index(user_id):
+    """Return the current inverted index of a user's recipes."""
+    key = (user_id, get_generation(user_id))
+    index = _indexes.get(key)
+    if index is None:
+        index = build_index(user_id)
+        _indexes.set(key, index, settings.RECIPE_CACHE_TIMEOUT)
+
+    return index
+
+
+# Model saves keep the vectors current; link changes and deletions are
+# handled with the other link bookkeeping in recipe/signals.py.
+
+@receiver(post_save, sender=Recipe)
+def _recipe_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or \
+            {'title', 'description'} & set(update_fields):
+        update_search_vectors([instance.pk])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def _name_saved(sender, instance, created, **kwargs):
+    # a new tag or ingredient isn't on any recipe yet
+    if not created:
+        update_search_vectors(
+            instance.recipe_set.values_list('id', flat=True)
+        )
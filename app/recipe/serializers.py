@@ -1,6 +1,14 @@
 """
 Serializers for recipe APIs
 """
+import logging
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
 from core.models import Recipe
@@ -10,6 +18,17 @@ from core.models import (
     Tag,
     Ingredient
 )
+from recipe import images as recipe_images
+from recipe.relations import (
+    add_links,
+    get_or_create_named,
+    sync_links,
+    unique_names,
+)
+from recipe.search import update_search_vectors
+from recipe.signals import user_data_changed
+
+logger = logging.getLogger(__name__)
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -31,39 +50,99 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class IngredientCountSerializer(IngredientSerializer):
+    """Serializer for ingredients with how many recipes use them."""
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ['recipe_count']
+
+
+class TagCountSerializer(TagSerializer):
+    """Serializer for tags with how many recipes use them."""
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['recipe_count']
+
+
+class SparseFieldsMixin:
+    """Render only the fields listed in the 'fields' context entry."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get('fields')
+        if selected is None:
+            return fields
+
+        return OrderedDict(
+            (name, field) for name, field in fields.items()
+            if name in selected
+        )
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for recipes."""
     tags = TagSerializer(many=True, required=False)
     ingredients = IngredientSerializer(many=True, required=False)
+    # the processed image sizes, so list screens can pick a thumbnail
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = [
             'id', 'title', 'time_minutes', 'price', 'link', 'tags',
-            'ingredients',
+            'ingredients', 'images',
         ]
         read_only_fields = ['id']
 
+    @extend_schema_field(OpenApiTypes.OBJECT)
+    def get_images(self, recipe):
+        """Return the image variant URLs and a srcset per format."""
+        # variants are only replaced once a new upload is processed, so a
+        # pending or failed one leaves the previous image showing
+        if not recipe.image_variants:
+            return None
+        request = self.context.get('request')
+
+        def url(name):
+            url = default_storage.url(name)
+            return request.build_absolute_uri(url) if request else url
+
+        return {
+            'srcset': recipe_images.srcset(recipe.image_variants, url),
+            'sizes': {
+                size: {
+                    key: url(value) if key in recipe_images.FORMATS else value
+                    for key, value in variant.items()
+                }
+                for size, variant in recipe.image_variants.items()
+            },
+        }
+
+    def _get_or_create_named(self, model, items):
+        """Return the user's objects named in items, creating missing ones."""
+        auth_user = self.context['request'].user
+        # one query for the existing objects and one insert for the rest,
+        # instead of a get_or_create per item
+        objs = get_or_create_named(model, auth_user, unique_names(items))
+        # names differing only in case give the same object
+        return {obj.id: obj for obj in objs.values()}.values()
+
     def _get_or_create_tags(self, tags, recipe):
         """Handle getting or creating tags as needed."""
-        auth_user = self.context['request'].user
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user=auth_user,
-                **tag,
-            )
-            recipe.tags.add(tag_obj)
+        tag_objs = self._get_or_create_named(Tag, tags)
+        add_links('tags', [(recipe.id, tag.id) for tag in tag_objs])
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         """Handle getting or creating ingredients as needed."""
-        auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, create = Ingredient.objects.get_or_create(
-                user=auth_user,
-                **ingredient,
-            )
-            recipe.ingredients.add(ingredient_obj)
+        ingredient_objs = self._get_or_create_named(Ingredient, ingredients)
+        add_links(
+            'ingredients',
+            [(recipe.id, obj.id) for obj in ingredient_objs],
+        )
 
+    @transaction.atomic
     def create(self,validated_data):
         """Create a recipe."""
         tags = validated_data.pop('tags', [])
@@ -71,18 +150,38 @@ class RecipeSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(**validated_data)
         self._get_or_create_tags(tags, recipe)
         self._get_or_create_ingredients(ingredients, recipe)
+        # the links are bulk inserted, which sends no model signals
+        user_data_changed.send(sender=Recipe, user_id=recipe.user_id)
+        update_search_vectors([recipe.id])
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Update a recipe."""
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
+        # only the links that changed are written, rather than clearing
+        # and re-adding every tag and ingredient on each update
         if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)
+            added, removed = sync_links(
+                'tags',
+                instance,
+                self._get_or_create_named(Tag, tags),
+            )
+            logger.info(
+                'Recipe %s tags updated: %d added, %d removed.',
+                instance.id, added, removed,
+            )
         if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, instance)
+            added, removed = sync_links(
+                'ingredients',
+                instance,
+                self._get_or_create_named(Ingredient, ingredients),
+            )
+            logger.info(
+                'Recipe %s ingredients updated: %d added, %d removed.',
+                instance.id, added, removed,
+            )
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
@@ -98,13 +197,50 @@ class RecipeDetailSerializer(RecipeSerializer):
     # a bit weird to define a class within a class, but we're using the
     # same Meta values
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ['description', 'image']
+        fields = RecipeSerializer.Meta.fields + [
+            'description', 'image', 'image_status',
+        ]
+        read_only_fields = RecipeSerializer.Meta.read_only_fields + [
+            'image_status',
+        ]
+
+
+class RecipeBulkSerializer(RecipeSerializer):
+    """Serializer for importing and exporting recipes in bulk."""
+
+    class Meta(RecipeSerializer.Meta):
+        # image URLs are of no use to an import, so they aren't exported
+        fields = [
+            field for field in RecipeSerializer.Meta.fields
+            if field != 'images'
+        ] + ['description']
+
+
+class RecipeCookableSerializer(RecipeSerializer):
+    """Serializer for recipes ranked by the ingredients on hand."""
+    matched_count = serializers.IntegerField(read_only=True)
+    missing_count = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + [
+            'matched_count', 'missing_count',
+        ]
+        read_only_fields = RecipeSerializer.Meta.read_only_fields + [
+            'matched_count', 'missing_count',
+        ]
+
 
 class RecipeImageSerializer(serializers.ModelSerializer):
     """Serializer for uploading images to recipes."""
 
     class Meta:
         model = Recipe
-        fields = ['id', 'image']
-        read_only_fields = ['id']
+        fields = ['id', 'image', 'image_status']
+        read_only_fields = ['id', 'image_status']
         extra_kwargs = {'image': {'required': 'True'}}
+
+    def validate_image(self, value):
+        """Reject uploads larger than the proxy would let through."""
+        if value.size > settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE:
+            raise serializers.ValidationError('Image file is too large.')
+        return value
@@ -0,0 +1,148 @@
+"""
+Signals for the recipe app.
+"""
+from django.conf import settings
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import Signal, receiver
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe.cookable import update_ingredient_counts
+from recipe.usage import RELATIONS, update_usage_counts, usage_counts_stored
+
+
+# Sent whenever what a user's recipe, tag or ingredient endpoints return
+# may have changed. Provides user_id.
+#
+# Model saves and deletes send it automatically. Code that writes with
+# bulk_create or through-table inserts (which don't send model signals)
+# has to send it itself.
+user_data_changed = Signal()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def _model_changed(sender, instance, **kwargs):
+    """Report a saved or deleted recipe, tag or ingredient."""
+    user_data_changed.send(sender=sender, user_id=instance.user_id)
+
+
+# the recipe relation each link table holds
+LINK_FIELDS = {
+    Recipe.tags.through: 'tags',
+    Recipe.ingredients.through: 'ingredients',
+}
+
+
+def update_linked(field, recipe_ids, related_ids):
+    """
+    Bring what is derived from recipe links up to date.
+
+    recipe_ids are the recipes whose field links changed, and related_ids
+    the tags or ingredients at their other end. Code that writes links
+    with bulk inserts (see recipe/relations.py) sends no signals, so it
+    updates these itself; the receivers below cover ORM changes.
+    """
+    # imported here, recipe.search imports this module (via recipe.cache)
+    from recipe.search import update_search_vectors
+
+    update_search_vectors(recipe_ids)
+    if field == 'ingredients':
+        update_ingredient_counts(recipe_ids)
+    update_usage_counts(field, related_ids)
+
+
+def _other_ends(field, instance):
+    """Return the ids instance is linked to through field, if needed."""
+    from recipe.search import uses_postgres
+
+    if isinstance(instance, Recipe):
+        # only the usage counts look at the tags/ingredients
+        if not usage_counts_stored():
+            return []
+        return list(getattr(instance, field).values_list('id', flat=True))
+    # and only search vectors and ingredient counts at the recipes
+    if field != 'ingredients' and not uses_postgres():
+        return []
+    return list(instance.recipe_set.values_list('id', flat=True))
+
+
+def _update_ends(field, instance, other_ids):
+    """Update what is derived from links between instance and other_ids."""
+    if isinstance(instance, Recipe):
+        update_linked(field, [instance.pk], other_ids)
+    else:
+        update_linked(field, other_ids, [instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def _relation_changed(sender, instance, action, pk_set, **kwargs):
+    """Update and report tags or ingredients linked or unlinked."""
+    field = LINK_FIELDS[sender]
+    if action == 'pre_clear':
+        # the links are gone by post_clear, so note their other ends now
+        instance._cleared_links = {
+            **getattr(instance, '_cleared_links', {}),
+            field: _other_ends(field, instance),
+        }
+        return
+    if action == 'post_clear':
+        _update_ends(field, instance, instance._cleared_links.pop(field))
+    elif action in ('post_add', 'post_remove'):
+        _update_ends(field, instance, pk_set)
+    else:
+        return
+    user_data_changed.send(sender=sender, user_id=instance.user_id)
+
+
+@receiver(pre_delete, sender=Recipe)
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def _linked_deleting(sender, instance, **kwargs):
+    # deleting cascades to the links without m2m_changed, and they're
+    # gone by post_delete, so note their other ends now
+    fields = LINK_FIELDS.values() if sender is Recipe else [RELATIONS[sender]]
+    instance._deleted_links = {
+        field: _other_ends(field, instance) for field in fields
+    }
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def _linked_deleted(sender, instance, **kwargs):
+    for field, other_ids in getattr(instance, '_deleted_links', {}).items():
+        # nothing is left to update on the deleted end
+        if sender is Recipe:
+            update_linked(field, [], other_ids)
+        else:
+            update_linked(field, other_ids, [])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def _user_created(sender, instance, created, **kwargs):
+    """Report a new user, so nothing cached under a reused id is served."""
+    if created:
+        user_data_changed.send(sender=sender, user_id=instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def _recipe_deleted(sender, instance, **kwargs):
+    """Give up a deleted recipe's reference to its image."""
+    if instance.image_blob_id is not None:
+        # imported here, recipe.images imports this module
+        from recipe.images import release_blob
+        release_blob(instance.image_blob_id)
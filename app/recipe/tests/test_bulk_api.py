@@ -0,0 +1,162 @@
+"""
+Tests for the bulk recipe import and export APIs.
+"""
+import json
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+
+
+BULK_URL = reverse('recipe:recipe-bulk')
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def to_ndjson(rows):
+    """Return rows encoded as newline delimited JSON."""
+    return '\n'.join(json.dumps(row) for row in rows).encode()
+
+
+def create_user(email='user@example.com', password='testpass123'):
+    """Create and return a new user."""
+    return get_user_model().objects.create_user(email, password)
+
+
+class PublicBulkApiTests(TestCase):
+    """Test unauthenticated API requests."""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_auth_required(self):
+        """Test auth is required to export recipes."""
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateBulkApiTests(TestCase):
+    """Test authenticated API requests."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+
+    def post_ndjson(self, body):
+        """Post body to the bulk import endpoint."""
+        return self.client.post(
+            BULK_URL,
+            data=body,
+            content_type='application/x-ndjson',
+        )
+
+    # a small chunk size makes the rows span several chunks
+    @override_settings(RECIPE_BULK_CHUNK_SIZE=2)
+    def test_bulk_import(self):
+        """Test importing recipes with tags and ingredients."""
+        Tag.objects.create(user=self.user, name='Dinner')
+        rows = [
+            {
+                'title': f'Recipe {index}',
+                'time_minutes': 10 + index,
+                'price': '4.50',
+                'description': 'Imported',
+                'tags': [{'name': 'Dinner'}, {'name': f'Tag {index}'}],
+                'ingredients': [{'name': 'Salt'}],
+            }
+            for index in range(5)
+        ]
+
+        res = self.post_ndjson(to_ndjson(rows))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 5)
+        self.assertEqual(res.data['failed'], 0)
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(recipes.count(), 5)
+        for index, recipe in enumerate(recipes):
+            self.assertEqual(recipe.title, f'Recipe {index}')
+            self.assertEqual(recipe.price, Decimal('4.50'))
+            self.assertEqual(recipe.description, 'Imported')
+            self.assertEqual(
+                sorted(recipe.tags.values_list('name', flat=True)),
+                ['Dinner', f'Tag {index}'],
+            )
+        self.assertEqual(Tag.objects.filter(name='Dinner').count(), 1)
+        self.assertEqual(Ingredient.objects.filter(name='Salt').count(), 1)
+
+    def test_bulk_import_reports_row_errors(self):
+        """Test invalid rows are reported without stopping the import."""
+        body = b'\n'.join([
+            json.dumps({'title': 'Good', 'time_minutes': 5,
+                        'price': '1.00'}).encode(),
+            b'{not json',
+            json.dumps({'title': 'Missing price',
+                        'time_minutes': 5}).encode(),
+            b'',
+        ])
+
+        res = self.post_ndjson(body)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 1)
+        self.assertEqual(res.data['failed'], 2)
+        results = res.data['results']
+        self.assertEqual([result['line'] for result in results], [1, 2, 3])
+        self.assertEqual(results[0]['status'], 'created')
+        self.assertEqual(results[1]['status'], 'error')
+        self.assertIn('price', results[2]['errors'])
+        self.assertTrue(Recipe.objects.filter(title='Good').exists())
+
+    def test_export(self):
+        """Test exporting the user's recipes as NDJSON."""
+        other_user = create_user(email='other@example.com')
+        Recipe.objects.create(
+            user=other_user, title='Other', time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        recipe = Recipe.objects.create(
+            user=self.user, title='Mine', time_minutes=5,
+            price=Decimal('1.00'), description='Exported',
+        )
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Lunch'))
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(res.streaming_content).splitlines()
+        self.assertEqual(len(lines), 1)
+        data = json.loads(lines[0])
+        self.assertEqual(data['id'], recipe.id)
+        self.assertEqual(data['description'], 'Exported')
+        self.assertEqual(data['tags'], [{'id': data['tags'][0]['id'],
+                                         'name': 'Lunch'}])
+
+    @override_settings(RECIPE_BULK_CHUNK_SIZE=2)
+    def test_export_round_trip(self):
+        """Test exported recipes can be imported again."""
+        for index in range(3):
+            Recipe.objects.create(
+                user=self.user, title=f'Recipe {index}', time_minutes=5,
+                price=Decimal('2.00'),
+            )
+
+        res = self.client.get(EXPORT_URL)
+        body = b''.join(res.streaming_content)
+        self.assertEqual(len(body.splitlines()), 3)
+        res = self.post_ndjson(body)
+
+        self.assertEqual(res.data['created'], 3)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 6)
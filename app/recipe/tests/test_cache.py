@@ -0,0 +1,263 @@
+"""
+Tests for caching recipe API responses.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+)
+from recipe.cache import (
+    bump_generation,
+    get_generation,
+    normalize_query_params,
+)
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class CacheHelperTests(TestCase):
+    """Test the cache helpers."""
+
+    def test_bump_generation(self):
+        """Test bumping a generation changes it."""
+        generation = get_generation(12345)
+        bump_generation(12345)
+
+        self.assertNotEqual(get_generation(12345), generation)
+
+    def test_normalize_id_lists(self):
+        """Test ID lists in any order normalize the same."""
+        self.assertEqual(
+            normalize_query_params(QueryDict('tags=2,1&assigned_only=1')),
+            normalize_query_params(QueryDict('assigned_only=1&tags=1,2,2')),
+        )
+
+
+@override_settings(RECIPE_CACHE_SHARED=True)
+class CachedListApiTests(TestCase):
+    """Test cached list responses."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_repeated_list_served_from_cache(self):
+        """Test listing twice doesn't query the database again."""
+        create_recipe(self.user)
+        res = self.client.get(RECIPES_URL)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(RECIPES_URL)
+
+        self.assertEqual(cached.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached.data, res.data)
+
+    def test_equivalent_params_share_entry(self):
+        """Test reordered ID filters are served from the same entry."""
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Dinner')
+        self.client.get(RECIPES_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+        with self.assertNumQueries(0):
+            self.client.get(RECIPES_URL, {'tags': f'{tag2.id},{tag1.id}'})
+
+    def test_create_invalidates(self):
+        """Test creating a recipe through the API invalidates the list."""
+        self.client.get(RECIPES_URL)
+
+        payload = {
+            'title': 'New recipe',
+            'time_minutes': 5,
+            'price': '1.00',
+            'tags': [{'name': 'Quick'}],
+        }
+        self.client.post(RECIPES_URL, payload, format='json')
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['tags'][0]['name'], 'Quick')
+
+    def test_delete_invalidates(self):
+        """Test deleting a recipe invalidates the list."""
+        recipe = create_recipe(self.user)
+        self.client.get(RECIPES_URL)
+
+        self.client.delete(detail_url(recipe.id))
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_tag_rename_invalidates_recipes(self):
+        """Test renaming a tag invalidates the cached recipe list."""
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Lunch')
+        recipe.tags.add(tag)
+        self.client.get(RECIPES_URL)
+
+        url = reverse('recipe:tag-detail', args=[tag.id])
+        self.client.patch(url, {'name': 'Brunch'})
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'][0]['tags'][0]['name'], 'Brunch')
+
+    def test_cache_limited_to_user(self):
+        """Test cached lists aren't shared between users."""
+        create_recipe(self.user)
+        self.client.get(TAGS_URL)
+        self.client.get(RECIPES_URL)
+
+        other_user = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(other_user)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'], [])
+
+    @override_settings(RECIPE_CACHE_SHARED=False)
+    def test_not_cached_with_process_local_cache(self):
+        """Test lists are read afresh when other workers can't invalidate."""
+        create_recipe(self.user)
+        self.client.get(RECIPES_URL)
+        # as another worker would, whose writes this cache never sees
+        Recipe.objects.update(title='Renamed')
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'][0]['title'], 'Renamed')
+
+
+@override_settings(RECIPE_CACHE_SHARED=True)
+class ConditionalGetApiTests(TestCase):
+    """Test ETag and If-None-Match handling."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_list_not_modified(self):
+        """Test a matching If-None-Match returns 304 without queries."""
+        create_recipe(self.user)
+        res = self.client.get(RECIPES_URL)
+        etag = res['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_detail_not_modified(self):
+        """Test a matching If-None-Match on a recipe returns 304."""
+        recipe = create_recipe(self.user)
+        res = self.client.get(detail_url(recipe.id))
+
+        with self.assertNumQueries(0):
+            res = self.client.get(
+                detail_url(recipe.id), HTTP_IF_NONE_MATCH=res['ETag'],
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_wildcard_needs_existing_recipe(self):
+        """Test If-None-Match: * is 404 for recipes the user can't see."""
+        recipe = create_recipe(self.user)
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        other_recipe = create_recipe(other)
+
+        res = self.client.get(detail_url(recipe.id), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        for recipe_id in (999999, other_recipe.id):
+            res = self.client.get(
+                detail_url(recipe_id), HTTP_IF_NONE_MATCH='*',
+            )
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_etag_changes_on_write(self):
+        """Test a write makes the old ETag stale."""
+        recipe = create_recipe(self.user)
+        etag = self.client.get(detail_url(recipe.id))['ETag']
+
+        self.client.patch(
+            detail_url(recipe.id),
+            {'tags': [{'name': 'Dinner'}]},
+            format='json',
+        )
+        res = self.client.get(detail_url(recipe.id), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(res.data['tags'][0]['name'], 'Dinner')
+
+    def test_etag_differs_by_list(self):
+        """Test an ETag from one list doesn't match another."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        res = self.client.get(
+            RECIPES_URL, {'tags': tag.id}, HTTP_IF_NONE_MATCH=etag,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_no_etag_with_process_local_cache(self):
+        """Test no ETag is given when other workers can't see it."""
+        recipe = create_recipe(self.user)
+        etag = self.client.get(detail_url(recipe.id))['ETag']
+
+        with override_settings(RECIPE_CACHE_SHARED=False):
+            res = self.client.get(
+                detail_url(recipe.id), HTTP_IF_NONE_MATCH=etag,
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('ETag', res)
+
+    def test_tag_detail_get_not_allowed(self):
+        """Test tags still have no detail GET."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(reverse('recipe:tag-detail', args=[tag.id]))
+
+        self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
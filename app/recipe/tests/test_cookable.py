@@ -0,0 +1,184 @@
+"""
+Tests for finding the recipes that can be cooked with what's on hand.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+
+
+COOKABLE_URL = reverse('recipe:recipe-cookable')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class CookableApiTests(TestCase):
+    """Test ranking recipes by ingredient coverage."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.ingredients = {
+            name: Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Egg', 'Flour', 'Milk', 'Sugar', 'Butter', 'Salt')
+        }
+
+    def create_recipe(self, title, names):
+        recipe = create_recipe(self.user, title=title)
+        recipe.ingredients.add(*[self.ingredients[name] for name in names])
+
+        return recipe
+
+    def ids(self, *names):
+        return ','.join(str(self.ingredients[name].id) for name in names)
+
+    def test_ranked_by_coverage(self):
+        """Test makeable recipes come first, then those missing fewest."""
+        self.create_recipe('Omelette', ['Egg', 'Salt'])
+        self.create_recipe('Pancakes', ['Egg', 'Flour', 'Milk'])
+        self.create_recipe('Cake', ['Egg', 'Flour', 'Sugar', 'Butter'])
+        self.create_recipe('Shortbread', ['Flour', 'Sugar', 'Butter'])
+        self.create_recipe('Custard', ['Egg', 'Milk', 'Sugar', 'Butter',
+                                       'Flour', 'Salt'])
+
+        res = self.client.get(COOKABLE_URL, {
+            'ingredients': self.ids('Egg', 'Flour', 'Milk', 'Salt'),
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        results = [
+            (recipe['title'], recipe['missing_count'])
+            for recipe in res.data['results']
+        ]
+        self.assertEqual(
+            results,
+            [
+                ('Pancakes', 0), ('Omelette', 0),
+                ('Custard', 2), ('Cake', 2), ('Shortbread', 2),
+            ],
+        )
+
+    def test_by_name(self):
+        """Test ingredients on hand can be given by name."""
+        self.create_recipe('Omelette', ['Egg', 'Salt'])
+        self.create_recipe('Toast', ['Butter', 'Flour', 'Salt', 'Milk'])
+
+        res = self.client.get(COOKABLE_URL, {
+            'ingredient_names': 'egg, SALT',
+            'max_missing': 0,
+        })
+
+        titles = [recipe['title'] for recipe in res.data['results']]
+        self.assertEqual(titles, ['Omelette'])
+
+    def test_counts_follow_api_edits(self):
+        """Test coverage uses ingredients as changed through the API."""
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Omelette',
+            'time_minutes': 5,
+            'price': '1.00',
+            'ingredients': [{'name': 'Egg'}, {'name': 'Salt'}],
+        }, format='json')
+        recipe = Recipe.objects.get(pk=res.data['id'])
+        self.assertEqual(recipe.ingredient_count, 2)
+
+        self.client.patch(
+            reverse('recipe:recipe-detail', args=[recipe.id]),
+            {'ingredients': [{'name': 'Egg'}]},
+            format='json',
+        )
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.ingredient_count, 1)
+
+        self.ingredients['Egg'].delete()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.ingredient_count, 0)
+
+    def test_filter_by_tag(self):
+        """Test cookable recipes can be narrowed down by tag."""
+        breakfast = Tag.objects.create(user=self.user, name='Breakfast')
+        self.create_recipe('Omelette', ['Egg']).tags.add(breakfast)
+        self.create_recipe('Egg fried rice', ['Egg'])
+
+        res = self.client.get(COOKABLE_URL, {
+            'ingredients': self.ids('Egg'),
+            'tags': breakfast.id,
+        })
+
+        titles = [recipe['title'] for recipe in res.data['results']]
+        self.assertEqual(titles, ['Omelette'])
+
+    def test_paginated(self):
+        """Test the ranking is kept across pages."""
+        for missing in range(3):
+            self.create_recipe(
+                f'Missing {missing}',
+                ['Egg', 'Flour', 'Sugar'][:missing + 1],
+            )
+
+        res = self.client.get(COOKABLE_URL, {
+            'ingredients': self.ids('Egg'),
+            'page_size': 1,
+        })
+        titles = [res.data['results'][0]['title']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            titles.extend(recipe['title'] for recipe in res.data['results'])
+
+        self.assertEqual(titles, ['Missing 0', 'Missing 1', 'Missing 2'])
+
+    def test_nothing_on_hand(self):
+        """Test only recipes within max_missing are returned."""
+        self.create_recipe('Boiled egg', ['Egg'])
+        self.create_recipe('Pancakes', ['Egg', 'Flour', 'Milk'])
+
+        res = self.client.get(COOKABLE_URL, {'max_missing': 1})
+
+        results = [
+            (recipe['title'], recipe['missing_count'])
+            for recipe in res.data['results']
+        ]
+        self.assertEqual(results, [('Boiled egg', 1)])
+
+    def test_invalid_params(self):
+        """Test bad ingredient IDs or max_missing return 400."""
+        for params in (
+            {'ingredients': 'egg'},
+            {'max_missing': 'many'},
+            {'max_missing': 100},
+        ):
+            res = self.client.get(COOKABLE_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_excluded(self):
+        """Test only the user's own recipes are returned."""
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        create_recipe(other, title='Other')
+
+        res = self.client.get(COOKABLE_URL)
+
+        self.assertEqual(res.data['results'], [])
@@ -0,0 +1,125 @@
+"""
+Tests for the recipe tag and ingredient filters.
+"""
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RelationFilterTests(TestCase):
+    """Test filtering recipes with all/any/none of some tags."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.quick = Tag.objects.create(user=self.user, name='Quick')
+        self.spicy = Tag.objects.create(user=self.user, name='Spicy')
+        self.salad = create_recipe(self.user, title='Salad')
+        self.salad.tags.add(self.vegan, self.quick)
+        self.curry = create_recipe(self.user, title='Curry')
+        self.curry.tags.add(self.vegan, self.spicy)
+        self.steak = create_recipe(self.user, title='Steak')
+        self.steak.tags.add(self.quick)
+
+    def titles(self, **params):
+        res = self.client.get(RECIPES_URL, {
+            key: ','.join(str(obj.id) for obj in value)
+            for key, value in params.items()
+        })
+
+        return sorted(recipe['title'] for recipe in res.data['results'])
+
+    def test_all(self):
+        """Test tags_all needs every tag."""
+        self.assertEqual(
+            self.titles(tags_all=[self.vegan, self.quick]), ['Salad'],
+        )
+
+    def test_any(self):
+        """Test tags_any returns each matching recipe once."""
+        self.assertEqual(
+            self.titles(tags_any=[self.vegan, self.quick]),
+            ['Curry', 'Salad', 'Steak'],
+        )
+
+    def test_none(self):
+        """Test tags_none leaves out recipes with any of the tags."""
+        self.assertEqual(self.titles(tags_none=[self.spicy]),
+                         ['Salad', 'Steak'])
+
+    def test_combined(self):
+        """Test filters on tags and ingredients combine with AND."""
+        tofu = Ingredient.objects.create(user=self.user, name='Tofu')
+        self.curry.ingredients.add(tofu)
+
+        self.assertEqual(
+            self.titles(tags_any=[self.vegan], tags_none=[self.quick]),
+            ['Curry'],
+        )
+        self.assertEqual(
+            self.titles(tags_all=[self.vegan], ingredients_none=[tofu]),
+            ['Salad'],
+        )
+
+    def test_legacy_params_mean_any(self):
+        """Test ?tags= keeps its any-of meaning."""
+        self.assertEqual(
+            self.titles(tags=[self.spicy, self.quick]),
+            ['Curry', 'Salad', 'Steak'],
+        )
+
+    def test_no_distinct(self):
+        """Test the filters are subqueries, not a join needing DISTINCT."""
+        with self.assertNumQueries(4) as context:
+            self.titles(tags_all=[self.vegan, self.quick],
+                        tags_any=[self.vegan], tags_none=[self.spicy])
+
+        sql = '\n'.join(query['sql'] for query in context.captured_queries)
+        self.assertNotIn('DISTINCT', sql)
+        self.assertIn('HAVING', sql)
+        self.assertIn('EXISTS', sql)
+
+
+class ExplainRecipeFiltersTests(TestCase):
+    """Test the explain_recipe_filters command."""
+
+    def test_prints_plans_and_rolls_back(self):
+        """Test a plan is printed per filter and the data is thrown away."""
+        out = StringIO()
+
+        call_command(
+            'explain_recipe_filters', recipes=50, tags=5, rounds=1,
+            stdout=out,
+        )
+
+        for label in ('DISTINCT', 'tags_all', 'tags_any', 'tags_none'):
+            self.assertIn(label, out.getvalue())
+        self.assertFalse(Recipe.objects.exists())
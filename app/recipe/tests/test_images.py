@@ -0,0 +1,618 @@
+"""
+Tests for processing recipe image uploads.
+"""
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import ImageBlob, ImageStatus, Recipe
+from recipe import images
+from recipe.image_cache import DiskLRUCache
+
+
+def image_upload_url(recipe_id):
+    """Create and return a recipe upload URL."""
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def image_bytes(size=(2000, 1000), fmt='JPEG', **options):
+    """Return an encoded sample image."""
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, fmt, **options)
+    buffer.seek(0)
+    buffer.name = f'sample.{fmt.lower()}'
+
+    return buffer
+
+
+@override_settings(
+    RECIPE_IMAGE_BACKEND='memory',
+    RECIPE_IMAGE_SIZES={'large': 800},
+)
+class ImageProcessingTests(TestCase):
+    """Test the background image pipeline."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        staging_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, staging_root)
+        override = override_settings(RECIPE_IMAGE_STAGING_ROOT=staging_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.backend = images.get_backend()
+        self.backend.jobs.clear()
+
+    def tearDown(self):
+        for variants in ImageBlob.objects.values_list('variants', flat=True):
+            images.delete_files(images.variant_names(variants))
+
+    def run_pending(self):
+        # the workers delete replaced files once their transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.backend.run_pending()
+
+    def upload(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': image},
+                format='multipart',
+            )
+
+    def test_upload_is_queued(self):
+        """Test the upload is staged and left for the worker."""
+        res = self.upload(image_bytes())
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(len(self.backend.jobs), 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, ImageStatus.PENDING)
+        self.assertTrue(os.path.exists(
+            images.staged_path(self.recipe.image_upload_id)
+        ))
+
+    def test_variants_resized_without_metadata(self):
+        """Test JPEG and WebP variants are resized and stripped of exif."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        self.upload(image_bytes(exif=exif.tobytes()))
+        upload_id = Recipe.objects.get(pk=self.recipe.pk).image_upload_id
+
+        self.run_pending()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, ImageStatus.READY)
+        self.assertIsNone(self.recipe.image_upload_id)
+        variants = self.recipe.image_variants['large']
+        self.assertEqual(self.recipe.image.name, variants['jpeg'])
+        self.assertEqual((variants['width'], variants['height']), (800, 400))
+        for fmt in images.FORMATS:
+            with default_storage.open(variants[fmt]) as stored:
+                image = Image.open(stored)
+                self.assertEqual(image.format, fmt.upper())
+                self.assertEqual(image.size, (800, 400))
+                self.assertEqual(len(image.getexif()), 0)
+        self.assertFalse(os.path.exists(images.staged_path(upload_id)))
+
+    def test_status_on_detail(self):
+        """Test the recipe detail shows the image status."""
+        self.upload(image_bytes())
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(res.data['image_status'], ImageStatus.PENDING)
+
+        self.run_pending()
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(res.data['image_status'], ImageStatus.READY)
+
+    def test_corrupt_image_fails(self):
+        """Test an image that can't be decoded is marked failed."""
+        self.upload(image_bytes())
+        staged = images.staged_path(
+            Recipe.objects.get(pk=self.recipe.pk).image_upload_id
+        )
+        with open(staged, 'wb') as staged_file:
+            staged_file.write(b'not an image')
+
+        self.run_pending()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, ImageStatus.FAILED)
+        self.assertEqual(self.recipe.image_variants, {})
+
+    def test_failed_replacement_keeps_image(self):
+        """Test the last processed image is served after a failed upload."""
+        self.upload(image_bytes())
+        self.run_pending()
+        images_before = self.client.get(detail_url(self.recipe.id)).data[
+            'images'
+        ]
+        self.upload(image_bytes(fmt='PNG'))
+        staged = images.staged_path(
+            Recipe.objects.get(pk=self.recipe.pk).image_upload_id
+        )
+        with open(staged, 'wb') as staged_file:
+            staged_file.write(b'not an image')
+
+        pending = self.client.get(detail_url(self.recipe.id))
+        self.run_pending()
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(pending.data['images'], images_before)
+        self.assertEqual(res.data['image_status'], ImageStatus.FAILED)
+        self.assertEqual(res.data['images'], images_before)
+        cache_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_root)
+        with self.settings(RECIPE_IMAGE_CACHE_ROOT=cache_root):
+            res = self.client.get(
+                reverse('recipe:recipe-image', args=[self.recipe.id]),
+                {'w': 64},
+            )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_replaced_image_released(self):
+        """Test uploading a new image releases the old one."""
+        self.upload(image_bytes())
+        self.run_pending()
+        self.recipe.refresh_from_db()
+        old_blob = self.recipe.image_blob
+        old_name = self.recipe.image.name
+
+        self.upload(image_bytes(fmt='PNG'))
+        self.run_pending()
+
+        old_blob.refresh_from_db()
+        self.assertEqual(old_blob.ref_count, 0)
+        self.assertIsNotNone(old_blob.released_at)
+        # the files stay until the grace period is over
+        self.assertTrue(default_storage.exists(old_name))
+
+    def test_superseded_upload_discarded(self):
+        """Test an older upload finishing late doesn't win."""
+        self.upload(image_bytes())
+        self.upload(image_bytes(size=(100, 100)))
+        first, second = self.backend.jobs
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second[0](*second[1])
+            first[0](*first[1])
+
+        self.recipe.refresh_from_db()
+        with default_storage.open(self.recipe.image.name) as stored:
+            self.assertEqual(Image.open(stored).size, (100, 100))
+        self.assertFalse(os.listdir(os.path.dirname(
+            images.staged_path(uuid.uuid4())
+        )))
+        self.assertEqual(ImageBlob.objects.count(), 1)
+        stray = images.blob_name(first[1][2], 'large', 'jpg')
+        self.assertTrue(default_storage.exists(stray))
+
+        images.collect_garbage(timezone.now() + timedelta(minutes=1))
+
+        self.assertFalse(default_storage.exists(stray))
+        self.assertTrue(default_storage.exists(self.recipe.image.name))
+
+    def gc(self, grace_seconds=3600):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                'gc_recipe_images',
+                grace_seconds=grace_seconds,
+                stdout=io.StringIO(),
+            )
+
+    def test_lost_job_requeued(self):
+        """Test an upload whose job was lost in a restart is requeued."""
+        self.upload(image_bytes())
+        # the worker restarted before running it
+        self.backend.jobs.clear()
+
+        self.gc()
+        self.assertEqual(self.backend.jobs, [])
+
+        self.gc(grace_seconds=-60)
+        self.assertEqual(len(self.backend.jobs), 1)
+        self.run_pending()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, ImageStatus.READY)
+        self.assertEqual(os.listdir(settings.RECIPE_IMAGE_STAGING_ROOT), [])
+
+    def test_lost_upload_failed(self):
+        """Test a pending upload without its staged file is failed."""
+        self.upload(image_bytes())
+        self.backend.jobs.clear()
+        os.remove(images.staged_path(
+            Recipe.objects.get(pk=self.recipe.pk).image_upload_id
+        ))
+
+        self.gc()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, ImageStatus.PENDING)
+
+        self.gc(grace_seconds=-60)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, ImageStatus.FAILED)
+        self.assertIsNone(self.recipe.image_upload_id)
+        self.assertEqual(self.backend.jobs, [])
+
+    def test_unreferenced_staged_files_deleted(self):
+        """Test old staged files no recipe is waiting for are deleted."""
+        self.upload(image_bytes())
+        waiting = images.staged_path(
+            Recipe.objects.get(pk=self.recipe.pk).image_upload_id
+        )
+        stray = images.staged_path(uuid.uuid4())
+        with open(stray, 'wb') as fp:
+            fp.write(b'left by a crash')
+
+        self.gc()
+        self.assertTrue(os.path.exists(stray))
+
+        # make both old enough; the pending one is requeued instead
+        old = time.time() - 7200
+        for path in (waiting, stray):
+            os.utime(path, (old, old))
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            image_uploaded_at=timezone.now() - timedelta(hours=2),
+        )
+        self.gc()
+
+        self.assertFalse(os.path.exists(stray))
+        self.assertTrue(os.path.exists(waiting))
+
+    def test_upload_hashed_while_parsed(self):
+        """Test the upload is hashed by the upload handler."""
+        image = image_bytes()
+        digest = hashlib.sha256(image.getvalue()).hexdigest()
+
+        with patch('recipe.images.hashlib.sha256') as patched_sha256:
+            self.upload(image)
+        patched_sha256.assert_called_once_with()
+        self.backend.jobs.clear()
+
+        self.upload(image_bytes())
+        self.run_pending()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_blob.sha256, digest)
+        self.assertEqual(
+            self.recipe.image.name,
+            images.blob_name(digest, 'large', 'jpg'),
+        )
+
+
+@override_settings(
+    RECIPE_IMAGE_BACKEND='memory',
+    RECIPE_IMAGE_SIZES={'large': 800},
+)
+class ImageBlobTests(TestCase):
+    """Test sharing stored images between recipes."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        staging_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, staging_root)
+        override = override_settings(RECIPE_IMAGE_STAGING_ROOT=staging_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def tearDown(self):
+        for variants in ImageBlob.objects.values_list('variants', flat=True):
+            images.delete_files(images.variant_names(variants))
+
+    def create_recipe(self):
+        return Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+
+    def process(self, recipe, image):
+        """Process image as the recipe's image, like a worker would."""
+        upload_id, digest = images.stage_upload(
+            SimpleUploadedFile('a.jpg', image.getvalue())
+        )
+        Recipe.objects.filter(pk=recipe.pk).update(image_upload_id=upload_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            images.process_upload(recipe.id, upload_id, digest)
+        recipe.refresh_from_db()
+
+    def test_same_image_stored_once(self):
+        """Test recipes with the same image share one blob."""
+        r1 = self.create_recipe()
+        r2 = self.create_recipe()
+        self.process(r1, image_bytes())
+
+        with patch('recipe.images.open_image') as patched_open:
+            self.process(r2, image_bytes())
+        patched_open.assert_not_called()
+
+        blob = ImageBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(r1.image_blob, blob)
+        self.assertEqual(r2.image_blob, blob)
+        self.assertEqual(r1.image.name, r2.image.name)
+
+    def test_released_on_delete(self):
+        """Test deleting a recipe releases its image."""
+        r1 = self.create_recipe()
+        r2 = self.create_recipe()
+        self.process(r1, image_bytes())
+        self.process(r2, image_bytes())
+
+        r1.delete()
+        blob = ImageBlob.objects.get()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertIsNone(blob.released_at)
+
+        r2.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 0)
+        self.assertIsNotNone(blob.released_at)
+
+    def test_gc_after_grace_period(self):
+        """Test released images are deleted only after the grace period."""
+        recipe = self.create_recipe()
+        self.process(recipe, image_bytes())
+        name = recipe.image.name
+        recipe.delete()
+
+        call_command('gc_recipe_images', stdout=io.StringIO())
+        self.assertTrue(ImageBlob.objects.exists())
+
+        call_command(
+            'gc_recipe_images', grace_seconds=-60, stdout=io.StringIO(),
+        )
+        self.assertFalse(ImageBlob.objects.exists())
+        self.assertFalse(default_storage.exists(name))
+
+    def test_gc_keeps_images_in_use(self):
+        """Test images recipes use are never deleted."""
+        recipe = self.create_recipe()
+        self.process(recipe, image_bytes())
+        ImageBlob.objects.update(ref_count=0, released_at=timezone.now())
+
+        call_command(
+            'gc_recipe_images', grace_seconds=-60, stdout=io.StringIO(),
+        )
+
+        blob = ImageBlob.objects.get()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(default_storage.exists(recipe.image.name))
+
+    def test_reupload_after_gc(self):
+        """Test an image is rendered again if it was collected meanwhile."""
+        recipe = self.create_recipe()
+        with patch('recipe.images.render_blob_variants', return_value={}):
+            upload_id, digest = images.stage_upload(
+                SimpleUploadedFile('a.jpg', image_bytes().getvalue())
+            )
+            Recipe.objects.filter(pk=recipe.pk).update(
+                image_upload_id=upload_id,
+            )
+            images.process_upload(recipe.id, upload_id, digest)
+
+        recipe.refresh_from_db()
+        self.assertTrue(default_storage.exists(recipe.image.name))
+
+
+@override_settings(RECIPE_IMAGE_BACKEND='memory')
+class ImageVariantTests(TestCase):
+    """Test image sizes, srcsets and resizing."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        cache_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_root)
+        override = override_settings(RECIPE_IMAGE_CACHE_ROOT=cache_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        images.delete_files(images.image_names(self.recipe))
+
+    def process(self, image):
+        """Process image as the recipe's image, like a worker would."""
+        staging_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, staging_root)
+        with self.settings(RECIPE_IMAGE_STAGING_ROOT=staging_root):
+            upload_id, digest = images.stage_upload(image)
+            Recipe.objects.filter(pk=self.recipe.pk).update(
+                image_upload_id=upload_id,
+            )
+            images.process_upload(self.recipe.id, upload_id, digest)
+        self.recipe.refresh_from_db()
+
+    def test_sizes_rendered(self):
+        """Test every configured size is rendered on upload."""
+        self.process(SimpleUploadedFile('a.jpg', image_bytes().getvalue()))
+
+        variants = self.recipe.image_variants
+        self.assertEqual(variants['thumbnail']['width'], 200)
+        self.assertEqual(variants['medium']['width'], 600)
+        self.assertEqual(variants['large']['width'], 1600)
+
+    def test_srcset_in_list(self):
+        """Test the recipe list includes a srcset for each format."""
+        self.process(SimpleUploadedFile('a.jpg', image_bytes().getvalue()))
+
+        res = self.client.get(reverse('recipe:recipe-list'))
+
+        recipe_images = res.data['results'][0]['images']
+        thumbnail = recipe_images['sizes']['thumbnail']
+        self.assertTrue(thumbnail['webp'].startswith('http://testserver/'))
+        self.assertEqual(
+            recipe_images['srcset']['webp'].split(', ')[0],
+            f"{thumbnail['webp']} 200w",
+        )
+
+    def test_no_images_without_upload(self):
+        """Test images is null for a recipe without an image."""
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertIsNone(res.data['images'])
+
+    def test_backfill(self):
+        """Test the backfill command renders the missing sizes."""
+        with self.settings(RECIPE_IMAGE_SIZES={'large': 1600}):
+            self.process(
+                SimpleUploadedFile('a.jpg', image_bytes().getvalue())
+            )
+        large = self.recipe.image_variants['large']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('backfill_recipe_images', stdout=io.StringIO())
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            set(self.recipe.image_variants), {'thumbnail', 'medium', 'large'},
+        )
+        self.assertEqual(self.recipe.image_variants['large'], large)
+
+    def test_backfill_unprocessed_image(self):
+        """Test images from before processing are replaced with variants."""
+        original = default_storage.save(
+            'uploads/recipe/original.jpg',
+            ContentFile(image_bytes().getvalue()),
+        )
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            image=original, image_status=ImageStatus.READY,
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('backfill_recipe_images', stdout=io.StringIO())
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            self.recipe.image.name,
+            self.recipe.image_variants['large']['jpeg'],
+        )
+        self.assertFalse(default_storage.exists(original))
+
+    def test_resize(self):
+        """Test the image endpoint resizes, rounding the width up."""
+        self.process(SimpleUploadedFile('a.jpg', image_bytes().getvalue()))
+        url = reverse('recipe:recipe-image', args=[self.recipe.id])
+
+        res = self.client.get(url, {'w': 300}, HTTP_ACCEPT='image/webp')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'image/webp')
+        image = Image.open(io.BytesIO(res.content))
+        self.assertEqual(image.size, (320, 160))
+
+        with patch('recipe.images.open_image') as patched_open:
+            cached = self.client.get(url, {'w': 300}, HTTP_ACCEPT='image/webp')
+        patched_open.assert_not_called()
+        self.assertEqual(cached.content, res.content)
+
+        res = self.client.get(
+            url, {'w': 300}, HTTP_ACCEPT='image/webp',
+            HTTP_IF_NONE_MATCH=res['ETag'],
+        )
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_resize_jpeg_by_default(self):
+        """Test JPEG is returned to clients that don't accept WebP."""
+        self.process(SimpleUploadedFile('a.jpg', image_bytes().getvalue()))
+        url = reverse('recipe:recipe-image', args=[self.recipe.id])
+
+        res = self.client.get(url, {'w': 64})
+
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+
+    def test_resize_invalid_width(self):
+        """Test a missing or invalid width returns 400."""
+        self.process(SimpleUploadedFile('a.jpg', image_bytes().getvalue()))
+        url = reverse('recipe:recipe-image', args=[self.recipe.id])
+
+        res = self.client.get(url, {'w': 'wide'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_resize_without_image(self):
+        """Test resizing a recipe without an image returns 404."""
+        url = reverse('recipe:recipe-image', args=[self.recipe.id])
+
+        res = self.client.get(url, {'w': 64})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class DiskLRUCacheTests(SimpleTestCase):
+    """Test the disk cache for resized images."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def test_evicts_least_recently_used(self):
+        """Test the oldest entries are deleted once over the limit."""
+        cache = DiskLRUCache(self.root, max_bytes=25, low_water=1)
+        cache.set('a', b'a' * 10)
+        cache.set('b', b'b' * 10)
+        old = time.time() - 60
+        os.utime(cache._path('a'), (old, old))
+        os.utime(cache._path('b'), (old - 1, old - 1))
+        cache.get('b')
+
+        cache.set('c', b'c' * 10)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), b'b' * 10)
+        self.assertEqual(cache.get('c'), b'c' * 10)
+        self.assertLessEqual(cache.total_bytes(), 25)
@@ -0,0 +1,140 @@
+"""
+Tests for paginating the recipe APIs.
+"""
+import base64
+import json
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+)
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PaginationTests(TestCase):
+    """Test paginated list responses."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_walk_recipe_pages(self):
+        """Test following next links returns every recipe once."""
+        recipes = [create_recipe(self.user) for _ in range(5)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 5)
+        self.assertIsNone(res.data['previous'])
+        ids = [recipe['id'] for recipe in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids.extend(recipe['id'] for recipe in res.data['results'])
+        expected = sorted((recipe.id for recipe in recipes), reverse=True)
+        self.assertEqual(ids, expected)
+
+    def test_previous_link(self):
+        """Test the previous link returns the page before."""
+        for _ in range(4):
+            create_recipe(self.user)
+
+        first = self.client.get(RECIPES_URL, {'page_size': 2})
+        second = self.client.get(first.data['next'])
+        res = self.client.get(second.data['previous'])
+
+        self.assertEqual(res.data['results'], first.data['results'])
+        self.assertIsNone(res.data['previous'])
+        self.assertIsNotNone(res.data['next'])
+
+    def test_count_can_be_disabled(self):
+        """Test ?count=0 leaves the total count out."""
+        create_recipe(self.user)
+
+        res = self.client.get(RECIPES_URL, {'count': 0})
+
+        self.assertNotIn('count', res.data)
+        self.assertEqual(len(res.data['results']), 1)
+
+    @override_settings(API_MAX_PAGE_SIZE=2)
+    def test_page_size_capped(self):
+        """Test the requested page size is capped."""
+        for _ in range(3):
+            create_recipe(self.user)
+
+        res = self.client.get(RECIPES_URL, {'page_size': 100})
+
+        self.assertEqual(len(res.data['results']), 2)
+
+    def test_invalid_cursor(self):
+        """Test an invalid cursor returns not found."""
+        res = self.client.get(RECIPES_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tampered_cursor(self):
+        """Test cursors with values of the wrong type return not found."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        create_recipe(self.user).tags.add(tag)
+        for url, params, position in (
+            (RECIPES_URL, {}, ['abc']),
+            (RECIPES_URL, {}, [{}]),
+            (RECIPES_URL, {}, [None]),
+            (RECIPES_URL, {}, ['1e5']),
+            (RECIPES_URL, {'search': 'sample'}, ['high', 1]),
+            (RECIPES_URL, {'search': 'sample'}, [float('inf'), 1]),
+            (TAGS_URL, {}, [{}, 'x']),
+            (TAGS_URL, {}, ['Vegan', None]),
+            (TAGS_URL, {'ordering': 'popular'}, ['2', 1]),
+        ):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps({'p': position, 'r': False}).encode()
+            ).decode()
+            with self.subTest(url=url, params=params, position=position):
+                res = self.client.get(url, {**params, 'cursor': cursor})
+
+                self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_walk_tag_pages(self):
+        """Test every tag is listed once, in name order, across pages."""
+        for name in ['Dinner', 'Vegan', 'vegan 2', 'Vegan 3', 'Breakfast']:
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL, {'page_size': 2})
+        tags = list(res.data['results'])
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            tags.extend(res.data['results'])
+
+        expected = Tag.objects.order_by('-name', 'id')
+        self.assertEqual(
+            [tag['id'] for tag in tags],
+            [tag.id for tag in expected],
+        )
@@ -0,0 +1,97 @@
+"""
+Tests for parsing the recipe API query parameters.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from recipe.params import RecipeListParams
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class RecipeListParamsTests(TestCase):
+    """Test the declared recipe list parameters."""
+
+    def parse(self, query):
+        params = RecipeListParams(data=QueryDict(query))
+        params.is_valid()
+
+        return params
+
+    def test_ids_deduplicated(self):
+        """Test comma separated and repeated IDs are merged in order."""
+        params = self.parse('tags=3,1,3&tags=2, 1')
+
+        self.assertEqual(params.validated_data['tags'], [3, 1, 2])
+
+    def test_invalid_ids(self):
+        """Test non-integer and non-positive IDs are rejected."""
+        for value in ('a', '1,b', '0', '-1', '1.5'):
+            params = self.parse(f'tags_all={value}')
+            self.assertIn('tags_all', params.errors)
+
+    @override_settings(API_MAX_FILTER_IDS=3)
+    def test_length_capped(self):
+        """Test lists longer than API_MAX_FILTER_IDS are rejected."""
+        self.assertIn('tags', self.parse('tags=1,2,3,4').errors)
+        # duplicates don't count
+        self.assertNotIn('tags', self.parse('tags=1,2,3,3').errors)
+
+    def test_defaults(self):
+        """Test missing parameters are left out, or get their default."""
+        params = self.parse('')
+
+        self.assertEqual(params.validated_data, {'max_missing': 2})
+
+
+class ParamsApiTests(TestCase):
+    """Test bad query parameters return 400 rather than 500."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_bad_recipe_filter(self):
+        """Test a non-integer tag ID is a 400 naming the parameter."""
+        res = self.client.get(RECIPES_URL, {'tags': '1,chicken'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data)
+
+    def test_bad_assigned_only(self):
+        """Test a bad assigned_only is a 400."""
+        res = self.client.get(TAGS_URL, {'assigned_only': 'maybe'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('assigned_only', res.data)
+
+    def test_repeated_ids(self):
+        """Test tags can be given as a repeated parameter."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Salad',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        recipe.tags.add(tag)
+
+        res = self.client.get(f'{RECIPES_URL}?tags_all={tag.id}'
+                              f'&tags_all={tag.id}')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 1)
@@ -4,22 +4,25 @@ Tests for recipe APIs.
 from decimal import Decimal
 import tempfile
 import os
+import shutil
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import (
+    ImageStatus,
     Recipe,
     Tag,
     Ingredient
 )
 
+from recipe import images
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
@@ -97,7 +100,7 @@ class PrivateRecipeApiTests(TestCase):
         # serializer can return one item (detail) or list of items
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipe_list_limited_to_user(self):
         """Test list of recipes is limited to authenticated user."""
@@ -116,7 +119,7 @@ class PrivateRecipeApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         # if the res.data and serializer.data do not match, it would mean
         # that other user's data got passed back
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_get_recipe_detail(self):
         """Test get recipe details."""
@@ -267,6 +270,28 @@ class PrivateRecipeApiTests(TestCase):
             ).exists()
             self.assertTrue(exists)
 
+    def test_create_recipe_matches_tags_ignoring_case(self):
+        """Test tag names differing only in case reuse the same tag."""
+        tag = Tag.objects.create(user=self.user, name='Indian')
+        payload = {
+            'title': 'Dal',
+            'time_minutes': 30,
+            'price': Decimal('3.00'),
+            'tags': [{'name': 'indian'}, {'name': 'Lunch'},
+                     {'name': 'LUNCH'}],
+        }
+
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            ['Indian', 'Lunch'],
+        )
+        self.assertIn(tag, recipe.tags.all())
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
     def test_create_tag_on_update(self):
         """Test creating tag wen updating a recipe."""
         recipe = create_recipe(user=self.user)
@@ -411,9 +436,9 @@ class PrivateRecipeApiTests(TestCase):
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
 
     def test_filter_by_ingredients(self):
         """Test filtering recipes by ingredients."""
@@ -431,11 +456,14 @@ class PrivateRecipeApiTests(TestCase):
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
 
 
+# uploads are only queued by the API, so the tests run the queued jobs
+# themselves with the in-memory backend
+@override_settings(RECIPE_IMAGE_BACKEND='memory')
 class ImageUploadTests(TestCase):
     """Tests for the image upload API."""
 
@@ -447,11 +475,17 @@ class ImageUploadTests(TestCase):
         )
         self.client.force_authenticate(self.user)
         self.recipe = create_recipe(user=self.user)
+        staging_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, staging_root)
+        override = override_settings(RECIPE_IMAGE_STAGING_ROOT=staging_root)
+        override.enable()
+        self.addCleanup(override.disable)
 
     # after every test, delete the image. This is run after the test
 
     def tearDown(self):
-        self.recipe.image.delete()
+        self.recipe.refresh_from_db()
+        images.delete_files(images.image_names(self.recipe))
 
     def test_upload_image(self):
         "Test uploading an image to a recipe."
@@ -461,11 +495,17 @@ class ImageUploadTests(TestCase):
             img.save(image_file, format='JPEG')
             image_file.seek(0)
             payload = {'image': image_file}
-            res = self.client.post(url, payload, format='multipart')
+            with self.captureOnCommitCallbacks(execute=True):
+                res = self.client.post(url, payload, format='multipart')
 
-        self.recipe.refresh_from_db()
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
         self.assertIn('image', res.data)
+        self.assertEqual(res.data['image_status'], ImageStatus.PENDING)
+
+        images.get_backend().run_pending()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, ImageStatus.READY)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
     def test_upload_image_bad_request(self):
@@ -474,4 +514,4 @@ class ImageUploadTests(TestCase):
         payload = {'image': 'not_an_image'}
         res = self.client.post(url, payload, format='multipart')
 
-        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
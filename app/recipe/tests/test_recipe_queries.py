@@ -0,0 +1,208 @@
+"""
+Query count regression tests for the recipe APIs.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe.querysets import build_recipe_queryset
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe_with_relations(user, index):
+    """Create and return a recipe with two tags and two ingredients."""
+    recipe = Recipe.objects.create(
+        user=user,
+        title=f'Recipe {index}',
+        time_minutes=10,
+        price=Decimal('5.00'),
+    )
+    for name in (f'Tag {index}a', f'Tag {index}b'):
+        recipe.tags.add(Tag.objects.create(user=user, name=name))
+    for name in (f'Ingredient {index}a', f'Ingredient {index}b'):
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=user, name=name)
+        )
+
+    return recipe
+
+
+class RecipeQueryCountTests(TestCase):
+    """Test the number of queries the recipe APIs issue."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_list_query_count_constant(self):
+        """Test listing recipes doesn't issue queries per recipe."""
+        create_recipe_with_relations(self.user, 0)
+        # the page count, the recipes and one query per prefetched relation
+        with self.assertNumQueries(4):
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        for index in range(1, 10):
+            create_recipe_with_relations(self.user, index)
+        with self.assertNumQueries(4):
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 10)
+
+    def test_filtered_list_query_count(self):
+        """Test filtering recipes doesn't add queries per recipe."""
+        recipes = [
+            create_recipe_with_relations(self.user, index)
+            for index in range(5)
+        ]
+        tag_ids = ','.join(
+            str(recipe.tags.first().id) for recipe in recipes
+        )
+
+        with self.assertNumQueries(4):
+            res = self.client.get(RECIPES_URL, {'tags': tag_ids})
+        self.assertEqual(len(res.data['results']), 5)
+
+    def test_detail_query_count(self):
+        """Test retrieving a recipe prefetches its relations."""
+        recipe = create_recipe_with_relations(self.user, 0)
+
+        with self.assertNumQueries(3):
+            res = self.client.get(detail_url(recipe.id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['tags']), 2)
+        self.assertEqual(len(res.data['ingredients']), 2)
+
+    def test_prefetch_only_requested_fields(self):
+        """Test relations missing from the field set aren't prefetched."""
+        queryset = build_recipe_queryset(
+            Recipe.objects.all(), 'list', ['id', 'title', 'tags'],
+        )
+
+        lookups = queryset._prefetch_related_lookups
+        self.assertEqual([lookup.prefetch_to for lookup in lookups], ['tags'])
+
+    def test_no_prefetch_for_writes(self):
+        """Test write actions don't prefetch relations."""
+        queryset = build_recipe_queryset(
+            Recipe.objects.all(), 'destroy', ['id', 'tags', 'ingredients'],
+        )
+
+        self.assertEqual(queryset._prefetch_related_lookups, ())
+
+    def _create_payload(self, count):
+        """Return a create payload with count new tags and ingredients."""
+        return {
+            'title': 'Big recipe',
+            'time_minutes': 30,
+            'price': Decimal('9.99'),
+            'tags': [{'name': f'Tag {i}'} for i in range(count)],
+            'ingredients': [
+                {'name': f'Ingredient {i}'} for i in range(count)
+            ],
+        }
+
+    def test_create_query_count_constant(self):
+        """Test creating a recipe doesn't issue queries per relation."""
+        with CaptureQueriesContext(connection) as small:
+            res = self.client.post(
+                RECIPES_URL, self._create_payload(2), format='json',
+            )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        Tag.objects.all().delete()
+        Ingredient.objects.all().delete()
+        with CaptureQueriesContext(connection) as large:
+            res = self.client.post(
+                RECIPES_URL, self._create_payload(30), format='json',
+            )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(len(large), len(small))
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.tags.count(), 30)
+        self.assertEqual(recipe.ingredients.count(), 30)
+
+    def test_create_with_existing_relations(self):
+        """Test existing tags are reused and duplicates are collapsed."""
+        tag = Tag.objects.create(user=self.user, name='Tag 0')
+        payload = self._create_payload(2)
+        payload['tags'].append({'name': 'Tag 1'})
+
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.tags.count(), 2)
+        self.assertIn(tag, recipe.tags.all())
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_update_keeps_unchanged_links(self):
+        """Test updating with the same tags leaves their links alone."""
+        recipe = create_recipe_with_relations(self.user, 0)
+        through = Recipe.tags.through
+        link_ids = set(
+            through.objects.filter(recipe=recipe).values_list('id', flat=True)
+        )
+        payload = {
+            'tags': [{'name': tag.name} for tag in recipe.tags.all()],
+        }
+
+        with self.assertLogs('recipe.serializers', level='INFO') as logs:
+            res = self.client.patch(
+                detail_url(recipe.id), payload, format='json',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(through.objects.filter(recipe=recipe).values_list(
+                'id', flat=True,
+            )),
+            link_ids,
+        )
+        self.assertIn('0 added, 0 removed', logs.output[0])
+
+    def test_update_only_changes_diff(self):
+        """Test updating tags only adds and removes the difference."""
+        recipe = create_recipe_with_relations(self.user, 0)
+        kept, dropped = recipe.tags.order_by('id')
+        through = Recipe.tags.through
+        kept_link = through.objects.get(recipe=recipe, tag=kept)
+        payload = {'tags': [{'name': kept.name}, {'name': 'New tag'}]}
+
+        with self.assertLogs('recipe.serializers', level='INFO') as logs:
+            res = self.client.patch(
+                detail_url(recipe.id), payload, format='json',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(through.objects.filter(id=kept_link.id).exists())
+        self.assertNotIn(dropped, recipe.tags.all())
+        self.assertEqual(
+            sorted(tag['name'] for tag in res.data['tags']),
+            sorted([kept.name, 'New tag']),
+        )
+        self.assertIn('1 added, 1 removed', logs.output[0])
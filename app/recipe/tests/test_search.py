@@ -0,0 +1,187 @@
+"""
+Tests for full-text recipe search.
+"""
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+from recipe.search import InvertedIndex
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class SearchApiTests(TestCase):
+    """Test searching recipes through the API."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def search(self, query, **params):
+        res = self.client.get(RECIPES_URL, {'search': query, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return res.data
+
+    def titles(self, data):
+        return [recipe['title'] for recipe in data['results']]
+
+    def test_ranked_by_relevance(self):
+        """Test title matches rank above description matches."""
+        create_recipe(self.user, title='Soup', description='Chicken stock')
+        create_recipe(self.user, title='Chicken curry')
+        create_recipe(self.user, title='Beef stew')
+
+        data = self.search('chicken')
+
+        self.assertEqual(self.titles(data), ['Chicken curry', 'Soup'])
+        self.assertEqual(data['count'], 2)
+
+    def test_all_words_must_match(self):
+        """Test every search word has to be found."""
+        create_recipe(self.user, title='Chicken curry')
+        create_recipe(self.user, title='Chicken soup')
+
+        data = self.search('chicken curry')
+
+        self.assertEqual(self.titles(data), ['Chicken curry'])
+
+    def test_excluded_word(self):
+        """Test words prefixed with '-' exclude recipes."""
+        create_recipe(self.user, title='Chicken curry')
+        create_recipe(self.user, title='Chicken soup')
+
+        data = self.search('chicken -soup')
+
+        self.assertEqual(self.titles(data), ['Chicken curry'])
+
+    def test_tag_and_ingredient_names(self):
+        """Test tag and ingredient names are searched."""
+        r1 = create_recipe(self.user, title='Weeknight dinner')
+        r2 = create_recipe(self.user, title='Lunch')
+        r1.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        r2.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Chickpeas'),
+        )
+
+        self.assertEqual(self.titles(self.search('vegan')), [r1.title])
+        self.assertEqual(self.titles(self.search('chickpea')), [r2.title])
+
+    def test_created_through_api_is_searchable(self):
+        """Test recipes created with tags through the API are found."""
+        self.client.post(RECIPES_URL, {
+            'title': 'Dinner',
+            'time_minutes': 10,
+            'price': '5.00',
+            'tags': [{'name': 'Thai'}],
+        }, format='json')
+
+        self.assertEqual(self.titles(self.search('thai')), ['Dinner'])
+
+    def test_search_sees_updates(self):
+        """Test edits are searchable straight away."""
+        recipe = create_recipe(self.user, title='Chicken curry')
+        tag = Tag.objects.create(user=self.user, name='Spicy')
+        recipe.tags.add(tag)
+        self.search('chicken')
+
+        recipe.title = 'Lamb curry'
+        recipe.save()
+        tag.name = 'Mild'
+        tag.save()
+
+        self.assertEqual(self.titles(self.search('chicken')), [])
+        self.assertEqual(self.titles(self.search('lamb mild')), ['Lamb curry'])
+
+    def test_limited_to_user(self):
+        """Test other users' recipes are never returned."""
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        create_recipe(other, title='Chicken curry')
+
+        self.assertEqual(self.titles(self.search('chicken')), [])
+
+    def test_paginated_by_rank(self):
+        """Test search results page in rank order."""
+        create_recipe(self.user, title='Curry', description='chicken')
+        create_recipe(self.user, title='Chicken chicken')
+        create_recipe(self.user, title='Chicken')
+        create_recipe(self.user, title='Chicken pie')
+
+        data = self.search('chicken', page_size=2)
+        titles = self.titles(data)
+        while data['next']:
+            data = self.client.get(data['next']).data
+            titles.extend(self.titles(data))
+
+        self.assertEqual(titles[0], 'Chicken chicken')
+        self.assertEqual(titles[-1], 'Curry')
+        self.assertEqual(len(titles), 4)
+
+    def test_blank_search_lists_everything(self):
+        """Test an empty search doesn't filter."""
+        create_recipe(self.user, title='Chicken curry')
+        create_recipe(self.user, title='Beef stew')
+
+        self.assertEqual(len(self.search(' ')['results']), 2)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Needs PostgreSQL.')
+    def test_search_vector_maintained(self):
+        """Test the stored search vector follows the recipe's data."""
+        recipe = create_recipe(self.user, title='Chicken curry')
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Coconut'),
+        )
+
+        recipe.refresh_from_db()
+
+        self.assertRegex(recipe.search_vector, r"'coconut':\d+B")
+        self.assertIn("'chicken':1A", recipe.search_vector)
+
+
+class InvertedIndexTests(SimpleTestCase):
+    """Test the search fallback for databases without full-text."""
+
+    def test_scores_by_weight(self):
+        """Test terms in heavier fields score higher."""
+        index = InvertedIndex()
+        index.add(1, [('A', 'Chicken curry')])
+        index.add(2, [('A', 'Curry'), ('C', 'with chicken')])
+
+        scores = index.search('chicken curry')
+
+        self.assertGreater(scores[1], scores[2])
+
+    def test_plurals_match(self):
+        """Test a plural matches its singular."""
+        index = InvertedIndex()
+        index.add(1, [('B', 'Carrots')])
+
+        self.assertEqual(list(index.search('carrot')), [1])
@@ -0,0 +1,186 @@
+"""
+Tests for sparse fieldsets on the recipe APIs.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+from recipe.serializers import RecipeSerializer
+from recipe.views import FIELDS_HEADER
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+COOKABLE_URL = reverse('recipe:recipe-cookable')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class SparseFieldsTests(TestCase):
+    """Test ?fields= and ?omit= on recipe reads."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Tofu curry',
+            time_minutes=20,
+            price=Decimal('7.50'),
+            description='A long description.',
+        )
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        self.recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Tofu'),
+        )
+
+    def test_list_fields(self):
+        """Test a list returns only the fields asked for."""
+        for from_rows in (True, False):
+            cache.clear()
+            with self.subTest(from_rows=from_rows), \
+                    override_settings(RECIPE_LIST_FROM_ROWS=from_rows):
+                res = self.client.get(
+                    RECIPES_URL, {'fields': 'title,id,time_minutes'},
+                )
+
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+                self.assertEqual(res.data['results'], [{
+                    'id': self.recipe.id,
+                    'title': 'Tofu curry',
+                    'time_minutes': 20,
+                }])
+                # in the serializer's order, whatever order they were
+                # asked for in
+                self.assertEqual(res[FIELDS_HEADER], 'id,title,time_minutes')
+
+    def test_list_omit(self):
+        """Test fields can be left out of a list."""
+        res = self.client.get(RECIPES_URL, {'omit': 'tags,ingredients'})
+
+        self.assertEqual(
+            res[FIELDS_HEADER], 'id,title,time_minutes,price,link,images',
+        )
+        self.assertNotIn('tags', res.data['results'][0])
+
+    def test_all_fields_advertised(self):
+        """Test the header lists every field without ?fields=."""
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(
+            res[FIELDS_HEADER].split(','),
+            list(res.data),
+        )
+        self.assertIn('description', res.data)
+
+    def test_detail_fields(self):
+        """Test a detail read returns only the fields asked for."""
+        res = self.client.get(
+            detail_url(self.recipe.id), {'fields': 'id,description'},
+        )
+
+        self.assertEqual(res.data, {
+            'id': self.recipe.id,
+            'description': 'A long description.',
+        })
+
+    def test_cookable_fields(self):
+        """Test cookable results can be narrowed too."""
+        res = self.client.get(
+            COOKABLE_URL,
+            {'ingredient_names': 'tofu', 'fields': 'id,missing_count'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data['results'],
+            [{'id': self.recipe.id, 'missing_count': 0}],
+        )
+
+    def test_unknown_field(self):
+        """Test asking for a field the endpoint lacks is a 400."""
+        res = self.client.get(RECIPES_URL, {
+            'fields': 'id,secret',
+            'omit': 'description',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(res.data), {'fields', 'omit'})
+        self.assertNotIn(FIELDS_HEADER, res)
+
+    def test_nothing_left(self):
+        """Test a selection leaving no fields is a 400."""
+        for params in (
+            {'omit': ','.join(RecipeSerializer.Meta.fields)},
+            {'fields': 'id,title', 'omit': 'title,id'},
+        ):
+            with self.subTest(params=params):
+                res = self.client.get(RECIPES_URL, params)
+
+                self.assertEqual(
+                    res.status_code, status.HTTP_400_BAD_REQUEST,
+                )
+                self.assertIn('omit', res.data)
+                self.assertNotIn(FIELDS_HEADER, res)
+
+    def test_writes_return_every_field(self):
+        """Test ?fields= doesn't narrow what a write returns."""
+        res = self.client.patch(
+            f'{detail_url(self.recipe.id)}?fields=id',
+            {'title': 'Tofu stew'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('description', res.data)
+        self.assertNotIn(FIELDS_HEADER, res)
+
+    @override_settings(RECIPE_LIST_FROM_ROWS=False)
+    def test_unused_columns_and_relations_not_loaded(self):
+        """Test unrequested columns and relations aren't queried."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(RECIPES_URL, {'fields': 'id,title'})
+        sql = '\n'.join(query['sql'] for query in queries)
+
+        self.assertIn('"title"', sql)
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('"price"', sql)
+        self.assertNotIn('core_tag', sql)
+        self.assertNotIn('core_ingredient', sql)
+
+    def test_detail_defers_omitted_columns(self):
+        """Test an omitted column isn't read for a detail either."""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(
+                detail_url(self.recipe.id), {'omit': 'description'},
+            )
+        sql = '\n'.join(query['sql'] for query in queries)
+
+        self.assertNotIn('description', res.data)
+        self.assertNotIn('"description"', sql)
+        self.assertIn('"image_variants"', sql)
+
+    @override_settings(RECIPE_CACHE_SHARED=True)
+    def test_field_order_shares_cache(self):
+        """Test the same fields in another order hit the cached list."""
+        self.client.get(RECIPES_URL, {'fields': 'id,title'})
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPES_URL, {'fields': 'title,id'})
+
+        self.assertEqual(res[FIELDS_HEADER], 'id,title')
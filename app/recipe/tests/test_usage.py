@@ -0,0 +1,215 @@
+"""
+Tests for tag and ingredient usage counts.
+"""
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+
+
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class UsageCountApiTests(TestCase):
+    """Test listing tags and ingredients with their recipe counts."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.tags = {
+            name: Tag.objects.create(user=self.user, name=name)
+            for name in ('Dinner', 'Quick', 'Vegan', 'Unused')
+        }
+        for title, names in (
+            ('Curry', ['Dinner', 'Vegan']),
+            ('Salad', ['Quick', 'Vegan']),
+            ('Stew', ['Dinner', 'Vegan']),
+        ):
+            create_recipe(self.user, title=title).tags.add(
+                *[self.tags[name] for name in names]
+            )
+
+    def counts(self, url=TAGS_URL, **params):
+        res = self.client.get(url, {'with_counts': 1, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return [(item['name'], item['recipe_count'])
+                for item in res.data['results']]
+
+    def test_with_counts(self):
+        """Test ?with_counts=1 adds how many recipes use each tag."""
+        self.assertEqual(
+            self.counts(),
+            [('Vegan', 3), ('Unused', 0), ('Quick', 1), ('Dinner', 2)],
+        )
+
+    def test_counts_not_included_by_default(self):
+        """Test recipe_count is only included when asked for."""
+        res = self.client.get(TAGS_URL)
+
+        self.assertNotIn('recipe_count', res.data['results'][0])
+
+    def test_counts_assigned_only(self):
+        """Test counts and assigned_only combine without duplicates."""
+        self.assertEqual(
+            self.counts(assigned_only=1),
+            [('Vegan', 3), ('Quick', 1), ('Dinner', 2)],
+        )
+
+    def test_popular_ordering_pages(self):
+        """Test ?ordering=popular pages through the most used first."""
+        data = self.client.get(TAGS_URL, {
+            'ordering': 'popular', 'with_counts': 1, 'page_size': 1,
+        }).data
+        results = data['results']
+        while data['next']:
+            data = self.client.get(data['next']).data
+            results.extend(data['results'])
+
+        self.assertEqual(
+            [tag['name'] for tag in results],
+            ['Vegan', 'Dinner', 'Quick', 'Unused'],
+        )
+
+    def test_invalid_ordering(self):
+        """Test an unknown ordering is a 400."""
+        res = self.client.get(TAGS_URL, {'ordering': 'random'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_counted_in_one_query(self):
+        """Test counting doesn't cost a query per tag."""
+        with self.assertNumQueries(1) as context:
+            self.counts(count=0, assigned_only=1)
+
+        sql = context.captured_queries[0]['sql']
+        self.assertIn('GROUP BY', sql)
+        self.assertNotIn('DISTINCT', sql)
+
+    def test_ingredient_counts(self):
+        """Test ingredients are counted too."""
+        flour = Ingredient.objects.create(user=self.user, name='Flour')
+        Recipe.objects.get(title='Stew').ingredients.add(flour)
+
+        self.assertEqual(self.counts(INGREDIENTS_URL), [('Flour', 1)])
+
+
+@override_settings(RECIPE_USAGE_COUNTS=True)
+class StoredUsageCountTests(TestCase):
+    """Test the stored usage_count columns are kept up to date."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe = create_recipe(self.user, title='Curry')
+
+    def usage_count(self, obj=None):
+        obj = obj or self.tag
+        obj.refresh_from_db()
+
+        return obj.usage_count
+
+    def test_orm_changes(self):
+        """Test adding, removing and clearing links recount."""
+        self.recipe.tags.add(self.tag)
+        self.assertEqual(self.usage_count(), 1)
+
+        self.tag.recipe_set.add(create_recipe(self.user, title='Stew'))
+        self.assertEqual(self.usage_count(), 2)
+
+        self.recipe.tags.remove(self.tag)
+        self.assertEqual(self.usage_count(), 1)
+
+        self.tag.recipe_set.clear()
+        self.assertEqual(self.usage_count(), 0)
+
+    def test_recipe_links_cleared(self):
+        """Test clearing a recipe's ingredients updates both counts."""
+        flour = Ingredient.objects.create(user=self.user, name='Flour')
+        self.recipe.ingredients.add(flour)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.ingredient_count, 1)
+
+        self.recipe.ingredients.clear()
+
+        self.assertEqual(self.usage_count(flour), 0)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.ingredient_count, 0)
+
+    def test_api_changes(self):
+        """Test links written through the API recount."""
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Stew',
+            'time_minutes': 10,
+            'price': '5.00',
+            'tags': [{'name': 'Vegan'}],
+            'ingredients': [{'name': 'Lentils'}],
+        }, format='json')
+        self.assertEqual(self.usage_count(), 1)
+        lentils = Ingredient.objects.get(name='Lentils')
+        self.assertEqual(self.usage_count(lentils), 1)
+
+        self.client.patch(
+            reverse('recipe:recipe-detail', args=[res.data['id']]),
+            {'tags': []},
+            format='json',
+        )
+        self.assertEqual(self.usage_count(), 0)
+
+    def test_recipe_deleted(self):
+        """Test deleting a recipe recounts its tags."""
+        self.recipe.tags.add(self.tag)
+
+        self.recipe.delete()
+
+        self.assertEqual(self.usage_count(), 0)
+
+    def test_list_uses_stored_count(self):
+        """Test the list reads the stored column instead of grouping."""
+        self.recipe.tags.add(self.tag)
+
+        with self.assertNumQueries(1) as context:
+            res = self.client.get(TAGS_URL, {'with_counts': 1, 'count': 0})
+
+        self.assertEqual(res.data['results'][0]['recipe_count'], 1)
+        self.assertNotIn('GROUP BY', context.captured_queries[0]['sql'])
+
+    def test_recount_command(self):
+        """Test the command fixes counts that have drifted."""
+        self.recipe.tags.add(self.tag)
+        Tag.objects.update(usage_count=7)
+
+        call_command('recount_recipe_usage', stdout=StringIO())
+
+        self.assertEqual(self.usage_count(), 1)
@@ -0,0 +1,89 @@
+"""
+How many recipes use each tag and ingredient.
+
+By default the count is a LEFT JOIN on the link table grouped by tag,
+so a whole page of tags is counted in the query that lists them. For
+accounts with very many recipes, RECIPE_USAGE_COUNTS switches to the
+usage_count column stored on every tag and ingredient, kept up to date
+whenever links change. After turning it on, fill the column with
+`manage.py recount_recipe_usage`.
+"""
+from django.conf import settings
+from django.db.models import (
+    Count,
+    Exists,
+    F,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Value,
+)
+from django.db.models.functions import Coalesce
+
+from core.models import Ingredient, Recipe, Tag
+
+
+# the recipe relation behind each counted model
+RELATIONS = {Tag: 'tags', Ingredient: 'ingredients'}
+
+
+def _links(field):
+    """Return the through model and related column of a relation."""
+    m2m = getattr(Recipe, field).field
+    return m2m.remote_field.through, f'{m2m.m2m_reverse_field_name()}_id'
+
+
+def usage_counts_stored():
+    """Return whether the stored usage_count columns are maintained."""
+    return settings.RECIPE_USAGE_COUNTS
+
+
+def filter_assigned(queryset):
+    """Filter tags or ingredients to those used by a recipe."""
+    through, target = _links(RELATIONS[queryset.model])
+
+    return queryset.filter(
+        Exists(through.objects.filter(**{target: OuterRef('pk')}))
+    )
+
+
+def with_usage_counts(queryset):
+    """Annotate tags or ingredients with recipe_count."""
+    if usage_counts_stored():
+        return queryset.annotate(recipe_count=F('usage_count'))
+
+    return queryset.annotate(recipe_count=Count('recipe'))
+
+
+def _usage_count(field):
+    """Return a subquery counting the links to the outer tag/ingredient."""
+    through, target = _links(field)
+
+    return Coalesce(
+        Subquery(
+            through.objects.filter(
+                **{target: OuterRef('pk')}
+            ).order_by().values(target).annotate(
+                count=Count('*'),
+            ).values('count'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def update_usage_counts(field, ids):
+    """Recount the recipes using the given tags or ingredients."""
+    ids = list(ids)
+    if not ids or not usage_counts_stored():
+        return
+    model = getattr(Recipe, field).field.related_model
+    # counted by the UPDATE itself, like Recipe.ingredient_count
+    model.objects.filter(pk__in=ids).update(usage_count=_usage_count(field))
+
+
+def recount_all(field):
+    """Recount every tag or ingredient, returning how many there are."""
+    model = getattr(Recipe, field).field.related_model
+
+    return model.objects.update(usage_count=_usage_count(field))
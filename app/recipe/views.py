@@ -7,44 +7,125 @@ from drf_spectacular.utils import (
     OpenApiParameter,
     OpenApiTypes,
 )
+import hashlib
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils import timezone
+from django.utils.http import parse_etags
 from rest_framework import (
     viewsets,
     mixins,
     status,
 )
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.settings import api_settings
 
+from core.authentication import (
+    CachedTokenAuthentication,
+    SignedTokenAuthentication,
+)
 from core.models import (
+    ImageStatus,
     Recipe,
     Tag,
     Ingredient
 )
-from recipe import serializers
+from recipe import images, serializers, usage
+from recipe.bulk import (
+    export_recipes,
+    import_recipes,
+)
+from recipe.cache import (
+    CachedListMixin,
+    ConditionalGetMixin,
+)
+from recipe.cookable import cookable_recipes
+from recipe.filters import FILTER_FIELDS, MODES, apply_filters
+from recipe.pagination import (
+    RecipePagination,
+    RecipeAttrPagination,
+)
+from recipe.params import (
+    QueryParamsMixin,
+    RecipeAttrListParams,
+    RecipeListParams,
+)
+from recipe.parsers import NDJSONParser
+from recipe.renderers import ImageRenderer
+from recipe.rows import RowListMixin
+from recipe.querysets import PREFETCH_ACTIONS, build_recipe_queryset
+from recipe.search import search_recipes
+
+# the response header listing the fields a recipe read returned
+FIELDS_HEADER = 'X-Fields'
+
+SPARSE_FIELDS_PARAMETERS = [
+    OpenApiParameter(
+        'fields',
+        OpenApiTypes.STR,
+        description='Comma separated fields to return (default all)',
+    ),
+    OpenApiParameter(
+        'omit',
+        OpenApiTypes.STR,
+        description='Comma separated fields to leave out',
+    ),
+]
+
 
 # we want to extend the schema for the 'list' endpoint
 @extend_schema_view(
+    retrieve=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
     list=extend_schema(
         parameters=[
+            *SPARSE_FIELDS_PARAMETERS,
             OpenApiParameter(
                 'tags',
                 OpenApiTypes.STR,
-                description='Comma separated list of IDs to filter',
+                description='Comma separated list of IDs to filter '
+                            '(same as tags_any)',
             ),
             OpenApiParameter(
                 'ingredients',
                 OpenApiTypes.STR,
-                description='Comma separated list of ingredient IDs to filter'
-            )
+                description='Comma separated list of ingredient IDs to filter '
+                            '(same as ingredients_any)',
+            ),
+            *[
+                OpenApiParameter(
+                    f'{field}_{mode}',
+                    OpenApiTypes.STR,
+                    description=f'Comma separated {field} IDs; recipes '
+                                f'must have {mode} of them',
+                )
+                for field in FILTER_FIELDS
+                for mode in MODES
+            ],
+            OpenApiParameter(
+                'search',
+                OpenApiTypes.STR,
+                description='Words to search titles, descriptions, tags and '
+                            'ingredients for; results are ordered by '
+                            'relevance',
+            ),
         ]
     )
 )
 
 # ModelViewSet is specifically set up to work directly with Model
 # we're going to use a lot of existing logic defined in serializers.py
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(QueryParamsMixin,
+                    ConditionalGetMixin,
+                    CachedListMixin,
+                    RowListMixin,
+                    viewsets.ModelViewSet):
     """View for manage recipe APIs."""
     serializer_class = serializers.RecipeDetailSerializer
     ## serializer_class = serializers.RecipeSerializer
@@ -55,32 +136,148 @@ class RecipeViewSet(viewsets.ModelViewSet):
     # through this API or through our model view
     queryset = Recipe.objects.all()
     # in order to access any data it has to use token authentication and be authenticated
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        SignedTokenAuthentication,
+        CachedTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
-
-    def _params_to_ints(self, qs):
-        """Convera a list of strings to integers."""
-        return [int(str_id) for str_id in qs.split(',')]
+    pagination_class = RecipePagination
+    query_params_class = RecipeListParams
 
     def get_queryset(self):
         """Retrieve recipes for authenticated user."""
         # adding additional filter to filter by user
         # return self.queryset.filter(user=self.request.user).order_by('-id')
 
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
-        queryset = self.queryset
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
-        if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
-
-        return queryset.filter(
+        # columns maintained by the database (see recipe/search.py and
+        # recipe/cookable.py). Deferring them also keeps save() from
+        # writing back a stale copy.
+        queryset = self.queryset.defer('search_vector', 'ingredient_count')
+        # subqueries rather than joins, so no distinct() is needed
+        queryset = apply_filters(queryset, self.get_relation_filters())
+
+        queryset = queryset.filter(
             user=self.request.user
-        ).order_by('-id').distinct()
+        ).order_by('-id')
+        if self.action == 'cookable':
+            queryset = cookable_recipes(
+                queryset, *self.get_pantry(),
+            ).order_by('missing_count', '-matched_count', '-id')
+        search_query = self.get_search_query()
+        if search_query:
+            queryset = search_recipes(
+                queryset, search_query, self.request.user.pk,
+            ).order_by('-rank', '-id')
+
+        # load only the columns and nested tags/ingredients the serializer
+        # will render, so a list doesn't cost two extra queries per recipe
+        # or read descriptions nobody asked for
+        return build_recipe_queryset(
+            queryset, self.action, self.get_response_fields(),
+        )
+
+    def get_response_fields(self):
+        """Return the fields to render, narrowed by ?fields= and ?omit=."""
+        available = self.get_serializer_class().Meta.fields
+        if self.action not in PREFETCH_ACTIONS:
+            return available
+        params = self.get_query_params()
+        errors = {
+            param: [f'Unknown field: {name}.' for name in params[param]
+                    if name not in available]
+            for param in ('fields', 'omit') if param in params
+        }
+        errors = {param: names for param, names in errors.items() if names}
+        if errors:
+            raise ValidationError(errors)
+        fields = params.get('fields') or available
+        fields = [
+            name for name in available
+            if name in fields and name not in params.get('omit', [])
+        ]
+        if not fields:
+            # rather than a list of empty objects
+            raise ValidationError({
+                'omit' if 'omit' in params else 'fields': [
+                    'At least one field must be left to return.',
+                ],
+            })
+
+        return fields
+
+    def get_serializer_context(self):
+        """Pass the fields to render on to the serializer."""
+        context = super().get_serializer_context()
+        if self.action in PREFETCH_ACTIONS:
+            context['fields'] = self.get_response_fields()
 
+        return context
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Tell clients which fields a read returned."""
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if self.action in PREFETCH_ACTIONS and \
+                response.status_code == status.HTTP_200_OK:
+            response[FIELDS_HEADER] = ','.join(self.get_response_fields())
+
+        return response
+
+
+    def get_relation_filters(self):
+        """Return the {(field, mode): ids} tag/ingredient filters asked for."""
+        params = self.get_query_params()
+        filters = {}
+        for field in FILTER_FIELDS:
+            for mode in MODES:
+                if params.get(f'{field}_{mode}'):
+                    filters[field, mode] = params[f'{field}_{mode}']
+            # the older ?tags=1,2 and ?ingredients=1,2 mean any of them.
+            # cookable takes the ingredients on hand in ?ingredients=.
+            if params.get(field) and \
+                    (field, self.action) != ('ingredients', 'cookable'):
+                filters[field, 'any'] = [
+                    *filters.get((field, 'any'), []), *params[field],
+                ]
+
+        return filters
+
+    def get_search_query(self):
+        """Return the full-text search query, if any."""
+        if self.action != 'list':
+            return ''
+        return self.get_query_params().get('search', '').strip()
+
+    def get_pantry(self):
+        """Return the ingredient IDs and max_missing for cookable."""
+        params = self.get_query_params()
+        ingredient_ids = set(params.get('ingredients', []))
+        names = params.get('ingredient_names')
+        if names:
+            ingredient_ids.update(
+                Ingredient.objects.filter(
+                    user=self.request.user,
+                ).annotate(lower_name=Lower('name')).filter(
+                    lower_name__any=[name.lower() for name in names],
+                ).values_list('id', flat=True)
+            )
+
+        return ingredient_ids, params['max_missing']
+
+    def get_pagination_ordering(self):
+        """Page search results by relevance, cookable ones by coverage."""
+        if self.action == 'cookable':
+            return ('missing_count', '-matched_count', '-id')
+        if self.get_search_query():
+            return ('-rank', '-id')
+        return None
+
+    def retrieve(self, request, *args, **kwargs):
+        """Retrieve a recipe, or 304 if the client's copy is current."""
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
 
     def get_serializer_class(self):
         """Return the serializer class for request."""
@@ -89,6 +286,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action in ('bulk', 'export'):
+            return serializers.RecipeBulkSerializer
+        elif self.action == 'cookable':
+            return serializers.RecipeCookableSerializer
 
         return self.serializer_class
 
@@ -106,16 +307,163 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
         """Upload an image to recipe."""
+        # hash the file while the body is parsed, instead of reading it
+        # again afterwards; must be added before request.data is touched
+        hashing = images.HashingUploadHandler(request)
+        request.upload_handlers.insert(0, hashing)
         recipe = self.get_object()
         serializer = self.get_serializer(recipe, data=request.data)
 
         if serializer.is_valid():
-            #save the image to the database
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            # only stage the upload here; a background worker verifies,
+            # resizes and saves it, and image_status shows when it's done
+            upload_id, digest = images.stage_upload(
+                serializer.validated_data['image'],
+                hashing.hashes.get('image'),
+            )
+            recipe.image_status = ImageStatus.PENDING
+            recipe.image_upload_id = upload_id
+            recipe.image_uploaded_at = timezone.now()
+            recipe.save(update_fields=[
+                'image_status', 'image_upload_id', 'image_uploaded_at',
+            ])
+            images.enqueue(
+                images.process_upload, recipe.id, upload_id, digest,
+            )
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    # browsers ask for images with Accept: image/webp,..., so the action
+    # has to offer an image media type to pass content negotiation
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'w',
+                OpenApiTypes.INT,
+                required=True,
+                description='Width in pixels, rounded up to a multiple '
+                            'of RECIPE_IMAGE_RESIZE_STEP.',
+            )
+        ],
+        responses={(200, 'image/*'): OpenApiTypes.BINARY},
+    )
+    @action(
+        methods=['GET'],
+        detail=True,
+        url_path='image',
+        renderer_classes=[
+            *api_settings.DEFAULT_RENDERER_CLASSES, ImageRenderer,
+        ],
+    )
+    def image(self, request, pk=None):
+        """Return the recipe image resized to a width, WebP if accepted."""
+        recipe = self.get_object()
+        # the previous image is still served while a new upload is
+        # pending or after it failed; images from before variants only
+        # while they're READY
+        if not recipe.image_variants and \
+                recipe.image_status != ImageStatus.READY:
+            raise NotFound('Recipe has no processed image.')
+        try:
+            width = images.resize_width(request.query_params.get('w'))
+        except ValueError as exc:
+            raise ValidationError({'w': str(exc)})
+        fmt = 'webp' if 'image/webp' in request.META.get(
+            'HTTP_ACCEPT', ''
+        ) else 'jpeg'
+
+        etag = '"{}"'.format(hashlib.md5(
+            f'{recipe.image.name}:{width}:{fmt}'.encode()
+        ).hexdigest())
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(
+                images.resized_image(recipe, width, fmt),
+                content_type=f'image/{fmt}',
+            )
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Accept', 'Authorization'])
+
+        return response
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'ingredients',
+                OpenApiTypes.STR,
+                description='Comma separated IDs of the ingredients on hand',
+            ),
+            OpenApiParameter(
+                'ingredient_names',
+                OpenApiTypes.STR,
+                description='Comma separated names of the ingredients on '
+                            'hand, matched case insensitively',
+            ),
+            OpenApiParameter(
+                'max_missing',
+                OpenApiTypes.INT,
+                description='Leave out recipes missing more ingredients '
+                            'than this (default 2)',
+            ),
+            OpenApiParameter(
+                'tags',
+                OpenApiTypes.STR,
+                description='Comma separated list of IDs to filter',
+            ),
+        ],
+    )
+    @action(methods=['GET'], detail=False, url_path='cookable')
+    def cookable(self, request):
+        """List recipes by how many of their ingredients are on hand."""
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+
+        return self.get_paginated_response(serializer.data)
+
+    # the NDJSON parser hands back a lazy iterator over the body lines,
+    # so a large import is validated and inserted chunk by chunk
+    @extend_schema(
+        request={'application/x-ndjson': serializers.RecipeBulkSerializer},
+    )
+    @action(
+        methods=['POST'],
+        detail=False,
+        url_path='bulk',
+        parser_classes=[NDJSONParser],
+    )
+    def bulk(self, request):
+        """Create recipes from newline delimited JSON."""
+        results = import_recipes(
+            request.data,
+            self.get_serializer_class(),
+            self.get_serializer_context(),
+            settings.RECIPE_BULK_CHUNK_SIZE,
+        )
+        created = sum(result['status'] == 'created' for result in results)
+
+        return Response({
+            'created': created,
+            'failed': len(results) - created,
+            'results': results,
+        }, status=status.HTTP_200_OK)
+
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        """Stream the user's recipes as newline delimited JSON."""
+        lines = export_recipes(
+            self.get_queryset(),
+            self.get_serializer_class(),
+            settings.RECIPE_BULK_CHUNK_SIZE,
+        )
+
+        return StreamingHttpResponse(
+            lines,
+            content_type='application/x-ndjson',
+        )
+
 # base class for recipe attributes (tag/ingredients)
 @extend_schema_view(
     list=extend_schema(
@@ -124,32 +472,81 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 'assigned_only',
                 OpenApiTypes.INT, enum=[0, 1],
                 description='Filter by items assigned to recipes.',
-            )
+            ),
+            OpenApiParameter(
+                'with_counts',
+                OpenApiTypes.INT, enum=[0, 1],
+                description='Include recipe_count, the number of recipes '
+                            'using each item.',
+            ),
+            OpenApiParameter(
+                'ordering',
+                OpenApiTypes.STR, enum=['name', 'popular'],
+                description='Order by name (default) or by most used '
+                            'first.',
+            ),
         ]
     )
 )
-class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
+class BaseRecipeAttrViewSet(QueryParamsMixin,
+                            ConditionalGetMixin,
+                            CachedListMixin,
+                            mixins.DestroyModelMixin,
                             mixins.UpdateModelMixin,
                             mixins.ListModelMixin,
                             viewsets.GenericViewSet):
     """Base viewset for recipe attributes."""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        SignedTokenAuthentication,
+        CachedTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeAttrPagination
+    query_params_class = RecipeAttrListParams
+    # serializer adding recipe_count, for ?with_counts=1
+    count_serializer_class = None
 
     # we want to override the default get_queryset functionality
     # so that we only return the queryset objects for the authenticated
     def get_queryset(self):
         """Filter queryset to authenticated user."""
-        assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0))
-        )
-        queryset = self.queryset
-        if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+        queryset = self.queryset.filter(user=self.request.user)
+        if self.action != 'list':
+            return queryset.order_by('-name')
 
-        return queryset.filter(
-            user=self.request.user
-            ).order_by('-name').distinct()
+        params = self.get_query_params()
+        if params['assigned_only']:
+            # EXISTS on the link table, so no join to make distinct()
+            queryset = usage.filter_assigned(queryset)
+        if params['with_counts'] or params['ordering'] == 'popular':
+            queryset = usage.with_usage_counts(queryset)
+
+        return queryset.order_by('-name')
+
+    def get_pagination_ordering(self):
+        """Page by most used first for ?ordering=popular."""
+        if self.action == 'list' and \
+                self.get_query_params()['ordering'] == 'popular':
+            return ('-recipe_count', '-id')
+        return None
+
+    def perform_update(self, serializer):
+        """Save a rename, unless another item has the name in any case."""
+        try:
+            # a savepoint, so the request's transaction survives the error
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
+            raise ValidationError({
+                'name': ['You already have one with this name.'],
+            })
+
+    def get_serializer_class(self):
+        """Return the serializer class for request."""
+        if self.action == 'list' and self.get_query_params()['with_counts']:
+            return self.count_serializer_class
+
+        return self.serializer_class
 
 # below comment was before refactoring
 # we're using viewset since we just need CRUD functionalities (out of the box)
@@ -158,10 +555,12 @@ class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
 class TagViewSet(BaseRecipeAttrViewSet):
     """Manage tags in the database."""
     serializer_class = serializers.TagSerializer
+    count_serializer_class = serializers.TagCountSerializer
     queryset = Tag.objects.all()
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage ingredients in the database."""
     serializer_class = serializers.IngredientSerializer
+    count_serializer_class = serializers.IngredientCountSerializer
     queryset = Ingredient.objects.all()
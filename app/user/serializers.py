@@ -8,6 +8,8 @@ from django.contrib.auth import (
 from django.utils.translation import gettext as _
 from rest_framework import serializers
 
+from core import tokens
+
 # ModelSerializer (provided by Django rest framework) allows us to automatically validate and save things to a model that we define in the serializer
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for the user object."""
@@ -65,6 +67,12 @@ class AuthTokenSerializer(serializers.Serializer):
         style={'input_type': 'password'},
         trim_whitespace=False,
     )
+    # 'db' returns the usual database token, 'signed' returns a signed
+    # access and refresh token pair (see core/tokens.py)
+    token_type = serializers.ChoiceField(
+        choices=['db', 'signed'],
+        default='db',
+    )
 
     def validate(self, attrs):
         """Validate and authenticate the user."""
@@ -80,4 +88,16 @@ class AuthTokenSerializer(serializers.Serializer):
             raise serializers.ValidationError(msg, code='authorization')
 
         attrs['user'] = user
-        return attrs
\ No newline at end of file
+        return attrs
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    """Serializer for a signed refresh token."""
+    refresh = serializers.CharField()
+
+    def validate_refresh(self, value):
+        """Verify the refresh token and return its claims."""
+        try:
+            return tokens.decode_token(value, tokens.REFRESH)
+        except tokens.InvalidToken as exc:
+            raise serializers.ValidationError(str(exc), code='authorization')
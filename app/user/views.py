@@ -1,13 +1,20 @@
 """
 View for the user API.
 """
-from rest_framework import generics, authentication, permissions
+from django.contrib.auth import get_user_model
+from rest_framework import generics, permissions, status
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 
+from core import tokens
+from core.authentication import CachedTokenAuthentication
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
+    RefreshTokenSerializer,
 )
 
 # generics.CreateAPIView handles HTTP POST requests designed to create objects (in the database)
@@ -33,6 +40,69 @@ class CreateTokenView(ObtainAuthToken):
     # with this, we get the browsable API for Django, allows nice user interface
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
+    def post(self, request, *args, **kwargs):
+        """Return a database token, or a signed token pair if asked for."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        if serializer.validated_data['token_type'] == 'signed':
+            return Response(tokens.issue_tokens(user))
+
+        token, created = Token.objects.get_or_create(user=user)
+        return Response({'token': token.key})
+
+
+# Signed tokens can't be deleted like database tokens, so the refresh and
+# revoke views record revoked ids that core.tokens checks on every decode
+class RefreshTokenView(APIView):
+    """Exchange a signed refresh token for a new token pair."""
+    serializer_class = RefreshTokenSerializer
+    authentication_classes = []
+    permission_classes = []
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        claims = serializer.validated_data['refresh']
+        # refreshing is the one place the user row is checked, so a
+        # deactivated user is locked out once their access token expires
+        user = get_user_model().objects.filter(
+            pk=claims['uid'], is_active=True,
+        ).first()
+        if user is None:
+            return Response(
+                {'detail': 'User not found or inactive.'},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+        # each refresh token works once. The in-memory list only syncs
+        # every few seconds, so claim the id in the database before
+        # issuing, or another worker could replay the token meanwhile.
+        if not tokens.revocations.revoke(claims['jti'], claims['exp']):
+            return Response(
+                {'detail': 'Token has been revoked.'},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+
+        return Response(tokens.issue_tokens(user, session_id=claims['sid']))
+
+
+class RevokeTokenView(APIView):
+    """Revoke a signed refresh token and every token of its session."""
+    serializer_class = RefreshTokenSerializer
+    authentication_classes = []
+    permission_classes = []
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        claims = serializer.validated_data['refresh']
+        # no token of the session outlives its refresh token
+        tokens.revocations.revoke(claims['sid'], claims['exp'])
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 # generics.RetrieveUpdateAPIView provides functionality for retrieving and updating objects in the database
 # supports HTTP GET, PATCH, and PUT
 class ManageUserView(generics.RetrieveUpdateAPIView):
@@ -44,7 +114,7 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     #                    we use token authentication
     # permission --> we know who the user is, what can the user do in the system?
     #                we want to make sure that the user that uses this API is authenticated
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     # we override the get_object, which gets the object for the HTTP GET (or any other) request
@@ -5,6 +5,13 @@ server {
         alias /vol/static;
     }
 
+    # processed recipe images are named after the hash of their content,
+    # so a name never points at different bytes
+    location /static/media/uploads/recipe/ {
+        alias /vol/static/media/uploads/recipe/;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+
     location / {
         uwsgi_pass            ${APP_HOST}:${APP_PORT};
         include               /etc/nginx/uwsgi_params;
@@ -12,6 +12,9 @@ python manage.py migrate
 # socket 9000 --> TCP socket on port 9000
 # our NGINX server will use the TCP socket on port 9000 to connect to our app
 # app.wsgi --> run app.app.wsgi.py
-uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
+# UWSGI_WORKERS/UWSGI_THREADS are also read by app/settings.py, so
+# `manage.py db_pool_sizing` sizes the connection pool for them
+uwsgi --socket :9000 --workers "${UWSGI_WORKERS:-4}" \
+    --threads "${UWSGI_THREADS:-1}" --master --enable-threads --module app.wsgi
 
 